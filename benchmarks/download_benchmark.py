@@ -0,0 +1,368 @@
+"""
+Download path benchmark.
+
+Serves synthetic submissions from a local aiohttp server and runs the real download code
+against it: TarDownloader (archive tars, with Range requests when document types are
+filtered), Downloader (zstd SGML) and AsyncS3Transfer (SGML copied to an S3-compatible PUT
+endpoint on the same server). The server can add latency and fail a share of requests with
+503s, which exercises adaptive concurrency and retries.
+
+Each stage runs in its own process, so its peak RSS and CPU time are its own and don't
+include the server's.
+
+    python benchmarks/download_benchmark.py --submissions 500 --latency 0.05 --error-rate 0.02
+    python benchmarks/download_benchmark.py --stages tar --document-types 10-K --json results.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+import zstandard as zstd
+from aiohttp import web
+from secsgml2.utils import calculate_documents_locations_in_tar
+
+STAGES = ['tar', 'sgml', 's3']
+FILING_DATE = '2024-01-02'
+DOCUMENT_TYPES = ['10-K', 'EX-10.1', 'EX-21', 'EX-23', 'EX-31.1', 'EX-32', 'EX-99', 'GRAPHIC']
+WORDS = ('revenue income fiscal quarter company operations risk factors market securities '
+         'shares financial statements net loss assets liabilities equity cash flows').split()
+
+
+# Fixtures
+
+def _document(rnd, size):
+    """Roughly size bytes of filing-like HTML, about as compressible as the real thing."""
+    words = []
+    length = 0
+    while length < size:
+        word = rnd.choice(WORDS) if rnd.random() < 0.9 else f"{rnd.randint(0, 10**9):,}"
+        words.append(word)
+        length += len(word) + 1
+    return f"<html><body><p>{' '.join(words)}</p></body></html>".encode()
+
+
+def _sgml(accession, documents):
+    dashed = f"{accession[:10]}-{accession[10:12]}-{accession[12:]}"
+    date = FILING_DATE.replace('-', '')
+    parts = [
+        f"<SEC-DOCUMENT>{dashed}.txt : {date}\n<SEC-HEADER>{dashed}.hdr.sgml : {date}\n"
+        f"<ACCEPTANCE-DATETIME>{date}160530\nACCESSION NUMBER:\t\t{dashed}\n"
+        f"CONFORMED SUBMISSION TYPE:\t10-K\nPUBLIC DOCUMENT COUNT:\t\t{len(documents)}\n"
+        f"FILED AS OF DATE:\t\t{date}\n\nFILER:\n\n\tCOMPANY DATA:\t\n"
+        f"\t\tCOMPANY CONFORMED NAME:\t\t\tBENCHMARK INC\n\t\tCENTRAL INDEX KEY:\t\t\t0000320193\n</SEC-HEADER>\n"
+    ]
+    for sequence, (filename, document_type, content) in enumerate(documents, 1):
+        parts.append(
+            f"<DOCUMENT>\n<TYPE>{document_type}\n<SEQUENCE>{sequence}\n<FILENAME>{filename}\n<TEXT>\n"
+            f"{content.decode()}\n</TEXT>\n</DOCUMENT>\n"
+        )
+    parts.append("</SEC-DOCUMENT>\n")
+    return ''.join(parts).encode()
+
+
+def _archive_tar(accession, documents, cctx):
+    """A submission tar as the archive serves it: metadata.json first, then each document as .zst."""
+    compressed = [(filename, document_type, cctx.compress(content)) for filename, document_type, content in documents]
+    metadata = {
+        'accession-number': accession,
+        'type': '10-K',
+        'filing-date': FILING_DATE.replace('-', ''),
+        'filer': {'company-data': {'cik': '0000320193'}},
+        'documents': [
+            {'type': document_type, 'sequence': str(sequence), 'filename': filename, 'secsgml_size_bytes': len(content)}
+            for sequence, (filename, document_type, content) in enumerate(compressed, 1)
+        ],
+    }
+    metadata = calculate_documents_locations_in_tar(metadata)
+    metadata_bytes = json.dumps(metadata).encode()
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+        members = [('metadata.json', metadata_bytes)] + [(f"{filename}.zst", content) for filename, _, content in compressed]
+        for name, content in members:
+            info = tarfile.TarInfo(f"{accession}/{name}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def build_fixtures(root, submissions, documents, document_size, seed=0):
+    """Write submissions as archive tars (root/tar) and zstd SGML (root/sgml); returns their accessions."""
+    rnd = random.Random(seed)
+    cctx = zstd.ZstdCompressor(level=3)
+    for kind in ('tar', 'sgml'):
+        os.makedirs(os.path.join(root, kind, FILING_DATE), exist_ok=True)
+
+    accessions = []
+    for k in range(submissions):
+        accession = f"0000320193{24:02d}{k:06d}"
+        docs = [
+            (f"doc{i}.htm", DOCUMENT_TYPES[i % len(DOCUMENT_TYPES)], _document(rnd, int(document_size * rnd.uniform(0.2, 1.8))))
+            for i in range(documents)
+        ]
+        with open(os.path.join(root, 'tar', FILING_DATE, f"{accession}.tar"), 'wb') as f:
+            f.write(_archive_tar(accession, docs, cctx))
+        with open(os.path.join(root, 'sgml', FILING_DATE, f"{accession}.sgml.zst"), 'wb') as f:
+            f.write(cctx.compress(_sgml(accession, docs)))
+        accessions.append(accession)
+    return accessions
+
+
+# Server
+
+class BenchmarkServer:
+    """
+    aiohttp server for the fixtures, on its own thread and event loop.
+
+    GET serves files with Range support (zstd files as application/zstd) after latency
+    seconds (jittered +-50%), failing error_rate of requests with a 503. PUT accepts S3
+    uploads and discards them. Counters are per stage, see reset().
+    """
+
+    def __init__(self, root, latency=0.0, error_rate=0.0, seed=0):
+        self.root = root
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.port = None
+        self.reset()
+
+    def reset(self):
+        self.stats = {'requests': 0, 'range_requests': 0, 'injected_errors': 0, 'bytes_served': 0, 'bytes_uploaded': 0}
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(0.5, 1.5))
+
+    async def _get(self, request):
+        self.stats['requests'] += 1
+        await self._delay()
+        if self.random.random() < self.error_rate:
+            self.stats['injected_errors'] += 1
+            return web.Response(status=503)
+
+        path = os.path.normpath(os.path.join(self.root, request.match_info['path']))
+        if not path.startswith(os.path.abspath(self.root)) or not os.path.isfile(path):
+            return web.Response(status=404)
+
+        size = os.path.getsize(path)
+        if request.http_range.start is not None or request.http_range.stop is not None:
+            self.stats['range_requests'] += 1
+            start, stop, _ = request.http_range.indices(size)
+            self.stats['bytes_served'] += max(0, stop - start)
+        else:
+            self.stats['bytes_served'] += size
+        headers = {'Content-Type': 'application/zstd'} if path.endswith('.zst') else {}
+        return web.FileResponse(path, headers=headers)
+
+    async def _put(self, request):
+        self.stats['requests'] += 1
+        await self._delay()
+        body = await request.read()
+        self.stats['bytes_uploaded'] += len(body)
+        return web.Response(status=200, headers={'ETag': '"benchmark"'})
+
+    def start(self):
+        started = threading.Event()
+
+        def serve():
+            loop = asyncio.new_event_loop()
+            app = web.Application(client_max_size=1024**3)
+            app.router.add_get('/{path:.*}', self._get)
+            app.router.add_put('/{path:.*}', self._put)
+            runner = web.AppRunner(app, access_log=None)
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=serve, daemon=True).start()
+        started.wait()
+        return f"http://127.0.0.1:{self.port}/"
+
+
+# Stages, each run in a child process
+
+def _run_tar(base_url, accessions, output_dir, document_types):
+    from datamule.datamule.tar_downloader import TarDownloader
+
+    downloader = TarDownloader(api_key='benchmark')
+    downloader.RETRY_BACKOFF = 0.1
+    specs = [
+        {'url': f"{base_url}tar/{FILING_DATE}/{accession}.tar", 'accession': accession, 'wanted_filenames': None}
+        for accession in accessions
+    ]
+    asyncio.run(downloader.process_batch(specs, output_dir, keep_document_types=document_types))
+
+
+def _run_sgml(base_url, accessions, output_dir, document_types):
+    from datamule.datamule.downloader import Downloader
+
+    downloader = Downloader(api_key='benchmark')
+    downloader.RETRY_BACKOFF = 0.1
+    urls = [f"{base_url}sgml/{FILING_DATE}/{accession}.sgml.zst" for accession in accessions]
+    asyncio.run(downloader.process_batch(urls, output_dir, keep_document_types=document_types))
+
+
+def _run_s3(base_url, accessions, output_dir, document_types):
+    from datamule.book.s3transfer import AsyncS3Transfer
+
+    credentials = {
+        's3_provider': 'aws',
+        'aws_access_key_id': 'benchmark',
+        'aws_secret_access_key': 'benchmark',
+        'region_name': 'us-east-1',
+        'bucket_name': 'benchmark',
+        'endpoint_url': base_url.rstrip('/'),
+    }
+    urls = [f"{base_url}sgml/{FILING_DATE}/{accession}.sgml.zst" for accession in accessions]
+
+    async def transfer():
+        async with AsyncS3Transfer(credentials, max_workers=100) as transfer:
+            failed, _ = await transfer.transfer_batch(urls, retry_errors=3)
+            return failed
+
+    failed = asyncio.run(transfer())
+    with open(os.path.join(output_dir, 'errors.jsonl'), 'w') as f:
+        for entry in failed:
+            f.write(json.dumps(entry) + '\n')
+
+
+STAGE_RUNNERS = {'tar': _run_tar, 'sgml': _run_sgml, 's3': _run_s3}
+
+
+def _child(args):
+    """Run one stage and print its resource usage as JSON on the last line."""
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(args.accessions) as f:
+        accessions = json.load(f)
+
+    start = time.perf_counter()
+    STAGE_RUNNERS[args.child](args.base_url, accessions, args.output_dir, args.document_types)
+    wall = time.perf_counter() - start
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    failed = set()
+    error_path = os.path.join(args.output_dir, 'errors.jsonl')
+    if os.path.exists(error_path):
+        with open(error_path) as f:
+            for line in f:
+                entry = json.loads(line)
+                failed.add(entry.get('filename') or entry.get('url'))
+    print(json.dumps({
+        'wall_seconds': wall,
+        'cpu_seconds': own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        'peak_rss_mb': max(own.ru_maxrss, children.ru_maxrss) / 1024,
+        'failed': len(failed),
+    }))
+
+
+def run_stage(stage, server, base_url, accessions_path, submissions, output_dir, document_types):
+    server.reset()
+    command = [sys.executable, os.path.abspath(__file__), '--child', stage, '--base-url', base_url,
+               '--accessions', accessions_path, '--output-dir', output_dir]
+    if document_types:
+        command += ['--document-types', *document_types]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Stage {stage} exited with {completed.returncode}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    wall = result['wall_seconds']
+    result.update(server.stats)
+    result['stage'] = stage
+    result['submissions'] = submissions - result['failed']
+    result['submissions_per_second'] = result['submissions'] / wall
+    result['mb_per_second'] = server.stats['bytes_served'] / wall / 1e6
+    result['cpu_percent'] = 100 * result['cpu_seconds'] / wall
+    return result
+
+
+def print_table(results):
+    columns = [
+        ('stage', 'stage', '{}'), ('submissions', 'subs', '{}'), ('failed', 'failed', '{}'),
+        ('wall_seconds', 'wall s', '{:.2f}'), ('submissions_per_second', 'subs/s', '{:.1f}'),
+        ('mb_per_second', 'MB/s', '{:.1f}'), ('peak_rss_mb', 'peak RSS MB', '{:.0f}'),
+        ('cpu_seconds', 'CPU s', '{:.2f}'), ('cpu_percent', 'CPU %', '{:.0f}'),
+        ('requests', 'requests', '{}'), ('range_requests', 'ranges', '{}'), ('injected_errors', '503s', '{}'),
+    ]
+    rows = [[fmt.format(result[key]) for key, _, fmt in columns] for result in results]
+    widths = [max(len(header), *(len(row[i]) for row in rows)) for i, (_, header, _) in enumerate(columns)]
+    print('  '.join(header.rjust(width) for (_, header, _), width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"comma separated, from {','.join(STAGES)}")
+    parser.add_argument('--submissions', type=int, default=200)
+    parser.add_argument('--documents', type=int, default=8, help='documents per submission')
+    parser.add_argument('--document-size', type=int, default=50_000, help='average document size in bytes')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failed with a 503')
+    parser.add_argument('--document-types', nargs='*', default=[], help='keep only these types (Range requests for tars)')
+    parser.add_argument('--workdir', help='fixtures and outputs go here (default: a temporary directory)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--seed', type=int, default=0)
+    # used when running a stage in a child process
+    parser.add_argument('--child', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--accessions', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='datamule-benchmark-')
+    try:
+        fixtures = os.path.join(workdir, 'fixtures')
+        print(f"Building {args.submissions} synthetic submissions in {fixtures}")
+        accessions = build_fixtures(fixtures, args.submissions, args.documents, args.document_size, args.seed)
+        accessions_path = os.path.join(workdir, 'accessions.json')
+        with open(accessions_path, 'w') as f:
+            json.dump(accessions, f)
+
+        server = BenchmarkServer(fixtures, latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+        base_url = server.start()
+
+        results = []
+        for stage in stages:
+            output_dir = os.path.join(workdir, f"output_{stage}")
+            shutil.rmtree(output_dir, ignore_errors=True)
+            print(f"Running {stage}")
+            results.append(run_stage(stage, server, base_url, accessions_path, len(accessions), output_dir, args.document_types))
+
+        print()
+        print_table(results)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'parameters': {k: v for k, v in vars(args).items() if v is not None}, 'results': results}, f, indent=2)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
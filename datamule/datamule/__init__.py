@@ -7,7 +7,9 @@ from .sheet.sheet import Sheet
 from .index import Index
 from .utils.format_accession import format_accession
 from .utils.construct_submissions_data import construct_submissions_data
+from .utils.instrumentation import metrics
 from .book.book import Book
+from .sink.sink import ParquetSink, ArrowSink, CSVSink
 
 
 # Keep the notebook environment setup
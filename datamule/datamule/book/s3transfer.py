@@ -44,7 +44,7 @@ def get_filings_sgml_r2_urls(submission_type=None, cik=None, datamule_api_key=No
         accession=accession_number,
     )
     
-    accessions = [format_accession(sub['accession'], 'no-dash') for sub in submissions]
+    accessions = [format_accession(accession, 'no-dash') for accession in submissions.column('accession')]
     
     urls = [f"{datamule_bucket_endpoint}{accession}.sgml" for accession in accessions]
 
@@ -84,7 +84,9 @@ class AsyncS3Transfer:
                 's3',
                 aws_access_key_id=self.s3_credentials['aws_access_key_id'],
                 aws_secret_access_key=self.s3_credentials['aws_secret_access_key'],
-                region_name=self.s3_credentials['region_name']
+                region_name=self.s3_credentials['region_name'],
+                # optional, for S3-compatible stores
+                endpoint_url=self.s3_credentials.get('endpoint_url')
             ).__aenter__()
         else:
             raise ValueError("S3 Provider not supported yet. Please use another provider or email johnfriedman@datamule.xyz to add support.")
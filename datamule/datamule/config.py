@@ -24,6 +24,19 @@ class Config:
         config = self._load_config()
         return config.get("default_source")
 
+    def set_lookup_cache(self, ttl, path=None):
+        """
+        Cache archive and MySQL lookups on disk for ttl seconds (None turns caching off).
+        path defaults to ~/.datamule/lookup_cache.
+        """
+        config = self._load_config()
+        config["lookup_cache"] = {"ttl": ttl, "path": path} if ttl else None
+        self._save_config(config)
+
+    def get_lookup_cache(self):
+        config = self._load_config()
+        return config.get("lookup_cache")
+
     def _load_config(self):
         with open(self.config_path) as f:
             return json.load(f)
\ No newline at end of file
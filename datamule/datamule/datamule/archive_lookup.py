@@ -1,17 +1,25 @@
 import json
 import os
 import time
-import urllib.error
-import urllib.parse
-import urllib.request
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import requests
 
 from ..helper import _process_cik_and_metadata_filters
 from ..providers.providers import MAIN_API_ENDPOINT
+from ..utils.accession_set import AccessionSet
 from ..utils.format_accession import format_accession
+from ..utils.instrumentation import metrics
+from .lookup_cache import get_lookup_cache, normalize_date, refresh_watermark, shift_date
 
 
 API_BASE_URL = f"{MAIN_API_ENDPOINT.rstrip('/')}/v3/sec-filings-lookup"
 DEFAULT_PAGE_SIZE = 25000
+LOOKUP_WORKERS = 8  # pages fetched concurrently once the first page gives the total
+REQUEST_TIMEOUT = 300
 
 _PARAM_MAP = {
     "accession": "accessionNumber",
@@ -176,34 +184,38 @@ def _build_filters(
     return filters
 
 
-def _request_page(endpoint, params, api_key):
-    query = urllib.parse.urlencode(params)
-    url = f"{API_BASE_URL}/{endpoint}"
-    if query:
-        url = f"{url}?{query}"
+def _lookup_session():
+    """HTTP session whose connection pool is shared by the threads prefetching pages."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=LOOKUP_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 
-    request = urllib.request.Request(
-        url,
+@metrics.timed('lookup.request')
+def _request_page(endpoint, params, api_key, session):
+    response = session.get(
+        f"{API_BASE_URL}/{endpoint}",
+        params=params,
         headers={
             "Accept": "application/json",
             "Authorization": f"Bearer {api_key}",
             "User-Agent": "datamule-python",
         },
-        method="GET",
+        timeout=REQUEST_TIMEOUT,
     )
 
-    try:
-        with urllib.request.urlopen(request) as response:
-            payload = json.loads(response.read().decode("utf-8"))
-    except urllib.error.HTTPError as exc:
-        error_body = exc.read().decode("utf-8")
+    if response.status_code >= 400:
+        error_body = response.text
         try:
             error_payload = json.loads(error_body)
             message = error_payload.get("error", error_body)
         except json.JSONDecodeError:
             message = error_body
-        raise Exception(f"API request failed ({exc.code}): {message}") from exc
+        raise Exception(f"API request failed ({response.status_code}): {message}")
 
+    payload = response.json()
     if not payload.get("success"):
         raise Exception(f"API request failed: {payload.get('error')}")
 
@@ -224,98 +236,348 @@ def _rows_returned(page_data):
     return max(len(values) for values in page_data.values())
 
 
-def _columnar_to_rows(page_data):
-    _validate_columnar_results(page_data)
-    rows = []
-    row_count = _rows_returned(page_data)
+class ArchiveRecords(Sequence):
+    """
+    Archive lookup results, kept as the columns the API returns them in ({column: [values]}).
+
+    Reads as a sequence of row dicts, built on access, so callers can iterate and index it
+    like a list of records. Filtering and concatenation work on whole columns.
+    """
 
-    for row_index in range(row_count):
-        row = {}
+    def __init__(self, columns=None):
+        self.columns = columns if columns is not None else {}
+
+    @classmethod
+    def from_page(cls, page_data):
+        _validate_columnar_results(page_data)
+        row_count = _rows_returned(page_data)
+        columns = {}
         for column, values in page_data.items():
-            if row_index < len(values):
-                row[_COLUMN_MAP.get(column, column)] = values[row_index]
-        rows.append(row)
+            # a short column leaves its trailing rows empty
+            columns[_COLUMN_MAP.get(column, column)] = values + [None] * (row_count - len(values))
+        return cls(columns)
 
-    return rows
+    def __len__(self):
+        for values in self.columns.values():
+            return len(values)
+        return 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ArchiveRecords({column: values[index] for column, values in self.columns.items()})
+        return {column: values[index] for column, values in self.columns.items()}
+
+    def __repr__(self):
+        return f"ArchiveRecords({len(self)} rows, columns={list(self.columns)})"
+
+    def column(self, name):
+        return self.columns.get(name, [None] * len(self))
+
+    def select(self, indices):
+        """Records at the given row indices, in that order."""
+        return ArchiveRecords({column: [values[i] for i in indices] for column, values in self.columns.items()})
+
+    def extend(self, other):
+        """Append other's rows, padding columns that only one side has with None."""
+        own_rows, other_rows = len(self), len(other)
+        for column in list(self.columns) + [column for column in other.columns if column not in self.columns]:
+            values = self.columns.setdefault(column, [None] * own_rows)
+            values.extend(other.columns.get(column, [None] * other_rows))
+
+
+def _accession_lookup(accessions):
+    """Int accessions as something supporting `in`; an AccessionSet is used as is."""
+    if accessions is None or isinstance(accessions, AccessionSet):
+        return accessions
+    return {format_accession(item, "int") for item in accessions}
+
+
+def _accession_filter(filtered_accession_numbers=None, skip_accession_numbers=None):
+    """Predicate on int accessions for the filtered/skip lists, or None if neither is given."""
+    keep = _accession_lookup(filtered_accession_numbers)
+    skip = _accession_lookup(skip_accession_numbers)
+    if keep is None and skip is None:
+        return None
+    return lambda accession: (keep is None or accession in keep) and (skip is None or accession not in skip)
+
+
+def _filter_records(records, accession_filter):
+    if accession_filter is None:
+        return records
+    indices = [
+        i for i, accession in enumerate(records.column("accession"))
+        if accession_filter(format_accession(accession, "int"))
+    ]
+    if len(indices) == len(records):
+        return records
+    return records.select(indices)
+
+
+def _total_pages(pagination, page_size):
+    """Number of pages the first page's pagination metadata announces, or None if it doesn't say."""
+    for key in ("totalPages", "total_pages"):
+        if pagination.get(key) is not None:
+            return int(pagination[key])
+    for key in ("totalRecords", "totalRows", "totalCount", "total"):
+        if pagination.get(key) is not None:
+            return -(-int(pagination[key]) // page_size)
+    return None
+
+
+def _iter_payloads(endpoint, params, key, first_page, single_page, page_size):
+    """
+    Yield the payload of every page, in order.
+
+    Once the first page gives the total, later pages are fetched by LOOKUP_WORKERS threads over
+    one pooled session, keeping at most twice that many pages ahead of the consumer. Without a
+    total, or when the last of those pages still has more (results grew while paging), pages
+    are fetched one after another until hasMore is false.
+    """
+    def fetch(page_number):
+        page_params = params.copy()
+        page_params["page"] = page_number
+        return _request_page(endpoint, page_params, key, session)
 
+    with _lookup_session() as session:
+        payload = fetch(first_page)
+        yield payload
+        pagination = payload.get("metadata", {}).get("pagination", {})
+        if single_page or not pagination.get("hasMore", False):
+            return
 
-def _filter_rows(rows, filtered_accession_numbers=None, skip_accession_numbers=None):
-    if filtered_accession_numbers is not None:
-        keep = {format_accession(item, "int") for item in filtered_accession_numbers}
-        rows = [row for row in rows if format_accession(row["accession"], "int") in keep]
+        current_page = first_page
+        total_pages = _total_pages(pagination, page_size)
+        if total_pages is not None:
+            pages = iter(range(first_page + 1, total_pages + 1))
+            with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS) as executor:
+                pending = deque(executor.submit(fetch, page_number) for page_number in islice(pages, LOOKUP_WORKERS * 2))
+                while pending:
+                    payload = pending.popleft().result()
+                    current_page += 1
+                    yield payload
+                    pagination = payload.get("metadata", {}).get("pagination", {})
+                    if not pagination.get("hasMore", False):
+                        # results shrank since the first page
+                        for future in pending:
+                            future.cancel()
+                        return
+                    for page_number in islice(pages, 1):
+                        pending.append(executor.submit(fetch, page_number))
+
+        while pagination.get("hasMore", False):
+            current_page += 1
+            payload = fetch(current_page)
+            yield payload
+            pagination = payload.get("metadata", {}).get("pagination", {})
+
+
+def _fetched_records(endpoint, params, key, page, page_size, summary):
+    """Unfiltered ArchiveRecords for each page fetched from the API, adding billing to summary."""
+    for payload in _iter_payloads(endpoint, params, key, page or 1, page is not None, page_size):
+        billing = payload.get("metadata", {}).get("billing", {})
+        summary["pages"] += 1
+        summary["total_charge"] += billing.get("total_charge", 0) or 0
+        summary["remaining_balance"] = billing.get("remaining_balance", summary["remaining_balance"])
+        yield ArchiveRecords.from_page(payload.get("data", {}))
+
+
+def _records_by_date(records, keep):
+    """Records whose filing date (YYYYMMDD) passes keep; rows without one are dropped."""
+    indices = [
+        i for i, filing_date in enumerate(records.column("filing_date"))
+        if filing_date is not None and keep(normalize_date(filing_date))
+    ]
+    return records if len(indices) == len(records) else records.select(indices)
+
+
+def _iso_date(value):
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+
+
+def _covered_dates(cache, entry, start, end):
+    """
+    The (start, end) dates of entry that a request for [start, end] can reuse, or None.
+
+    Once the entry is stale, dates from its watermark on no longer count. Entries the request
+    neither overlaps nor touches are not reused, so an entry always covers a single range.
+    """
+    if entry is None or entry.get("start") is None:
+        return None
+    covered_start, covered_end = entry["start"], entry["end"]
+    if not cache.is_fresh(entry):
+        covered_end = min(covered_end, shift_date(entry["watermark"], -1))
+    if covered_start > covered_end or start > shift_date(covered_end, 1) or end < shift_date(covered_start, -1):
+        return None
+    return covered_start, covered_end
+
+
+def _cached_records(cache, endpoint, params, key, page_size, summary):
+    """
+    Unfiltered ArchiveRecords for params, going through cache.
+
+    Filing date range lookups are keyed without the range, and each entry records the dates it
+    covers, so a window that slides or widens only fetches the dates before and after them.
+    Once an entry is stale, dates from its watermark on are fetched again. If the endpoint
+    returns rows without a filing date, the entry is only reused for the exact same range.
+    Anything else is served from a fresh entry or fetched in full.
+    """
+    if "filingDate_START" not in params or "filingDate_END" not in params:
+        yield from _cached_exact_records(cache, endpoint, params, key, page_size, summary)
+        return
 
-    if skip_accession_numbers is not None:
-        skip = {format_accession(item, "int") for item in skip_accession_numbers}
-        rows = [row for row in rows if format_accession(row["accession"], "int") not in skip]
+    start, end = normalize_date(params["filingDate_START"]), normalize_date(params["filingDate_END"])
+    cache_key = cache.key(endpoint, params, exclude=("pageSize", "filingDate_START", "filingDate_END"))
+    entry = cache.load(cache_key)
 
-    return rows
+    if entry is not None and not entry.get("dated", True):
+        if cache.is_fresh(entry) and (entry["start"], entry["end"]) == (start, end):
+            records = ArchiveRecords(entry["columns"])
+            summary["cached_rows"] += len(records)
+            yield records
+            return
+        entry = None
+
+    covered = _covered_dates(cache, entry, start, end)
+    # date ranges to fetch, with None standing for the cached rows, in date order
+    if covered is None:
+        plan = [(start, end)]
+    else:
+        plan = [None]
+        if start < covered[0]:
+            plan.insert(0, (start, shift_date(covered[0], -1)))
+        if end > covered[1]:
+            plan.append((shift_date(covered[1], 1), end))
+
+    records = ArchiveRecords()
+    for date_range in plan:
+        if date_range is None:
+            cached = _records_by_date(ArchiveRecords(entry["columns"]), lambda filing_date: covered[0] <= filing_date <= covered[1])
+            served = _records_by_date(cached, lambda filing_date: start <= filing_date <= end)
+            summary["cached_rows"] += len(served)
+            records.extend(cached)
+            yield served
+            continue
 
+        fetch_params = dict(params, filingDate_START=_iso_date(date_range[0]), filingDate_END=_iso_date(date_range[1]))
+        for page_records in _fetched_records(endpoint, fetch_params, key, None, page_size, summary):
+            records.extend(page_records)
+            yield page_records
 
-def _lookup_archive(
+    if plan == [None]:
+        return
+
+    new_start, new_end = (start, end) if covered is None else (min(start, covered[0]), max(end, covered[1]))
+    cache.store(cache_key, {
+        "endpoint": endpoint,
+        "start": new_start,
+        "end": new_end,
+        "watermark": normalize_date(refresh_watermark(new_end)),
+        "dated": None not in records.column("filing_date"),
+        "columns": records.columns,
+    })
+
+
+def _cached_exact_records(cache, endpoint, params, key, page_size, summary):
+    """Unfiltered ArchiveRecords for params from a fresh cache entry, or fetched in full and cached."""
+    cache_key = cache.key(endpoint, params, exclude=("pageSize",))
+    entry = cache.load(cache_key)
+    if entry is not None and cache.is_fresh(entry):
+        records = ArchiveRecords(entry["columns"])
+        summary["cached_rows"] += len(records)
+        yield records
+        return
+
+    records = ArchiveRecords()
+    for page_records in _fetched_records(endpoint, params, key, None, page_size, summary):
+        records.extend(page_records)
+        yield page_records
+    cache.store(cache_key, {"endpoint": endpoint, "columns": records.columns})
+
+
+def _iter_lookup_archive(
     endpoint,
     api_key=None,
     page=None,
     page_size=DEFAULT_PAGE_SIZE,
     quiet=False,
-    include_metadata=False,
+    summary=None,
     filtered_accession_numbers=None,
     skip_accession_numbers=None,
     **filters,
 ):
+    """
+    Yield ArchiveRecords page by page, filtered, updating summary as pages arrive.
+    Whole-result lookups go through the lookup cache when one is configured (see Config.set_lookup_cache).
+    """
     key = _get_api_key(api_key)
     params = _build_params(filters)
     params["pageSize"] = page_size
+    accession_filter = _accession_filter(filtered_accession_numbers, skip_accession_numbers)
 
-    current_page = page or 1
-    single_page = page is not None
-    rows = []
-    summary = {
+    if summary is None:
+        summary = {}
+    summary.update({
         "pages": 0,
         "rows": 0,
+        "cached_rows": 0,
         "total_charge": 0,
         "remaining_balance": None,
-    }
+    })
     start_time = time.time()
 
-    while True:
-        page_params = params.copy()
-        page_params["page"] = current_page
-
-        payload = _request_page(endpoint, page_params, key)
-        page_data = payload.get("data", {})
-        page_rows = _columnar_to_rows(page_data)
-        rows.extend(page_rows)
+    cache = get_lookup_cache() if page is None else None
+    if cache is not None:
+        pages = _cached_records(cache, endpoint, params, key, page_size, summary)
+    else:
+        pages = _fetched_records(endpoint, params, key, page, page_size, summary)
 
-        metadata = payload.get("metadata", {})
-        billing = metadata.get("billing", {})
-        pagination = metadata.get("pagination", {})
-        page_charge = billing.get("total_charge", 0) or 0
+    for records in pages:
+        records = _filter_records(records, accession_filter)
+        summary["rows"] += len(records)
+        yield records
 
-        summary["pages"] += 1
-        summary["rows"] += len(page_rows)
-        summary["total_charge"] += page_charge
-        summary["remaining_balance"] = billing.get("remaining_balance", summary["remaining_balance"])
-
-        if single_page or not pagination.get("hasMore", False):
-            break
-        current_page += 1
-
-    rows = _filter_rows(
-        rows,
-        filtered_accession_numbers=filtered_accession_numbers,
-        skip_accession_numbers=skip_accession_numbers,
-    )
-    summary["rows"] = len(rows)
     summary["elapsed_seconds"] = time.time() - start_time
+    metrics.record_time('lookup.total', summary["elapsed_seconds"])
+    metrics.count('lookup.rows', summary["rows"])
+    metrics.count('lookup.cached_rows', summary["cached_rows"])
 
     if not quiet:
         remaining = summary["remaining_balance"]
         remaining_text = "unknown" if remaining is None else f"${remaining:.2f}"
         print("\nArchive lookup complete:")
         print(f"- Retrieved {summary['rows']} records across {summary['pages']} pages")
+        if summary["cached_rows"]:
+            print(f"- Served {summary['cached_rows']} records from the lookup cache")
         print(f"- Total cost: ${summary['total_charge']:.4f}")
         print(f"- Remaining balance: {remaining_text}")
 
+
+def _lookup_archive(
+    endpoint,
+    api_key=None,
+    page=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    quiet=False,
+    include_metadata=False,
+    filtered_accession_numbers=None,
+    skip_accession_numbers=None,
+    **filters,
+):
+    summary = {}
+    rows = ArchiveRecords()
+    for records in _iter_lookup_archive(
+        endpoint,
+        api_key=api_key,
+        page=page,
+        page_size=page_size,
+        quiet=quiet,
+        summary=summary,
+        filtered_accession_numbers=filtered_accession_numbers,
+        skip_accession_numbers=skip_accession_numbers,
+        **filters,
+    ):
+        rows.extend(records)
+
     if include_metadata:
         return rows, summary
     return rows
@@ -415,3 +677,101 @@ def lookup_archive_tar(
         skip_accession_numbers=skip_accession_numbers,
         **filters,
     )
+
+
+def iter_archive_sgml(
+    cik=None,
+    ticker=None,
+    accession=None,
+    submission_type=None,
+    filing_date=None,
+    report_date=None,
+    detected_time=None,
+    contains_xbrl=None,
+    document_type=None,
+    filename=None,
+    sequence=None,
+    api_key=None,
+    page=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    quiet=False,
+    summary=None,
+    filtered_accession_numbers=None,
+    skip_accession_numbers=None,
+    **metadata_filters,
+):
+    """Like lookup_archive_sgml, but yields ArchiveRecords page by page as they arrive. summary, if a dict, is filled in as pages are read."""
+    filters = _build_filters(
+        cik=cik,
+        ticker=ticker,
+        accession=accession,
+        submission_type=submission_type,
+        filing_date=filing_date,
+        report_date=report_date,
+        detected_time=detected_time,
+        contains_xbrl=contains_xbrl,
+        document_type=document_type,
+        filename=filename,
+        sequence=sequence,
+        **metadata_filters,
+    )
+    return _iter_lookup_archive(
+        "sgml-lookup",
+        api_key=api_key,
+        page=page,
+        page_size=page_size,
+        quiet=quiet,
+        summary=summary,
+        filtered_accession_numbers=filtered_accession_numbers,
+        skip_accession_numbers=skip_accession_numbers,
+        **filters,
+    )
+
+
+def iter_archive_tar(
+    cik=None,
+    ticker=None,
+    accession=None,
+    submission_type=None,
+    filing_date=None,
+    report_date=None,
+    detected_time=None,
+    contains_xbrl=None,
+    document_type=None,
+    filename=None,
+    sequence=None,
+    api_key=None,
+    page=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    quiet=False,
+    summary=None,
+    filtered_accession_numbers=None,
+    skip_accession_numbers=None,
+    **metadata_filters,
+):
+    """Like lookup_archive_tar, but yields ArchiveRecords page by page as they arrive. summary, if a dict, is filled in as pages are read."""
+    filters = _build_filters(
+        cik=cik,
+        ticker=ticker,
+        accession=accession,
+        submission_type=submission_type,
+        filing_date=filing_date,
+        report_date=report_date,
+        detected_time=detected_time,
+        contains_xbrl=contains_xbrl,
+        document_type=document_type,
+        filename=filename,
+        sequence=sequence,
+        **metadata_filters,
+    )
+    return _iter_lookup_archive(
+        "tar-lookup",
+        api_key=api_key,
+        page=page,
+        page_size=page_size,
+        quiet=quiet,
+        summary=summary,
+        filtered_accession_numbers=filtered_accession_numbers,
+        skip_accession_numbers=skip_accession_numbers,
+        **filters,
+    )
@@ -53,4 +53,4 @@ def datamule_lookup(cik=None, ticker=None, submission_type=None, filing_date=Non
         skip_accession_numbers=skip_accession_numbers,
         **kwargs
     )
-    return [format_accession(row["accession"], "int") for row in rows]
+    return [format_accession(accession, "int") for accession in rows.column("accession")]
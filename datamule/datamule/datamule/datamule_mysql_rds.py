@@ -6,6 +6,7 @@ import ssl
 import time
 from tqdm import tqdm
 from ..providers.providers import MAIN_API_ENDPOINT
+from .lookup_cache import get_lookup_cache
 class DatamuleMySQL:
     def __init__(self, api_key=None):
         self.API_BASE_URL = MAIN_API_ENDPOINT
@@ -84,6 +85,17 @@ class DatamuleMySQL:
                 params[key] = value
 
         self.start_time = time.time()
+
+        # whole-result queries go through the lookup cache when one is configured (see Config.set_lookup_cache)
+        cache = get_lookup_cache() if not explicit_page else None
+        if cache is not None:
+            cache_key = cache.key(database, params)
+            entry = cache.load(cache_key)
+            if entry is not None and cache.is_fresh(entry):
+                if not quiet:
+                    print(f"\nQuery served from the lookup cache: {len(entry['rows'])} records")
+                return entry['rows']
+
         total_items = 0
         pages_processed = 0
 
@@ -136,6 +148,9 @@ class DatamuleMySQL:
                 print(f"- Total cost: ${self.total_cost:.4f}")
                 print(f"- Remaining balance: ${self.remaining_balance:.2f}")
                 print(f"- Time: {elapsed_time:.1f} seconds")
+
+            if cache is not None:
+                cache.store(cache_key, {'database': database, 'rows': results})
             
             return results
 
@@ -3,9 +3,7 @@ import asyncio
 import aiohttp
 from tqdm import tqdm
 import time
-import shutil
 import ssl
-import zstandard as zstd
 import io
 import json
 import tarfile
@@ -17,6 +15,11 @@ from threading import Thread, Lock
 from os import cpu_count
 from secsgml2 import parse_sgml_content_into_memory
 from ..utils.format_accession import format_accession
+from ..utils.sharding import ShardBalancer, batch_shard_sizes
+from ..utils.compression import decompress_zstd
+from ..utils.adaptive_concurrency import AdaptiveConcurrency, DownloadStatusError, read_chunks, is_retryable, retry_delay
+from ..utils.error_journal import ErrorJournal
+from ..utils.instrumentation import metrics
 from ..providers.providers import SEC_FILINGS_ARCHIVE_SGML_ENDPOINT
 from .archive_lookup import lookup_archive_sgml
 
@@ -33,8 +36,16 @@ class Downloader:
     def __init__(self, api_key=None):
         self.BASE_URL = SEC_FILINGS_ARCHIVE_SGML_ENDPOINT
         self.CHUNK_SIZE = 2 * 1024 * 1024
-        self.MAX_CONCURRENT_DOWNLOADS = 10
+        # in-flight downloads start at INITIAL and adapt between MIN and MAX (see AdaptiveConcurrency)
+        self.INITIAL_CONCURRENT_DOWNLOADS = 10
+        self.MIN_CONCURRENT_DOWNLOADS = 2
+        self.MAX_CONCURRENT_DOWNLOADS = 200
         self.MAX_DECOMPRESSION_WORKERS = cpu_count()
+        self.MAX_RETRIES = 3
+        self.RETRY_BACKOFF = 1.0  # seconds before the first retry, doubling (with jitter) up to MAX_RETRY_BACKOFF
+        self.MAX_RETRY_BACKOFF = 30.0
+        self.error_log_lock = Lock()
+        self.error_journals = {}
         self.MAX_TAR_WORKERS = cpu_count()
         if api_key is not None:
             self._api_key = api_key
@@ -61,21 +72,12 @@ class Downloader:
             raise ValueError("API key cannot be empty")
         self._api_key = value
 
-    def _log_error(self, output_dir, filename, error_msg):
-        error_file = os.path.join(output_dir, 'errors.json')
-        try:
-            if os.path.exists(error_file):
-                with open(error_file, 'r') as f:
-                    errors = json.load(f)
-            else:
-                errors = {}
-            
-            errors[filename] = str(error_msg)
-            
-            with open(error_file, 'w') as f:
-                json.dump(errors, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to log error to {error_file}: {str(e)}")
+    def _log_error(self, output_dir, filename, error_msg, **fields):
+        with self.error_log_lock:
+            journal = self.error_journals.get(output_dir)
+            if journal is None:
+                journal = self.error_journals[output_dir] = ErrorJournal(output_dir)
+        journal.record(filename, error_msg, **fields)
 
     class TarManager:
         def __init__(self, output_dir, num_tar_files, max_batch_size=1024*1024*1024):
@@ -87,32 +89,44 @@ class Downloader:
             self.file_counters = {}
             self.tar_sizes = {}
             self.tar_sequences = {}
+            self.balancer = ShardBalancer(num_tar_files, loads=batch_shard_sizes(output_dir, num_tar_files))
             
             for i in range(num_tar_files):
-                tar_path = os.path.join(output_dir, f'batch_{i:03d}_001.tar')
-                self.tar_files[i] = tarfile.open(tar_path, 'a')
+                sequence, size = self._last_batch(i)
+                self.tar_files[i] = tarfile.open(self._batch_path(i, sequence), 'a')
                 self.tar_locks[i] = Lock()
                 self.file_counters[i] = 0
-                self.tar_sizes[i] = 0
-                self.tar_sequences[i] = 1
+                self.tar_sizes[i] = size
+                self.tar_sequences[i] = sequence
+
+        def _batch_path(self, tar_index, sequence):
+            return os.path.join(self.output_dir, f'batch_{tar_index:03d}_{sequence:03d}.tar')
+
+        def _last_batch(self, tar_index):
+            """Continue a shard's highest existing sequence, so repeated downloads fill it instead of leaving small tails."""
+            sequence = 1
+            while os.path.exists(self._batch_path(tar_index, sequence + 1)):
+                sequence += 1
+            path = self._batch_path(tar_index, sequence)
+            return sequence, os.path.getsize(path) if os.path.exists(path) else 0
         
-        def get_tar_index(self, filename):
-            return hash(filename) % self.num_tar_files
+        def get_tar_index(self, accession_num, size=0):
+            return self.balancer.assign(accession_num, size)
         
+        @metrics.timed('sgml.write_submission')
         def write_submission(self, filename, metadata, documents):
-            tar_index = self.get_tar_index(filename)
             accession_num = filename.split('.')[0]
             metadata_json = json.dumps(metadata).encode('utf-8')
             submission_size = len(metadata_json) + sum(len(doc) for doc in documents)
+            tar_index = self.get_tar_index(accession_num, submission_size)
             
-            with self.tar_locks[tar_index]:
+            with metrics.locked(self.tar_locks[tar_index], 'sgml.lock_wait'):
                 if self.tar_sizes[tar_index] > 0 and self.tar_sizes[tar_index] + submission_size > self.max_batch_size:
                     tar = self.tar_files[tar_index]
                     tar.close()
 
                     self.tar_sequences[tar_index] += 1
-                    new_tar_path = os.path.join(self.output_dir, f'batch_{tar_index:03d}_{self.tar_sequences[tar_index]:03d}.tar')
-                    self.tar_files[tar_index] = tarfile.open(new_tar_path, 'a')
+                    self.tar_files[tar_index] = tarfile.open(self._batch_path(tar_index, self.tar_sequences[tar_index]), 'a')
                     self.file_counters[tar_index] = 0
                     self.tar_sizes[tar_index] = 0
                 
@@ -153,103 +167,105 @@ class Downloader:
                 except Exception as e:
                     logger.error(f"Error closing tar {i}: {str(e)}")
 
-    def decompress_and_parse_and_write(self, compressed_chunks, filename, keep_document_types, tar_manager, output_dir):
-        dctx = zstd.ZstdDecompressor()
+    # errors are raised rather than journaled here: download_and_process records one entry per failed submission
+
+    def decompress_and_parse_and_write(self, compressed_chunks, filename, keep_document_types, tar_manager):
         try:
-            input_buffer = io.BytesIO(b''.join(compressed_chunks))
-            decompressed_content = io.BytesIO()
-            
-            with dctx.stream_reader(input_buffer) as reader:
-                shutil.copyfileobj(reader, decompressed_content)
-                
-            content = decompressed_content.getvalue()
+            content = decompress_zstd(b''.join(compressed_chunks))
             
-            metadata, documents = parse_sgml_content_into_memory(
-                data=content,
-                filter_document_types=keep_document_types
-            )
-            
-            success = tar_manager.write_submission(filename, metadata, documents)
-            return success
-                
+            with metrics.timer('sgml.parse'):
+                metadata, documents = parse_sgml_content_into_memory(
+                    data=content,
+                    filter_document_types=keep_document_types
+                )
         except Exception as e:
-            self._log_error(output_dir, filename, f"Decompression/parsing error: {str(e)}")
-            return False
-        finally:
-            try:
-                input_buffer.close()
-                decompressed_content.close()
-            except:
-                pass
+            raise ValueError(f"Decompression/parsing error: {str(e)}") from e
+            
+        if not tar_manager.write_submission(filename, metadata, documents):
+            raise ValueError("Failed to write to output tar")
 
-    def parse_and_write_regular_file(self, chunks, filename, keep_document_types, tar_manager, output_dir):
+    def parse_and_write_regular_file(self, chunks, filename, keep_document_types, tar_manager):
         try:
             content = b''.join(chunks)
             
-            metadata, documents = parse_sgml_content_into_memory(
-                data=content,
-                filter_document_types=keep_document_types
+            with metrics.timer('sgml.parse'):
+                metadata, documents = parse_sgml_content_into_memory(
+                    data=content,
+                    filter_document_types=keep_document_types
+                )
+        except Exception as e:
+            raise ValueError(f"Parsing error: {str(e)}") from e
+            
+        if not tar_manager.write_submission(filename, metadata, documents):
+            raise ValueError("Failed to write to output tar")
+
+    async def download_and_process(self, session, url, limiter, decompression_pool, keep_document_types, tar_manager, output_dir, pbar):
+        filename = url.split('/')[-1]
+
+        api_key = self.api_key
+        if not api_key:
+            raise ValueError("No API key found. Please set DATAMULE_API_KEY environment variable or provide api_key in constructor")
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            # the slot is released while backing off, so waiting retries don't hold up other downloads
+            async with limiter.slot() as slot:
+                try:
+                    await self._download_submission(session, url, slot, decompression_pool, keep_document_types, tar_manager)
+                    error = None
+                except Exception as e:
+                    slot.failed(e)
+                    error = e
+            if error is None or attempt == self.MAX_RETRIES or not is_retryable(error):
+                break
+            await asyncio.sleep(retry_delay(attempt, self.RETRY_BACKOFF, self.MAX_RETRY_BACKOFF))
+
+        if error is not None:
+            self._log_error(
+                output_dir, filename, str(error) or type(error).__name__,
+                source='datamule-sgml', url=url, accession=filename.split('.')[0], attempts=attempt + 1,
+                keep_document_types=list(keep_document_types or [])
             )
+        metrics.count('sgml.failed' if error is not None else 'sgml.submissions')
+        metrics.count('sgml.retries', attempt)
+
+        pbar.set_postfix(limiter.status(), refresh=False)
+        pbar.update(1)
+
+    async def _download_submission(self, session, url, slot, decompression_pool, keep_document_types, tar_manager):
+        filename = url.split('/')[-1]
+        chunks = []
+        headers = {
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'gzip, deflate, br',
+            #'Authorization': f'Bearer {api_key}'
+        }
+        
+        async with session.get(url, headers=headers) as response:
+            slot.response(response.status)
+            content_type = response.headers.get('Content-Type', '')
             
-            success = tar_manager.write_submission(filename, metadata, documents)
-            return success
-                
-        except Exception as e:
-            self._log_error(output_dir, filename, f"Parsing error: {str(e)}")
-            return False
-
-    async def download_and_process(self, session, url, semaphore, decompression_pool, keep_document_types, tar_manager, output_dir, pbar):
-        async with semaphore:
-            chunks = []
-            filename = url.split('/')[-1]
-
-            api_key = self.api_key
-            if not api_key:
-                raise ValueError("No API key found. Please set DATAMULE_API_KEY environment variable or provide api_key in constructor")
-
-            try:
-                headers = {
-                    'Connection': 'keep-alive',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    #'Authorization': f'Bearer {api_key}'
-                }
-                
-                async with session.get(url, headers=headers) as response:
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    if response.status == 200:
-                        async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
-                            chunks.append(chunk)
-
-                        loop = asyncio.get_running_loop()
-                        is_zstd = filename.endswith('.zst') or 'zstd' in content_type
-                        if is_zstd:
-                            logger.debug(f"Processing {filename} as compressed (zstd)")
-                            success = await loop.run_in_executor(
-                                decompression_pool,
-                                partial(self.decompress_and_parse_and_write, chunks, filename, keep_document_types, tar_manager, output_dir)
-                            )
-                        else:
-                            logger.debug(f"Processing {filename} as uncompressed")
-                            success = await loop.run_in_executor(
-                                decompression_pool,
-                                partial(self.parse_and_write_regular_file, chunks, filename, keep_document_types, tar_manager, output_dir)
-                            )
-
-                        if not success:
-                            self._log_error(output_dir, filename, "Failed to process file")
-                            
-                    elif response.status == 401:
-                        self._log_error(output_dir, filename, "Authentication failed: Invalid API key")
-                        raise ValueError("Invalid API key")
-                    else:
-                        self._log_error(output_dir, filename, f"Download failed: Status {response.status}")
-                        
-                    pbar.update(1)
-                        
-            except Exception as e:
-                self._log_error(output_dir, filename, str(e))
-                pbar.update(1)
+            if response.status == 401:
+                raise ValueError("Authentication failed: Invalid API key")
+            if response.status != 200:
+                raise DownloadStatusError(response.status)
+
+            async for chunk in read_chunks(response, self.CHUNK_SIZE, slot):
+                chunks.append(chunk)
+
+        loop = asyncio.get_running_loop()
+        is_zstd = filename.endswith('.zst') or 'zstd' in content_type
+        if is_zstd:
+            logger.debug(f"Processing {filename} as compressed (zstd)")
+            await loop.run_in_executor(
+                decompression_pool,
+                partial(self.decompress_and_parse_and_write, chunks, filename, keep_document_types, tar_manager)
+            )
+        else:
+            logger.debug(f"Processing {filename} as uncompressed")
+            await loop.run_in_executor(
+                decompression_pool,
+                partial(self.parse_and_write_regular_file, chunks, filename, keep_document_types, tar_manager)
+            )
 
     async def process_batch(self, urls, output_dir, keep_document_types=[], max_batch_size=1024*1024*1024):
         os.makedirs(output_dir, exist_ok=True)
@@ -260,7 +276,11 @@ class Downloader:
         
         try:
             with tqdm(total=len(urls), desc="Downloading files") as pbar:
-                semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_DOWNLOADS)
+                limiter = AdaptiveConcurrency(
+                    self.INITIAL_CONCURRENT_DOWNLOADS,
+                    minimum=self.MIN_CONCURRENT_DOWNLOADS,
+                    maximum=self.MAX_CONCURRENT_DOWNLOADS
+                )
                 decompression_pool = ThreadPoolExecutor(max_workers=self.MAX_DECOMPRESSION_WORKERS)
 
                 connector = aiohttp.TCPConnector(
@@ -271,10 +291,12 @@ class Downloader:
                     keepalive_timeout=60
                 )
 
-                async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=600)) as session:
+                # transfers get a deadline scaled to their size (see read_chunks); this only catches stalls
+                timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+                async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
                     tasks = [
                         self.download_and_process(
-                            session, url, semaphore, decompression_pool, 
+                            session, url, limiter, decompression_pool, 
                             keep_document_types, 
                             tar_manager, output_dir, pbar
                         ) 
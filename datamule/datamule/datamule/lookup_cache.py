@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import time
+from datetime import date, timedelta
+
+import zstandard as zstd
+
+from ..config import Config
+
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.datamule/lookup_cache")
+# days before the fetch date that are refetched on refresh, for filings the archive picks up late
+REFRESH_OVERLAP_DAYS = 3
+
+
+def normalize_date(value):
+    """YYYYMMDD for a date given as YYYY-MM-DD, YYYYMMDD or a date."""
+    return str(value).replace("-", "")[:8]
+
+
+def shift_date(value, days):
+    """YYYYMMDD for the date days after value (a YYYYMMDD string)."""
+    shifted = date(int(value[:4]), int(value[4:6]), int(value[6:8])) + timedelta(days=days)
+    return shifted.strftime("%Y%m%d")
+
+
+def refresh_watermark(end=None):
+    """
+    Earliest date a cached date-range result may still be missing filings for: a few days
+    before today, or the range's end if that is earlier.
+    """
+    watermark = (date.today() - timedelta(days=REFRESH_OVERLAP_DAYS)).isoformat()
+    if end is not None and normalize_date(end) < normalize_date(watermark):
+        return f"{normalize_date(end)[:4]}-{normalize_date(end)[4:6]}-{normalize_date(end)[6:]}"
+    return watermark
+
+
+class LookupCache:
+    """
+    On-disk cache of lookup results, keyed by endpoint and request params.
+
+    Each entry is one zstd-compressed JSON file, holding archive lookups as columns. Entries
+    older than ttl seconds are stale. Date-range entries are keyed without the range and record
+    the dates they cover; callers fetch only the dates outside that, plus, once the entry is
+    stale, the dates from its watermark on, since earlier days don't change.
+    """
+
+    def __init__(self, ttl, path=None):
+        self.ttl = ttl
+        self.path = path or DEFAULT_CACHE_DIR
+
+    def key(self, endpoint, params, exclude=()):
+        normalized = {name: str(value) for name, value in params.items() if name not in exclude}
+        payload = json.dumps([endpoint, normalized], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.json.zst")
+
+    def load(self, key):
+        """The entry stored under key, or None. A corrupt entry counts as missing."""
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                return json.loads(zstd.ZstdDecompressor().decompress(f.read()))
+        except (OSError, ValueError, zstd.ZstdError):
+            return None
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def store(self, key, entry):
+        entry = dict(entry, fetched_at=time.time())
+        os.makedirs(self.path, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zstd.ZstdCompressor(level=6).compress(json.dumps(entry).encode("utf-8")))
+        os.replace(tmp_path, path)
+
+    def clear(self, expired_only=False):
+        """Delete cached entries, or only those past their ttl."""
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if expired_only and time.time() - os.path.getmtime(path) < self.ttl:
+                continue
+            os.remove(path)
+
+
+def get_lookup_cache():
+    """The LookupCache configured with Config().set_lookup_cache, or None if caching is off."""
+    settings = Config().get_lookup_cache()
+    if not settings or not settings.get("ttl"):
+        return None
+    return LookupCache(settings["ttl"], settings.get("path"))
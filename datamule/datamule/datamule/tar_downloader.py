@@ -9,16 +9,25 @@ import io
 import json
 import tarfile
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Sequence
+import concurrent.futures
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
-from threading import Lock
+from threading import Lock, Thread
+import queue
 from os import cpu_count
 from secsgml2.utils import calculate_documents_locations_in_tar
 from ..utils.format_accession import format_accession
 from ..providers.providers import SEC_FILINGS_ARCHIVE_TAR_ENDPOINT
-from .archive_lookup import lookup_archive_sgml, lookup_archive_tar
-import shutil
+from .archive_lookup import lookup_archive_sgml, lookup_archive_tar, iter_archive_sgml
+from ..portfolio.portfolio_index import PortfolioIndex, _tar_stat
+from ..utils.sharding import ShardBalancer, batch_shard_sizes
+from ..utils.compression import decompress_zstd
+from ..utils.adaptive_concurrency import AdaptiveConcurrency, DownloadStatusError, read_chunks, is_retryable, retry_delay
+from ..utils.error_journal import ErrorJournal
+from ..utils.instrumentation import metrics
+import tempfile
 
 # Set up logging
 logging.basicConfig(
@@ -29,6 +38,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def _spec_batches(specs):
+    """Yield specs (a list) once, or each list from an iterator, pulling the next one in a thread so paging doesn't block downloads."""
+    if isinstance(specs, list):
+        yield specs
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = await loop.run_in_executor(None, next, specs, None)
+        if batch is None:
+            return
+        yield batch
+
+
 def _has_filter_value(value):
     if value is None:
         return False
@@ -50,18 +72,262 @@ def _archive_bin_member_alias(member_name):
     return f"{sequence}.txt"
 
 
+def _tar_data_end(tar_path):
+    """Offset just past the last member of an existing tar, where tarfile's 'a' mode appends."""
+    with tarfile.open(tar_path, 'r') as tar:
+        tar.getmembers()
+        return tar.offset
+
+
+def _document_size(doc):
+    return doc['size'] if 'size' in doc else len(doc['content'])
+
+
+def _document_name_from_metadata(doc):
+    filename = doc.get('filename')
+    if filename:
+        return filename
+    return f"{doc.get('sequence', 'document')}.txt"
+
+
+class _StreamingSubmissionExtractor:
+    """
+    Incremental parser for a submission tar, fed chunk by chunk as it downloads.
+
+    Tar headers are parsed as they arrive. metadata.json (always the first member) decides
+    which documents are wanted; those are decompressed with a zstd stream writer (or copied
+    as is when decompress is False) one after another into a single spooled temporary file, and
+    the rest are skipped. Memory per download is bounded by the chunk size plus spool_size, with
+    larger submissions spilling to disk until they are copied into the batch tar.
+    """
+
+    def __init__(self, keep_document_types, wanted_filenames, spool_size, decompress=True):
+        self.keep_types = set(keep_document_types or [])
+        self.decompress = decompress
+        self.wanted_filenames = set(wanted_filenames) if wanted_filenames else None
+        self.spool_size = spool_size
+        self.metadata_dict = None
+        self.documents = {}
+        self._buffer = bytearray()
+        self._remaining = 0
+        self._padding = 0
+        self._member = None
+        self._long_name = None
+        self._metadata = None
+        self._spool = None
+        self._writer = None
+        self._document_start = None
+        self._wanted_names = None
+        self._raw = None
+
+    @metrics.timed('tar.extract')
+    def feed(self, data):
+        if self._raw is not None:
+            self._raw.extend(data)
+            return
+
+        view = memoryview(data)
+        while view:
+            if self._remaining:
+                take = min(self._remaining, len(view))
+                self._consume(view[:take])
+                view = view[take:]
+                self._remaining -= take
+                if not self._remaining:
+                    self._end_member()
+            elif self._padding:
+                take = min(self._padding, len(view))
+                view = view[take:]
+                self._padding -= take
+            else:
+                take = min(512 - len(self._buffer), len(view))
+                self._buffer.extend(view[:take])
+                view = view[take:]
+                if len(self._buffer) == 512:
+                    header = bytes(self._buffer)
+                    self._buffer.clear()
+                    if not self._start_member(header):
+                        # not a plain tar stream (e.g. compressed as a whole), parse it at the end instead
+                        self._raw = bytearray(header)
+                        self._raw.extend(view)
+                        return
+
+    def _start_member(self, header):
+        if header == b'\x00' * 512:
+            return True
+        if self._member is None and self.metadata_dict is None and not self.documents and header[257:262] != b'ustar':
+            return False
+
+        tarinfo = tarfile.TarInfo.frombuf(header, 'utf-8', 'surrogateescape')
+        name = self._long_name or tarinfo.name
+        self._long_name = None
+        self._remaining = tarinfo.size
+        self._padding = (512 - tarinfo.size % 512) % 512
+
+        if tarinfo.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE):
+            self._member = ('longname' if tarinfo.type == tarfile.GNUTYPE_LONGNAME else 'pax', bytearray())
+        elif not tarinfo.isfile():
+            self._member = ('skip', None)
+        else:
+            self._member = self._open_member(Path(name).name)
+
+        if not self._remaining:
+            self._end_member()
+        return True
+
+    def _open_member(self, member_name):
+        if member_name == 'metadata.json':
+            return ('metadata', bytearray())
+        if not member_name:
+            return ('skip', None)
+
+        names = [member_name]
+        if member_name.endswith('.zst'):
+            names.append(member_name[:-4])
+        alias_name = _archive_bin_member_alias(member_name)
+        if alias_name:
+            names.append(alias_name)
+
+        if self._wanted_names is not None and not any(name in self._wanted_names for name in names):
+            return ('skip', None)
+
+        if self._spool is None:
+            self._spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        self._document_start = self._spool.tell()
+        if self.decompress:
+            self._writer = zstd.ZstdDecompressor().stream_writer(self._spool, closefd=False)
+        else:
+            self._writer = self._spool
+        return ('document', names)
+
+    def _consume(self, data):
+        kind, target = self._member
+        if kind == 'document':
+            self._writer.write(data)
+        elif kind != 'skip':
+            target.extend(data)
+
+    def _end_member(self):
+        kind, target = self._member
+        self._member = None
+        if kind == 'metadata':
+            self.metadata_dict = json.loads(bytes(target).decode('utf-8'))
+            self._wanted_names = {
+                _document_name_from_metadata(doc) for doc in self.metadata_dict.get('documents', [])
+                if (self.wanted_filenames is None or _document_name_from_metadata(doc) in self.wanted_filenames)
+                and (not self.keep_types or doc.get('type') in self.keep_types)
+            }
+        elif kind == 'document':
+            if self._writer is not self._spool:
+                self._writer.flush()
+                self._writer.close()
+            self._writer = None
+            start = self._document_start
+            for name in target:
+                self.documents[name] = (start, self._spool.tell() - start)
+        elif kind == 'longname':
+            self._long_name = bytes(target).rstrip(b'\x00').decode('utf-8', 'surrogateescape')
+        elif kind == 'pax':
+            for record in bytes(target).decode('utf-8', 'surrogateescape').splitlines():
+                key, _, value = record.partition(' ')[2].partition('=')
+                if key == 'path':
+                    self._long_name = value
+
+    @metrics.timed('tar.extract')
+    def finish(self, downloader):
+        """Return (metadata_content, documents) with each document's content as an open file."""
+        if self._raw is None and self.metadata_dict is None and not self.documents and self._buffer:
+            # stream shorter than one tar header, so it was never recognised as compressed
+            self._raw = self._buffer
+        if self._raw is not None:
+            return downloader._extract_submission_from_tar(bytes(self._raw), list(self.keep_types), self.wanted_filenames)
+        if self._remaining or self._member is not None:
+            raise ValueError("Archive tar ended mid-member")
+        if self.metadata_dict is None:
+            raise ValueError("Archive tar did not contain metadata.json")
+
+        documents = []
+        filtered_metadata_documents = []
+        for doc in self.metadata_dict.get('documents', []):
+            doc_name = _document_name_from_metadata(doc)
+            if doc_name not in self._wanted_names:
+                continue
+            section = self.documents.get(doc_name) or self.documents.get(f"{doc_name}.zst")
+            if section is None:
+                raise FileNotFoundError(
+                    f"Document listed in metadata but not found in tar: {doc_name}"
+                )
+            offset, size = section
+            documents.append({
+                'name': doc_name,
+                'content': _SpoolSection(self._spool, offset, size),
+                'size': size,
+            })
+            filtered_metadata_documents.append(doc)
+
+        filtered_metadata = self.metadata_dict.copy()
+        filtered_metadata['documents'] = filtered_metadata_documents
+        return json.dumps(filtered_metadata).encode('utf-8'), documents
+
+    def close(self):
+        """Release the spooled document file."""
+        if self._spool is not None:
+            self._spool.close()
+
+
+class _SpoolSection:
+    """
+    Read-only file over one document's bytes in a submission's shared spool.
+
+    The documents of a submission are written to the batch tar one at a time, so sections
+    seek the shared spool on every read. Closing any section closes the spool.
+    """
+
+    def __init__(self, spool, offset, size):
+        self._spool = spool
+        self.offset = offset
+        self.size = size
+        self._position = 0
+
+    def read(self, size=-1):
+        remaining = self.size - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self._spool.seek(self.offset + self._position)
+        data = self._spool.read(size)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        self._spool.close()
+
+
 class TarDownloader:
     def __init__(self, api_key=None):
         self.BASE_URL = SEC_FILINGS_ARCHIVE_TAR_ENDPOINT
         self.CHUNK_SIZE = 2 * 1024 * 1024
-        self.MAX_CONCURRENT_DOWNLOADS = 100
+        self.SPOOL_SIZE = 4 * 1024 * 1024  # documents larger than this are spooled to disk while downloading
+        # in-flight downloads start at INITIAL and adapt between MIN and MAX (see AdaptiveConcurrency)
+        self.INITIAL_CONCURRENT_DOWNLOADS = 100
+        self.MIN_CONCURRENT_DOWNLOADS = 4
+        self.MAX_CONCURRENT_DOWNLOADS = 1000
         self.MAX_EXTRACTION_WORKERS = cpu_count()
         self.MAX_TAR_WORKERS = cpu_count()
+        # each batch tar shard has a writer thread fed by a queue of at most WRITE_QUEUE_SIZE submissions
+        self.WRITE_QUEUE_SIZE = 64
+        self.WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+        self.FSYNC_BYTES = 256 * 1024 * 1024  # shards are fsynced after this many bytes and on close
         self.PROBE_SIZE = 131072  # 128KB
         self.RANGE_MERGE_THRESHOLD = 1024  # Merge ranges if gap <= 1KB
+        self.MAX_RETRIES = 3
+        self.RETRY_BACKOFF = 1.0  # seconds before the first retry, doubling (with jitter) up to MAX_RETRY_BACKOFF
+        self.MAX_RETRY_BACKOFF = 30.0
+        self.downloaded_bytes = 0
+        self.keep_compressed = False
         if api_key is not None:
             self._api_key = api_key
         self.error_log_lock = Lock()
+        self.error_journals = {}
 
     @property
     def api_key(self):
@@ -73,22 +339,12 @@ class TarDownloader:
             raise ValueError("API key cannot be empty")
         self._api_key = value
 
-    def _log_error(self, output_dir, filename, error_msg):
-        error_file = os.path.join(output_dir, 'errors.json')
+    def _log_error(self, output_dir, filename, error_msg, **fields):
         with self.error_log_lock:
-            try:
-                if os.path.exists(error_file):
-                    with open(error_file, 'r') as f:
-                        errors = json.load(f)
-                else:
-                    errors = {}
-                
-                errors[filename] = str(error_msg)
-                
-                with open(error_file, 'w') as f:
-                    json.dump(errors, f, indent=2)
-            except Exception as e:
-                logger.error(f"Failed to log error to {error_file}: {str(e)}")
+            journal = self.error_journals.get(output_dir)
+            if journal is None:
+                journal = self.error_journals[output_dir] = ErrorJournal(output_dir)
+        journal.record(filename, error_msg, **fields)
 
     def _filter_metadata_documents(self, metadata_dict, downloaded_document_names):
         """
@@ -199,7 +455,7 @@ class TarDownloader:
             return metadata_bytes, metadata_with_positions, is_complete
             
         except Exception as e:
-            logger.error(f"Error extracting metadata from probe: {str(e)}")
+            logger.debug(f"Error extracting metadata from probe: {str(e)}")
             raise
 
     def _extract_documents_from_probe(self, probe_bytes, metadata_with_positions, keep_document_types):
@@ -233,7 +489,7 @@ class TarDownloader:
                 compressed_content = probe_bytes[start_byte:end_byte]
                 
                 # Decompress (all documents are zstd compressed)
-                content = self._decompress_zstd(compressed_content)
+                content = decompress_zstd(compressed_content)
                 
                 documents.append({
                     'name': filename,
@@ -264,7 +520,7 @@ class TarDownloader:
                 continue
             
             doc_info = {
-                'name': doc.get('filename', f"{doc['sequence']}.txt"),
+                'name': self._document_name_from_metadata(doc),
                 'type': doc_type,
                 'start': int(doc['secsgml_start_byte']),
                 'end': int(doc['secsgml_end_byte']),
@@ -308,7 +564,7 @@ class TarDownloader:
                     compressed_content = probe_bytes[start:end]
                     
                     # Decompress
-                    content = self._decompress_zstd(compressed_content)
+                    content = decompress_zstd(compressed_content)
                     
                     documents.append({
                         'name': name,
@@ -322,32 +578,25 @@ class TarDownloader:
         
         return documents
 
-    def _decompress_zstd(self, compressed_content):
-        """Decompress zstd content using stream reader"""
-        dctx = zstd.ZstdDecompressor()
-        try:
-            input_buffer = io.BytesIO(compressed_content)
-            decompressed_content = io.BytesIO()
-            
-            with dctx.stream_reader(input_buffer) as reader:
-                shutil.copyfileobj(reader, decompressed_content)
-            
-            result = decompressed_content.getvalue()
-            
-            input_buffer.close()
-            decompressed_content.close()
-            
-            return result
-        except Exception as e:
-            logger.error(f"Decompression error: {str(e)}")
-            raise
-
     def _document_name_from_metadata(self, doc):
-        filename = doc.get('filename')
-        if filename:
-            return filename
-        return f"{doc.get('sequence', 'document')}.txt"
+        return _document_name_from_metadata(doc)
+
+    def _decode_document(self, content):
+        """Decompress an archive member, unless documents are being kept compressed."""
+        if self.keep_compressed:
+            return content
+        return decompress_zstd(content)
 
+    def _mark_compressed(self, metadata_bytes, documents):
+        """Name documents kept zstd-compressed with a .zst suffix, in the metadata and in the batch tar."""
+        metadata_dict = json.loads(metadata_bytes)
+        for doc in metadata_dict.get('documents', []):
+            doc['filename'] = f"{_document_name_from_metadata(doc)}.zst"
+        for doc in documents:
+            doc['name'] = f"{doc['name']}.zst"
+        return json.dumps(metadata_dict).encode('utf-8'), documents
+
+    @metrics.timed('tar.extract')
     def _extract_submission_from_tar(self, tar_bytes, keep_document_types, wanted_filenames=None):
         metadata_dict = None
         compressed_documents = {}
@@ -398,7 +647,7 @@ class TarDownloader:
                     f"Document listed in metadata but not found in tar: {doc_name}"
                 )
 
-            content = self._decompress_zstd(content)
+            content = self._decode_document(content)
             documents.append({
                 'name': doc_name,
                 'content': content,
@@ -411,134 +660,437 @@ class TarDownloader:
         return metadata_content, documents
 
     class TarManager:
-        def __init__(self, output_dir, num_tar_files, max_batch_size=1024*1024*1024):
+        """
+        Batch tar writer with one thread per shard.
+
+        Submissions are queued to their shard's writer (the queue is bounded, so producers wait
+        when a shard falls behind) and written as raw tar headers and payloads through a large
+        buffered file, so each shard's disk I/O is sequential and no extraction worker waits on it.
+        A shard's tar is opened on its first write, so shards that get nothing leave no empty
+        tar behind. Shards are fsynced every fsync_bytes written and when their tar is closed.
+        """
+
+        def __init__(self, output_dir, num_tar_files, max_batch_size=1024*1024*1024,
+                     queue_size=64, buffer_size=8*1024*1024, fsync_bytes=256*1024*1024):
             self.output_dir = output_dir
             self.num_tar_files = num_tar_files
             self.max_batch_size = max_batch_size
+            self.buffer_size = buffer_size
+            self.fsync_bytes = fsync_bytes
             self.tar_files = {}
-            self.tar_locks = {}
+            self.tar_offsets = {}
+            self.unsynced_bytes = {}
             self.file_counters = {}
             self.tar_sizes = {}
             self.tar_sequences = {}
+            self.tar_paths = {}
+            self.tar_previous_stats = {}
+            self.index_entries = {}
+            self.queues = {}
+            self.writers = {}
+            self.index = PortfolioIndex(output_dir)
+            self.balancer = ShardBalancer(num_tar_files, loads=batch_shard_sizes(output_dir, num_tar_files))
             
             for i in range(num_tar_files):
-                tar_path = os.path.join(output_dir, f'batch_{i:03d}_001.tar')
-                self.tar_files[i] = tarfile.open(tar_path, 'a')
-                self.tar_locks[i] = Lock()
+                sequence, size = self._last_batch(i)
                 self.file_counters[i] = 0
-                self.tar_sizes[i] = 0
-                self.tar_sequences[i] = 1
-        
-        def get_tar_index(self, accession_num):
-            return hash(accession_num) % self.num_tar_files
+                self.tar_sizes[i] = size
+                self.tar_sequences[i] = sequence
+                self.queues[i] = queue.Queue(maxsize=queue_size)
+                self.writers[i] = Thread(target=self._run_writer, args=(i,), name=f'tar-writer-{i}', daemon=True)
+                self.writers[i].start()
+
+        def _batch_path(self, tar_index, sequence):
+            return os.path.join(self.output_dir, f'batch_{tar_index:03d}_{sequence:03d}.tar')
+
+        def _last_batch(self, tar_index):
+            """Continue a shard's highest existing sequence, so repeated downloads fill it instead of leaving small tails."""
+            sequence = 1
+            while os.path.exists(self._batch_path(tar_index, sequence + 1)):
+                sequence += 1
+            stat = _tar_stat(self._batch_path(tar_index, sequence))
+            return sequence, stat[0] if stat else 0
+
+        def _open_tar(self, tar_index, tar_path):
+            self.tar_paths[tar_index] = tar_path
+            self.tar_previous_stats[tar_index] = _tar_stat(tar_path)
+            self.index_entries[tar_index] = []
+            # like tarfile's 'a' mode: append after the last member, over the end-of-archive blocks
+            offset = _tar_data_end(tar_path) if self.tar_previous_stats[tar_index] else 0
+            f = open(tar_path, 'r+b' if self.tar_previous_stats[tar_index] else 'wb', buffering=self.buffer_size)
+            f.seek(offset)
+            f.truncate()
+            self.tar_files[tar_index] = f
+            self.tar_offsets[tar_index] = offset
+            self.unsynced_bytes[tar_index] = 0
+
+        def _close_tar(self, tar_index):
+            f = self.tar_files[tar_index]
+            try:
+                # end-of-archive marker, padded to a full record as tarfile does
+                end = self.tar_offsets[tar_index] + 2 * tarfile.BLOCKSIZE
+                f.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE + -end % tarfile.RECORDSIZE))
+                self._fsync(tar_index)
+            finally:
+                f.close()
+            try:
+                self.index.append_tar(
+                    self.tar_paths[tar_index],
+                    self.index_entries[tar_index],
+                    self.tar_previous_stats[tar_index]
+                )
+            except Exception as e:
+                # the tar is left stale in the index and rescanned on the next portfolio load
+                logger.error(f"Error indexing tar {tar_index}: {str(e)}")
+            self.index_entries[tar_index] = []
+
+        @metrics.timed('tar.fsync')
+        def _fsync(self, tar_index):
+            f = self.tar_files[tar_index]
+            f.flush()
+            os.fsync(f.fileno())
+            self.unsynced_bytes[tar_index] = 0
         
+        def get_tar_index(self, accession_num, size=0):
+            return self.balancer.assign(accession_num, size)
+
+        def submit(self, accession_num, metadata_content, documents):
+            """
+            Queue a submission for its shard's writer and return a Future resolving to True once
+            it is written, or False if writing failed. Blocks while the shard's queue is full.
+            Document content is bytes, or an open file with its length in doc['size'].
+            """
+            submission_size = len(metadata_content) + sum(_document_size(doc) for doc in documents)
+            tar_index = self.get_tar_index(accession_num, submission_size)
+            future = Future()
+            with metrics.timer('tar.queue_wait'):
+                self.queues[tar_index].put((accession_num, metadata_content, documents, submission_size, future))
+            return future
+
         def write_submission(self, accession_num, metadata_content, documents):
-            tar_index = self.get_tar_index(accession_num)
+            """Write a submission and wait for it; returns True on success."""
+            return self.submit(accession_num, metadata_content, documents).result()
+
+        def _run_writer(self, tar_index):
+            shard_queue = self.queues[tar_index]
+            while True:
+                item = shard_queue.get()
+                if item is None:
+                    return
+                accession_num, metadata_content, documents, submission_size, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._write_submission(tar_index, accession_num, metadata_content, documents, submission_size))
+                except BaseException as e:
+                    future.set_exception(e)
+
+        @metrics.timed('tar.write_submission')
+        def _write_submission(self, tar_index, accession_num, metadata_content, documents, submission_size):
+            if self.tar_sizes[tar_index] > 0 and self.tar_sizes[tar_index] + submission_size > self.max_batch_size:
+                # the shard's existing tar may be full before this run has opened it
+                if tar_index in self.tar_files:
+                    self._close_tar(tar_index)
+                    del self.tar_files[tar_index]
+
+                self.tar_sequences[tar_index] += 1
+                self.file_counters[tar_index] = 0
+                self.tar_sizes[tar_index] = 0
+            if tar_index not in self.tar_files:
+                self._open_tar(tar_index, self._batch_path(tar_index, self.tar_sequences[tar_index]))
             
-            submission_size = len(metadata_content) + sum(len(doc['content']) for doc in documents)
+            f = self.tar_files[tar_index]
+            start = self.tar_offsets[tar_index]
+            offset = start
             
-            with self.tar_locks[tar_index]:
-                if self.tar_sizes[tar_index] > 0 and self.tar_sizes[tar_index] + submission_size > self.max_batch_size:
-                    tar = self.tar_files[tar_index]
-                    tar.close()
-
-                    self.tar_sequences[tar_index] += 1
-                    new_tar_path = os.path.join(self.output_dir, f'batch_{tar_index:03d}_{self.tar_sequences[tar_index]:03d}.tar')
-                    self.tar_files[tar_index] = tarfile.open(new_tar_path, 'a')
-                    self.file_counters[tar_index] = 0
-                    self.tar_sizes[tar_index] = 0
+            try:
+                members = {}
+                for name, content, size in [('metadata.json', metadata_content, len(metadata_content))] + [
+                    (doc['name'], doc['content'], _document_size(doc)) for doc in documents
+                ]:
+                    tarinfo = tarfile.TarInfo(name=f'{accession_num}/{name}')
+                    tarinfo.size = size
+                    header = tarinfo.tobuf(tarfile.DEFAULT_FORMAT, tarfile.ENCODING, 'surrogateescape')
+                    f.write(header)
+                    offset += len(header)
+                    members[name] = (offset, size)
+
+                    if hasattr(content, 'read'):
+                        tarfile.copyfileobj(content, f, size, bufsize=self.buffer_size)
+                    else:
+                        f.write(content)
+                    padding = -size % tarfile.BLOCKSIZE
+                    if padding:
+                        f.write(tarfile.NUL * padding)
+                    offset += size + padding
                 
-                tar = self.tar_files[tar_index]
+                self.tar_offsets[tar_index] = offset
+                self.index_entries[tar_index].append({
+                    'accession': accession_num,
+                    'metadata': json.loads(metadata_content),
+                    'members': members,
+                })
+                self.file_counters[tar_index] += 1
+                self.tar_sizes[tar_index] += submission_size
+
+                self.unsynced_bytes[tar_index] += offset - start
+                if self.unsynced_bytes[tar_index] >= self.fsync_bytes:
+                    self._fsync(tar_index)
+                return True
                 
+            except Exception as e:
+                logger.error(f"Error writing {accession_num} to tar {tar_index}: {str(e)}")
                 try:
-                    # Write metadata
-                    tarinfo = tarfile.TarInfo(name=f'{accession_num}/metadata.json')
-                    tarinfo.size = len(metadata_content)
-                    tar.addfile(tarinfo, io.BytesIO(metadata_content))
-                    
-                    # Write documents
-                    for doc in documents:
-                        tarinfo = tarfile.TarInfo(name=f'{accession_num}/{doc["name"]}')
-                        tarinfo.size = len(doc['content'])
-                        tar.addfile(tarinfo, io.BytesIO(doc['content']))
-                    
-                    self.file_counters[tar_index] += 1
-                    self.tar_sizes[tar_index] += submission_size
-                    return True
-                    
-                except Exception as e:
-                    logger.error(f"Error writing {accession_num} to tar {tar_index}: {str(e)}")
-                    return False
+                    # drop the partial submission so the next one starts on a clean header
+                    f.seek(start)
+                    f.truncate()
+                except OSError:
+                    pass
+                return False
         
         def close_all(self):
-            for i, tar in self.tar_files.items():
+            for i in self.writers:
+                self.queues[i].put(None)
+            for i in self.writers:
+                self.writers[i].join()
+            for i in self.tar_files:
                 try:
-                    tar.close()
+                    self._close_tar(i)
                 except Exception as e:
                     logger.error(f"Error closing tar {i}: {str(e)}")
+            self.index.close()
 
-    async def download_and_process(self, session, spec, semaphore, extraction_pool, tar_manager, output_dir, pbar, keep_document_types):
-        async with semaphore:
-            url = spec['url']
-            filename = url.split('/')[-1]
-            accession_num = spec['accession']
+    async def download_and_process(self, session, spec, limiter, extraction_pool, tar_manager, output_dir, pbar, keep_document_types):
+        url = spec['url']
+        filename = url.split('/')[-1]
 
-            api_key = self.api_key
-            if not api_key:
-                raise ValueError("No API key found. Please set DATAMULE_API_KEY environment variable or provide api_key in constructor")
+        api_key = self.api_key
+        if not api_key:
+            raise ValueError("No API key found. Please set DATAMULE_API_KEY environment variable or provide api_key in constructor")
 
-            try:
-                headers = {
-                    'Connection': 'keep-alive',
-                    'Accept-Encoding': 'gzip, deflate, br'
-                }
-                
-                async with session.get(url, headers=headers) as response:
-                    if response.status != 200:
-                        self._log_error(output_dir, filename, f"Download failed: Status {response.status}")
-                        pbar.update(1)
-                        return
-                    
-                    chunks = []
-                    async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
-                        chunks.append(chunk)
-                    tar_bytes = b''.join(chunks)
-                
-                loop = asyncio.get_running_loop()
-                metadata_bytes, documents = await loop.run_in_executor(
-                    extraction_pool,
-                    partial(
-                        self._extract_submission_from_tar,
-                        tar_bytes,
-                        keep_document_types,
-                        spec.get('wanted_filenames'),
-                    )
-                )
-                
-                success = await loop.run_in_executor(
-                    extraction_pool,
-                    partial(tar_manager.write_submission, accession_num, metadata_bytes, documents)
-                )
-                
-                if not success:
-                    self._log_error(output_dir, filename, "Failed to write to output tar")
+        for attempt in range(self.MAX_RETRIES + 1):
+            # the slot is released while backing off, so waiting retries don't hold up other downloads
+            async with limiter.slot() as slot:
+                try:
+                    await self._download_submission(session, spec, slot, extraction_pool, tar_manager, keep_document_types)
+                    error = None
+                except Exception as e:
+                    slot.failed(e)
+                    error = e
+            if error is None or attempt == self.MAX_RETRIES or not is_retryable(error):
+                break
+            await asyncio.sleep(retry_delay(attempt, self.RETRY_BACKOFF, self.MAX_RETRY_BACKOFF))
+
+        if error is not None:
+            self._log_error(
+                output_dir, filename, str(error) or type(error).__name__,
+                source='datamule-tar', url=url, accession=spec['accession'], attempts=attempt + 1,
+                keep_document_types=list(keep_document_types or []),
+                wanted_filenames=sorted(spec['wanted_filenames']) if spec.get('wanted_filenames') else None,
+                keep_compressed=self.keep_compressed
+            )
+        metrics.count('tar.failed' if error is not None else 'tar.submissions')
+        metrics.count('tar.retries', attempt)
+
+        pbar.set_postfix(limiter.status(), refresh=False)
+        pbar.update(1)
+
+    async def _download_submission(self, session, spec, slot, extraction_pool, tar_manager, keep_document_types):
+        url = spec['url']
+        if keep_document_types or spec.get('wanted_filenames'):
+            metadata_bytes, documents = await self._download_filtered(
+                session, url, extraction_pool, keep_document_types, spec.get('wanted_filenames'), slot
+            )
+        else:
+            metadata_bytes, documents = await self._download_full(
+                session, url, extraction_pool, keep_document_types, spec.get('wanted_filenames'), slot
+            )
+        
+        if self.keep_compressed:
+            metadata_bytes, documents = self._mark_compressed(metadata_bytes, documents)
+        
+        loop = asyncio.get_running_loop()
+        try:
+            # only waits here when the shard's writer queue is full; the write itself runs on the shard's writer thread
+            future = await loop.run_in_executor(None, partial(tar_manager.submit, spec['accession'], metadata_bytes, documents))
+            success = await asyncio.wrap_future(future)
+        finally:
+            for doc in documents:
+                if hasattr(doc['content'], 'close'):
+                    doc['content'].close()
+        
+        if not success:
+            raise ValueError("Failed to write to output tar")
+
+    async def _download_full(self, session, url, extraction_pool, keep_document_types, wanted_filenames, slot):
+        headers = {
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'gzip, deflate, br'
+        }
+        
+        loop = asyncio.get_running_loop()
+        extractor = _StreamingSubmissionExtractor(
+            keep_document_types, wanted_filenames, self.SPOOL_SIZE, decompress=not self.keep_compressed
+        )
+        feeding = None
+        try:
+            async with session.get(url, headers=headers) as response:
+                slot.response(response.status)
+                if response.status != 200:
+                    raise DownloadStatusError(response.status)
                 
-                pbar.update(1)
-                        
-            except Exception as e:
-                self._log_error(output_dir, filename, str(e))
-                pbar.update(1)
+                # one chunk is parsed on the extraction pool while the next one downloads;
+                # each feed finishes before the next starts, so chunks are parsed in order
+                async for chunk in read_chunks(response, self.CHUNK_SIZE, slot):
+                    self.downloaded_bytes += len(chunk)
+                    if feeding is not None:
+                        await asyncio.wrap_future(feeding)
+                    feeding = extraction_pool.submit(extractor.feed, chunk)
+                if feeding is not None:
+                    await asyncio.wrap_future(feeding)
+            
+            return await loop.run_in_executor(extraction_pool, extractor.finish, self)
+        except BaseException:
+            # the extractor's spool files can't be closed under a feed that is still running
+            if feeding is not None and not feeding.cancel():
+                concurrent.futures.wait([feeding])
+            extractor.close()
+            raise
+
+    @metrics.timed('tar.range_request')
+    async def _fetch_range(self, session, url, start, end, slot):
+        """GET bytes [start, end) of url. Returns (status, content); status 200 means the server sent the whole file."""
+        headers = {
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'identity',
+            'Range': f'bytes={start}-{end - 1}'
+        }
+        async with session.get(url, headers=headers) as response:
+            slot.response(response.status)
+            if response.status not in (200, 206):
+                raise DownloadStatusError(response.status)
+            content = b''.join([chunk async for chunk in read_chunks(response, self.CHUNK_SIZE, slot)])
+        self.downloaded_bytes += len(content)
+        return response.status, content
+
+    def _merge_ranges(self, docs):
+        """
+        Group documents into [start, end, docs] byte ranges, each including the documents' tar
+        headers, merging neighbours separated by at most RANGE_MERGE_THRESHOLD bytes.
+        """
+        ranges = []
+        for doc in sorted(docs, key=lambda doc: doc['start']):
+            start = doc['start'] - 512
+            if ranges and start - ranges[-1][1] <= self.RANGE_MERGE_THRESHOLD:
+                ranges[-1][1] = max(ranges[-1][1], doc['end'])
+                ranges[-1][2].append(doc)
+            else:
+                ranges.append([start, doc['end'], [doc]])
+        return ranges
+
+    @metrics.timed('tar.extract')
+    def _extract_ranged_documents(self, buffers):
+        """
+        Decompress documents from fetched byte ranges.
+
+        buffers is a list of (range_start, content, docs). Each document's tar header is checked
+        against its expected size, so stale offsets are caught instead of producing garbage.
+        """
+        documents = []
+        for range_start, content, docs in buffers:
+            for doc in docs:
+                header = self._parse_tar_header(content[doc['start'] - 512 - range_start:doc['start'] - range_start])
+                if header is None or header['size'] != doc['end'] - doc['start']:
+                    raise ValueError(f"Tar header mismatch for {doc['name']}")
+                documents.append({
+                    'name': doc['name'],
+                    'content': self._decode_document(content[doc['start'] - range_start:doc['end'] - range_start])
+                })
+        return documents
+
+    async def _download_filtered(self, session, url, extraction_pool, keep_document_types, wanted_filenames, slot):
+        """
+        Download only the wanted documents of a submission.
+
+        The first PROBE_SIZE bytes hold metadata.json, which gives every document's byte range in
+        the tar. Documents inside the probe are sliced from it and the rest are fetched with merged
+        Range requests. Falls back to a full download if the server ignores Range or the offsets
+        don't check out.
+        """
+        loop = asyncio.get_running_loop()
+        status, probe_bytes = await self._fetch_range(session, url, 0, self.PROBE_SIZE, slot)
+        if status == 200:
+            # Range not supported, the probe is the whole tar
+            return await loop.run_in_executor(
+                extraction_pool,
+                partial(self._extract_submission_from_tar, probe_bytes, keep_document_types, wanted_filenames)
+            )
+
+        try:
+            metadata_bytes, metadata_with_positions, is_complete = self._extract_metadata_from_probe(probe_bytes)
+            metadata_dict = json.loads(metadata_bytes)
+
+            wanted_filenames = set(wanted_filenames) if wanted_filenames else None
+            wanted = [
+                i for i, doc in enumerate(metadata_dict.get('documents', []))
+                if wanted_filenames is None or self._document_name_from_metadata(doc) in wanted_filenames
+            ]
+            metadata_dict['documents'] = [metadata_dict['documents'][i] for i in wanted]
+            metadata_with_positions['documents'] = [metadata_with_positions['documents'][i] for i in wanted]
+
+            docs_in_probe, docs_beyond_probe = self._separate_documents_by_location(metadata_with_positions, keep_document_types)
+            if is_complete or len(probe_bytes) < self.PROBE_SIZE:
+                docs_in_probe, docs_beyond_probe = docs_in_probe + docs_beyond_probe, []
+
+            ranges = self._merge_ranges(docs_beyond_probe)
+            fetched = await asyncio.gather(*(self._fetch_range(session, url, start, end, slot) for start, end, _ in ranges))
+            if any(range_status != 206 for range_status, _ in fetched):
+                raise ValueError("Server ignored Range header")
 
-    async def process_batch(self, specs, output_dir, max_batch_size=1024*1024*1024, keep_document_types=[]):
+            buffers = [(0, probe_bytes, docs_in_probe)]
+            buffers.extend((start, content, docs) for (start, _, docs), (_, content) in zip(ranges, fetched))
+            documents = await loop.run_in_executor(extraction_pool, partial(self._extract_ranged_documents, buffers))
+        except (ValueError, KeyError, TypeError) as e:
+            if is_retryable(e):
+                raise
+            logger.debug(f"Range download of {url} failed ({str(e)}), downloading full tar")
+            return await self._download_full(session, url, extraction_pool, keep_document_types, wanted_filenames, slot)
+
+        # keep metadata in the same order and form as a full download would
+        names = {doc['name'] for doc in documents}
+        metadata_dict['documents'] = [
+            doc for doc in metadata_dict['documents'] if self._document_name_from_metadata(doc) in names
+        ]
+        # documents are written in metadata order
+        order = {name: i for i, name in enumerate(self._document_name_from_metadata(doc) for doc in metadata_dict['documents'])}
+        documents.sort(key=lambda doc: order[doc['name']])
+        return json.dumps(metadata_dict).encode('utf-8'), documents
+
+    async def process_batch(self, specs, output_dir, max_batch_size=1024*1024*1024, keep_document_types=[], keep_compressed=False):
+        """
+        Download specs into batch tars under output_dir.
+
+        specs is a list of download specs, or an iterator of lists of specs (e.g. one per lookup
+        page), in which case downloads start as soon as the first list arrives.
+        """
         os.makedirs(output_dir, exist_ok=True)
+        self.keep_compressed = keep_compressed
+
+        streaming = not isinstance(specs, list)
+        num_tar_files = self.MAX_TAR_WORKERS if streaming else min(self.MAX_TAR_WORKERS, len(specs))
         
-        num_tar_files = min(self.MAX_TAR_WORKERS, len(specs))
-        
-        tar_manager = self.TarManager(output_dir, num_tar_files, max_batch_size)
+        tar_manager = self.TarManager(
+            output_dir, num_tar_files, max_batch_size,
+            queue_size=self.WRITE_QUEUE_SIZE, buffer_size=self.WRITE_BUFFER_SIZE, fsync_bytes=self.FSYNC_BYTES
+        )
         
         try:
-            with tqdm(total=len(specs), desc="Downloading tar files") as pbar:
-                semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_DOWNLOADS)
+            with tqdm(total=0 if streaming else len(specs), desc="Downloading tar files") as pbar:
+                limiter = AdaptiveConcurrency(
+                    self.INITIAL_CONCURRENT_DOWNLOADS,
+                    minimum=self.MIN_CONCURRENT_DOWNLOADS,
+                    maximum=self.MAX_CONCURRENT_DOWNLOADS
+                )
                 extraction_pool = ThreadPoolExecutor(max_workers=self.MAX_EXTRACTION_WORKERS)
 
                 connector = aiohttp.TCPConnector(
@@ -549,15 +1101,21 @@ class TarDownloader:
                     keepalive_timeout=60
                 )
 
-                # timeout
-                async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
-                    tasks = [
-                        self.download_and_process(
-                            session, spec, semaphore, extraction_pool,
-                            tar_manager, output_dir, pbar, keep_document_types
-                        ) 
-                        for spec in specs
-                    ]
+                # transfers get a deadline scaled to their size (see read_chunks); this only catches stalls
+                timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+                async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                    tasks = []
+                    async for batch in _spec_batches(specs):
+                        if streaming:
+                            pbar.total += len(batch)
+                            pbar.refresh()
+                        tasks.extend(
+                            asyncio.ensure_future(self.download_and_process(
+                                session, spec, limiter, extraction_pool,
+                                tar_manager, output_dir, pbar, keep_document_types
+                            ))
+                            for spec in batch
+                        )
                     await asyncio.gather(*tasks, return_exceptions=True)
 
                 extraction_pool.shutdown()
@@ -578,9 +1136,49 @@ class TarDownloader:
             'filename': record.get('filename'),
         }
 
+    def _specs_from_archive_records(self, archive_records):
+        """One spec per tar url, collecting the filenames wanted from it when records name documents."""
+        specs_by_url = {}
+        for record in archive_records:
+            spec = self._spec_from_archive_record(record)
+            url = spec['url']
+            if url not in specs_by_url:
+                specs_by_url[url] = {
+                    'url': url,
+                    'accession': spec['accession'],
+                    'wanted_filenames': set(),
+                    'has_filename_filter': False,
+                }
+            if spec.get('filename'):
+                specs_by_url[url]['wanted_filenames'].add(spec['filename'])
+                specs_by_url[url]['has_filename_filter'] = True
+
+        specs = []
+        for spec in specs_by_url.values():
+            if not spec.pop('has_filename_filter'):
+                spec['wanted_filenames'] = None
+            specs.append(spec)
+        return specs
+
+    def _stream_specs(self, record_batches):
+        """
+        Specs for record batches as they arrive, skipping urls already seen.
+
+        Only for submission-level records: a document-level lookup can split one tar's
+        filenames across pages, and its first spec would already be downloading.
+        """
+        seen = set()
+        for records in record_batches:
+            batch = []
+            for spec in self._specs_from_archive_records(records):
+                if spec['url'] not in seen:
+                    seen.add(spec['url'])
+                    batch.append(spec)
+            yield batch
+
     def download(self, accession_numbers=None, output_dir="downloads", 
                  keep_document_types=[], max_batch_size=1024*1024*1024,
-                 archive_records=None):
+                 archive_records=None, keep_compressed=False):
         """
         Download SEC filings in tar format for the given accession numbers.
         
@@ -589,6 +1187,7 @@ class TarDownloader:
             output_dir: Directory to save downloaded files
             keep_document_types: List of document types to keep (empty = keep all)
             max_batch_size: Maximum size of each batch tar file in bytes
+            keep_compressed: Store documents zstd-compressed (as .zst) in the batch tars, decompressing on access
         """
         if self.api_key is None:
             raise ValueError("No API key found. Please set DATAMULE_API_KEY environment variable or provide api_key in constructor")
@@ -603,44 +1202,27 @@ class TarDownloader:
                 quiet=True,
             )
 
-        logger.debug(f"Generating URLs for {len(archive_records)} filings...")
-        
-        specs_by_url = {}
-        for record in archive_records:
-            spec = self._spec_from_archive_record(record)
-            url = spec['url']
-            if url not in specs_by_url:
-                specs_by_url[url] = {
-                    'url': url,
-                    'accession': spec['accession'],
-                    'wanted_filenames': set(),
-                    'has_filename_filter': False,
-                }
-            if spec.get('filename'):
-                specs_by_url[url]['wanted_filenames'].add(spec['filename'])
-                specs_by_url[url]['has_filename_filter'] = True
-
-        specs = []
-        for spec in specs_by_url.values():
-            if not spec.pop('has_filename_filter'):
-                spec['wanted_filenames'] = None
-            specs.append(spec)
-        
-        if not specs:
-            logger.warning("No submissions found matching the criteria")
-            return
+        if not isinstance(archive_records, Sequence):
+            # record batches still being paged in; see _stream_specs for when this is safe
+            specs = self._stream_specs(archive_records)
+        else:
+            logger.debug(f"Generating URLs for {len(archive_records)} filings...")
+            specs = self._specs_from_archive_records(archive_records)
+            if not specs:
+                logger.warning("No submissions found matching the criteria")
+                return
 
         start_time = time.time()
         
         asyncio.run(self.process_batch(
             specs, output_dir,
             max_batch_size=max_batch_size, 
-            keep_document_types=keep_document_types
+            keep_document_types=keep_document_types,
+            keep_compressed=keep_compressed
         ))
         
         elapsed_time = time.time() - start_time
         logger.debug(f"Processing completed in {elapsed_time:.2f} seconds")
-        logger.debug(f"Processing speed: {len(specs)/elapsed_time:.2f} files/second")
 
 
 def download_tar(cik=None, ticker=None, submission_type=None, filing_date=None, 
@@ -649,12 +1231,13 @@ def download_tar(cik=None, ticker=None, submission_type=None, filing_date=None,
                  api_key=None, output_dir="downloads", 
                  filtered_accession_numbers=None, skip_accession_numbers=None,
                  keep_document_types=[], max_batch_size=1024*1024*1024,
-                 accession_numbers=None, quiet=False, **kwargs):
+                 accession_numbers=None, quiet=False, keep_compressed=False, **kwargs):
     """
     Download SEC filings in tar format from DataMule.
     
     If accession_numbers is provided, resolves those archive records directly.
     Otherwise, queries the v3 archive lookup with the provided filters.
+    With keep_compressed=True documents are stored as .zst and decompressed on access.
     """
     
     downloader = TarDownloader(api_key=api_key)
@@ -675,8 +1258,7 @@ def download_tar(cik=None, ticker=None, submission_type=None, filing_date=None,
             or _has_filter_value(filename)
             or _has_filter_value(sequence)
         )
-        lookup_fn = lookup_archive_tar if document_mode else lookup_archive_sgml
-        archive_records = lookup_fn(
+        lookup_kwargs = dict(
             cik=cik, 
             ticker=ticker, 
             submission_type=submission_type, 
@@ -693,8 +1275,13 @@ def download_tar(cik=None, ticker=None, submission_type=None, filing_date=None,
             api_key=api_key,
             **kwargs
         )
-        
-    if not archive_records:
+        if document_mode:
+            archive_records = lookup_archive_tar(**lookup_kwargs)
+        else:
+            # one record per submission, so downloads can start while later pages are fetched
+            archive_records = iter_archive_sgml(**lookup_kwargs)
+
+    if isinstance(archive_records, Sequence) and not archive_records:
         logger.warning("No submissions found matching the criteria")
         return
     
@@ -703,5 +1290,6 @@ def download_tar(cik=None, ticker=None, submission_type=None, filing_date=None,
         archive_records=archive_records,
         output_dir=output_dir,
         keep_document_types=keep_document_types,
-        max_batch_size=max_batch_size
+        max_batch_size=max_batch_size,
+        keep_compressed=keep_compressed
     )
@@ -1,6 +1,8 @@
 import json
 import csv
+import io
 import re
+import shutil
 from doc2dict import xml2dict, txt2dict, html2dict, visualize_dict, get_title, unnest_dict, pdf2dict, flatten_dict, convert_dict_to_columnar
 from ..mapping_dicts import MAPPING_DICTS_BY_TYPE, XML_MAPPING_DICTS_BY_TYPE, STANDARD_CONFIG
 
@@ -11,6 +13,9 @@ from ..tables.tables import Tables
 
 from ..tags.utils import get_cusip_using_regex, get_isin_using_regex, get_figi_using_regex,get_all_tickers, get_full_names,get_full_names_dictionary_lookup, analyze_lm_sentiment_fragment
 from ..utils.pdf import has_extractable_text
+from .parse_cache import get_parse_cache
+from ..utils.compression import decompress_document, open_decompressed
+from ..utils.instrumentation import metrics
 
 class DataWithTags(dict):
     def __init__(self, data, document):
@@ -127,6 +132,7 @@ class Tags(TextAnalysisBase):
         self._tickers = None
     
     @property
+    @metrics.timed('document.tags')
     def cusips(self):
         if not hasattr(self, '_cusips'):
             self._cusips = []
@@ -149,6 +155,7 @@ class Tags(TextAnalysisBase):
         return self._cusips
     
     @property
+    @metrics.timed('document.tags')
     def isins(self):
         if not hasattr(self, '_isins'):
             self._isins = []
@@ -167,6 +174,7 @@ class Tags(TextAnalysisBase):
         return self._isins
 
     @property
+    @metrics.timed('document.tags')
     def figis(self):
         if not hasattr(self, '_figis'):
             self._figis = []
@@ -193,6 +201,7 @@ class Tags(TextAnalysisBase):
         return self._tickers
     
     @property
+    @metrics.timed('document.tags')
     def persons(self):
         if not hasattr(self, '_persons'):
             self._persons = []
@@ -212,6 +221,7 @@ class Tags(TextAnalysisBase):
 
 class Similarity(TextAnalysisBase):
     @property
+    @metrics.timed('document.tags')
     def loughran_mcdonald(self):
         if not hasattr(self, '_loughran_mcdonald'):
             self._loughran_mcdonald = []
@@ -242,7 +252,7 @@ class Similarity(TextAnalysisBase):
 
 
 class Document:
-    def __init__(self, type, content, filename, accession, filing_date, path=None):
+    def __init__(self, type, content, filename, accession, filing_date, path=None, compression=None):
         
         self.type = type
         self.accession = accession
@@ -251,7 +261,9 @@ class Document:
         self.extension = Path(filename).suffix.lower()
 
 
-        self.content = content
+        # compressed members ('zstd' or 'gzip') are only decompressed when content is first accessed
+        self._content = content
+        self._compression = compression
 
         if path is not None:
             # need to think through document parsing w/ and w/o path... e.g. from url, metadata should fill it
@@ -269,6 +281,7 @@ class Document:
         self._text = None
         self._markdown = None
         self._data_tuples_columnar = None 
+        self._parse_cache_key = None
 
 
         # booleans
@@ -282,20 +295,60 @@ class Document:
         
 
 
+    @property
+    def content(self):
+        if self._compression is not None:
+            self._content = decompress_document(self._content, self._compression)
+            self._compression = None
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._compression = None
+
+    def open_stream(self):
+        """Readable binary stream over the content, decompressing stored .zst/.gz members as it is read."""
+        if self._compression is not None:
+            return open_decompressed(self._content, self._compression)
+        content = self._content
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return io.BytesIO(content)
+
+    def _get_content_bytes(self):
+        """Content as bytes/str, copying out of a memoryview (mmap-backed portfolios) only when a parser needs it."""
+        if isinstance(self.content, memoryview):
+            return self.content.tobytes()
+        return self.content
+
     def contains_string(self, pattern):
         """Works for select files"""
         if self.extension in ['.htm', '.html', '.txt','.xml']:
             return bool(re.search(pattern, self.content))
         return False
     
+    @metrics.timed('document.parse')
     def parse(self):
         # check if we have already parsed the content
         if self._data:
             return
+
+        # opt-in on-disk cache of parsed data, see set_parse_cache
+        parse_cache = get_parse_cache()
+        if parse_cache is not None and self._data_bool:
+            mapping_dict = MAPPING_DICTS_BY_TYPE.get(self.type, STANDARD_CONFIG)
+            self._parse_cache_key = parse_cache.key(self, mapping_dict)
+            cached = parse_cache.get(self._parse_cache_key)
+            if cached is not None:
+                self._data = cached['data']
+                if cached['data_tuples'] is not None:
+                    self._data_tuples = cached['data_tuples']
+                return
         
         # made lazy
         if self.extension == '.pdf':
-            if not has_extractable_text(pdf_bytes=self.content):
+            if not has_extractable_text(pdf_bytes=self._get_content_bytes()):
                 self._data_bool = False
                 return
         
@@ -304,17 +357,23 @@ class Document:
             
             mapping_dict = MAPPING_DICTS_BY_TYPE.get(self.type, STANDARD_CONFIG)
             
+            content = self._get_content_bytes()
             if self.extension in ['.htm','.html']:
-                dct = html2dict(content=self.content, mapping_dict=mapping_dict)
+                dct = html2dict(content=content, mapping_dict=mapping_dict)
             elif self.extension in ['.txt']:
-                dct = txt2dict(content=self.content, mapping_dict=mapping_dict)
+                dct = txt2dict(content=content, mapping_dict=mapping_dict)
             elif self.extension == '.pdf':
-                dct = pdf2dict(content=self.content, mapping_dict=mapping_dict)
+                dct = pdf2dict(content=content, mapping_dict=mapping_dict)
             else:
                 dct = {}
             
             self._data = dct
 
+            if parse_cache is not None:
+                # data_tuples is cheap next to parsing, so store both in a single write
+                self._data_tuples = unnest_dict(dct)
+                parse_cache.put(self._parse_cache_key, dct, self._data_tuples)
+
     @property
     def data(self):
         if self._data_bool:
@@ -375,13 +434,14 @@ class Document:
         with open(output_filename, 'w',encoding='utf-8') as f:
             json.dump(self.data, f, indent=2)
 
+    @metrics.timed('document.tables')
     def parse_tables(self):
         """Must exist in mapping means columns must occur in mapping schema."""
 
         # TODO should add warning or something for XBRL XML, or redirect to xbrl parsing
         if self.extension == '.xml' and self.type in XML_MAPPING_DICTS_BY_TYPE.keys():
             tables = Tables(document_type=self.type, accession=self.accession)
-            tables.parse_xml_bytes(content=self.content,mapping_dict=XML_MAPPING_DICTS_BY_TYPE[self.type])
+            tables.parse_xml_bytes(content=self._get_content_bytes(),mapping_dict=XML_MAPPING_DICTS_BY_TYPE[self.type])
             self._tables = tables
 
         elif self._data_bool:
@@ -390,7 +450,7 @@ class Document:
             
             # Group all tuples by ID first
             tuples_by_id = {}
-            for id, type, content, level in data_tuples:
+            for id, type, content, level, *_ in data_tuples:
                 if id not in tuples_by_id:
                     tuples_by_id[id] = []
                 tuples_by_id[id].append((type, content))
@@ -441,8 +501,8 @@ class Document:
     
 
     def write(self,file):
-        with open(file, 'wb') as f:
-            f.write(self.content)
+        with open(file, 'wb') as f, self.open_stream() as reader:
+            shutil.copyfileobj(reader, f)
 
 
     def write_csv(self, output_folder):
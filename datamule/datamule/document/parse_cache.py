@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+from threading import Lock
+import zstandard as zstd
+from ..utils.compression import decompress_zstd
+
+CACHE_FORMAT_VERSION = 2
+
+_active_parse_cache = None
+
+
+def set_parse_cache(path, max_size=10*1024*1024*1024):
+    """Cache parsed document data on disk under path, evicting least recently used entries above max_size bytes."""
+    global _active_parse_cache
+    _active_parse_cache = ParseCache(path, max_size=max_size)
+    return _active_parse_cache
+
+
+def clear_parse_cache():
+    """Stop using the parse cache. Cached files are left on disk."""
+    global _active_parse_cache
+    _active_parse_cache = None
+
+
+def get_parse_cache():
+    return _active_parse_cache
+
+
+@lru_cache(maxsize=None)
+def _parser_version():
+    try:
+        return version('doc2dict')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+def _mapping_dict_hash(mapping_dict):
+    return hashlib.sha256(json.dumps(mapping_dict, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+INT_KEYS_TAG = '__intkeys__'
+
+
+def _tag_int_keys(obj):
+    # doc2dict uses integer section ids as keys, which JSON turns into strings, so record
+    # which keys were ints to tell them apart from string keys such as '2023'
+    if isinstance(obj, dict):
+        tagged = {key: _tag_int_keys(value) for key, value in obj.items()}
+        int_keys = [key for key in obj if isinstance(key, int) and not isinstance(key, bool)]
+        if int_keys:
+            tagged[INT_KEYS_TAG] = int_keys
+        return tagged
+    if isinstance(obj, (list, tuple)):
+        return [_tag_int_keys(value) for value in obj]
+    return obj
+
+
+def _restore_int_keys(obj):
+    int_keys = obj.pop(INT_KEYS_TAG, None)
+    if not int_keys:
+        return obj
+    # rebuild rather than pop and reinsert, section order matters
+    int_keys = {str(key) for key in int_keys}
+    return {int(key) if key in int_keys else key: value for key, value in obj.items()}
+
+
+class ParseCache:
+    """
+    zstd-compressed JSON shards holding Document.data and data_tuples.
+
+    Entries are keyed by accession, filename, a hash of the content, the doc2dict version and
+    the mapping dict used, so any change to the document or the parser misses the cache.
+    File mtimes track recency for LRU eviction once the cache grows past max_size.
+    """
+
+    def __init__(self, path, max_size=10*1024*1024*1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._size = None
+        self._lock = Lock()
+        self._mapping_hashes = {}
+
+    def key(self, document, mapping_dict):
+        mapping_id = id(mapping_dict)
+        if mapping_id not in self._mapping_hashes:
+            self._mapping_hashes[mapping_id] = _mapping_dict_hash(mapping_dict)
+
+        content = document.content
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        content_hash = hashlib.blake2b(content, digest_size=16).hexdigest()
+
+        key_parts = [
+            CACHE_FORMAT_VERSION,
+            _parser_version(),
+            self._mapping_hashes[mapping_id],
+            document.accession,
+            document.filename,
+            content_hash,
+        ]
+        return hashlib.sha256(json.dumps(key_parts, default=str).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return self.path / key[:2] / f"{key}.json.zst"
+
+    def get(self, key):
+        """Return {'data': ..., 'data_tuples': ... or None} or None on a miss."""
+        entry_path = self._entry_path(key)
+        try:
+            compressed = entry_path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        try:
+            entry = json.loads(decompress_zstd(compressed), object_hook=_restore_int_keys)
+        except Exception:
+            # corrupt or truncated entry, treat as a miss
+            return None
+
+        # refresh recency for LRU eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+        if entry.get('data_tuples') is not None:
+            entry['data_tuples'] = [tuple(item) for item in entry['data_tuples']]
+        return entry
+
+    def put(self, key, data, data_tuples=None):
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        compressed = zstd.ZstdCompressor(level=3).compress(
+            json.dumps(_tag_int_keys({'data': data, 'data_tuples': data_tuples})).encode('utf-8')
+        )
+
+        # write then rename so readers never see a partial entry
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.{id(compressed)}.tmp")
+        tmp_path.write_bytes(compressed)
+        try:
+            previous_size = entry_path.stat().st_size
+        except FileNotFoundError:
+            previous_size = 0
+        os.replace(tmp_path, entry_path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(compressed) - previous_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _iter_entries(self):
+        for entry_path in self.path.glob('*/*.json.zst'):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, entry_path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._iter_entries())
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under 90% of max_size."""
+        target = self.max_size * 0.9
+        for _, size, entry_path in sorted(self._iter_entries()):
+            if self._size <= target:
+                break
+            try:
+                entry_path.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,100 @@
+import mmap
+import os
+import tarfile
+from threading import Lock
+
+
+class BatchTarReader:
+    """
+    Reads members of a batch tar by absolute (offset, size) on one shared file descriptor.
+
+    Reads use os.pread, which does not move a shared file position, so any number of threads
+    can read from the same tar without locking. Platforms without os.pread (Windows) fall back
+    to a locked seek + read.
+
+    view() instead returns a zero-copy memoryview over a read-only mmap of the tar. When the
+    tar has grown the tar is mapped again; earlier maps stay valid for the views handed out
+    from them and are closed with the reader.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self._members = None
+        self._members_lock = Lock()
+        self._read_lock = None if hasattr(os, 'pread') else Lock()
+        self._mmap = None
+        self._stale_mmaps = []
+        self._mmap_lock = Lock()
+
+    def read(self, offset, size):
+        """Read size bytes starting at an absolute offset in the tar."""
+        if self._read_lock is not None:
+            with self._read_lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                return self._read_fully(lambda n, pos: os.read(self.fd, n), offset, size)
+        return self._read_fully(lambda n, pos: os.pread(self.fd, n, pos), offset, size)
+
+    def view(self, offset, size):
+        """Return a memoryview of size bytes at an absolute offset, backed by the page cache."""
+        mapped = self._mmap
+        if mapped is None or offset + size > len(mapped):
+            with self._mmap_lock:
+                mapped = self._mmap
+                # (re)map if the tar was appended to since it was mapped
+                if mapped is None or offset + size > len(mapped):
+                    if self._mmap is not None:
+                        self._stale_mmaps.append(self._mmap)
+                    mapped = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+                    self._mmap = mapped
+        return memoryview(mapped)[offset:offset + size]
+
+    def _read_fully(self, read_fn, offset, size):
+        data = read_fn(size, offset)
+        if len(data) == size:
+            return data
+        # large reads may come back short, keep reading until complete
+        chunks = [data]
+        remaining = size - len(data)
+        while remaining > 0:
+            chunk = read_fn(remaining, offset + size - remaining)
+            if not chunk:
+                raise EOFError(f"Unexpected end of {self.path} reading {size} bytes at {offset}")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    def _resolve_members(self):
+        """Scan the tar once to map member names to (offset, size), for members missing from the index."""
+        with self._members_lock:
+            if self._members is None:
+                members = {}
+                with tarfile.open(self.path, 'r') as tar:
+                    for member in tar:
+                        if member.isfile():
+                            members[member.name] = (member.offset_data, member.size)
+                self._members = members
+        return self._members
+
+    def locate(self, name):
+        location = self._resolve_members().get(name)
+        if location is None:
+            raise FileNotFoundError(f"Member not found in {self.path}: {name}")
+        return location
+
+    def read_member(self, name):
+        offset, size = self.locate(name)
+        return self.read(offset, size)
+
+    def close(self):
+        for mapped in self._stale_mmaps + ([self._mmap] if self._mmap is not None else []):
+            try:
+                mapped.close()
+            except BufferError:
+                # documents still hold views into the map, it is released once they are collected
+                pass
+        self._stale_mmaps = []
+        self._mmap = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
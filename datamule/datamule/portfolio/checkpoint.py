@@ -0,0 +1,73 @@
+import json
+import os
+from pathlib import Path
+
+
+class ProcessingJournal:
+    """
+    Append-only JSONL journal of completed work for a named processing job.
+
+    Each line records a completed key (an accession, or accession/filename for documents)
+    and optionally its result. Records are held in memory and only written and fsynced by
+    checkpoint(), which callers run after making their own output durable, so the journal
+    never claims work whose results were lost. After a crash at most the work since the
+    last checkpoint is redone. A truncated final line is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.completed = set()
+        self._pending = []
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # terminate a partial line so the next record starts cleanly
+            self._file.write('\n')
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # partial line from an interrupted write
+                    continue
+                self.completed.add(record['key'])
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def iter_results(self):
+        """Yield (key, result) for completed work that was journaled with its result."""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'result' in record:
+                    yield record['key'], record['result']
+
+    def record(self, key, result=None, store_result=False):
+        record = {'key': key}
+        if store_result:
+            record['result'] = result
+        self._pending.append(json.dumps(record, default=str) + '\n')
+        self.completed.add(key)
+
+    def checkpoint(self):
+        """Write and fsync the records made since the last checkpoint."""
+        self._file.write(''.join(self._pending))
+        self._pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
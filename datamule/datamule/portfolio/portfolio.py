@@ -1,35 +1,62 @@
 from pathlib import Path
+import asyncio
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from collections import deque
 from ..submission.submission import Submission
+from ..document.parse_cache import set_parse_cache
 from ..sec.submissions.downloader import download as sec_download
 from ..sec.submissions.textsearch import filter_text
 from ..config import Config
 import os
-import tarfile
-from threading import Lock
 from ..helper import _process_cik_and_metadata_filters
 from ..datamule.downloader import download as seclibrary_download
 from ..sec.xbrl.filter_xbrl import filter_xbrl
 from ..sec.submissions.monitor import Monitor
 from .portfolio_compression_utils_legacy import CompressionManager
+from .portfolio_index import PortfolioIndex, build_selection, metadata_matches
+from .sync_state import SyncState
+from .batch_tar_reader import BatchTarReader
+from .process_pool import _init_worker, _run_submission, _run_document, _load_and_run_document, _chunksize, _Skipped, _unwrap_result
+from .checkpoint import ProcessingJournal
 from ..datamule.sec_connector import SecConnector
-from ..datamule.tar_downloader import download_tar
+from ..datamule.tar_downloader import TarDownloader, download_tar, _has_filter_value
+from ..datamule.archive_lookup import lookup_archive_sgml, lookup_archive_tar
+from ..datamule.lookup_cache import REFRESH_OVERLAP_DAYS
+from ..datamule.downloader import Downloader
+from ..utils.error_journal import ErrorJournal
+from ..utils.format_accession import format_accession
+from ..utils.accession_set import AccessionSet
+from ..utils.zstd_dictionaries import load_portfolio_dictionaries
+from ..utils.instrumentation import metrics
 import shutil
+from datetime import date, timedelta
+import logging
 
+logger = logging.getLogger(__name__)
+
+
+def _iso_date(value):
+    """YYYY-MM-DD for a date given as YYYY-MM-DD or YYYYMMDD."""
+    value = str(value).replace('-', '')[:8]
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
 
 
 class Portfolio:
-    def __init__(self, path):
+    def __init__(self, path, mmap_content=False):
         self.path = Path(path)
         self.api_key = None
         self.submissions = []
         self.submissions_loaded = False
-        self.MAX_WORKERS = os.cpu_count() - 1 
+        self.MAX_WORKERS = max(1, os.cpu_count() - 1)
         
         # Batch tar support
-        self.batch_tar_handles = {}  # {batch_tar_path: tarfile_handle}
-        self.batch_tar_locks = {}    # {batch_tar_path: threading.Lock}
+        self.batch_tar_handles = {}  # {batch_tar_path: BatchTarReader}
+        # If True, batch tar documents are memoryviews over an mmap of the tar rather than bytes copies
+        self.mmap_content = mmap_content
+        # filters added by select(), all must match
+        self._selections = []
 
         self.monitor = Monitor()
         
@@ -40,12 +67,25 @@ class Portfolio:
     def set_api_key(self, api_key):
         self.api_key = api_key
     
+    def set_parse_cache(self, max_size=10*1024*1024*1024):
+        """Cache parsed document data (Document.data, data_tuples) in a .parse_cache directory inside the portfolio."""
+        return set_parse_cache(self.path / '.parse_cache', max_size=max_size)
+
+    def _list_items(self):
+        """Split the portfolio directory into regular submissions and batch tars."""
+        # hidden entries (e.g. .parse_cache) are portfolio sidecars, not submissions
+        regular_items = [f for f in self.path.iterdir() if (f.is_dir() or f.suffix=='.tar') and 'batch' not in f.name and not f.name.startswith('.')]
+        batch_tars = [f for f in self.path.iterdir() if f.is_file() and 'batch' in f.name and f.suffix == '.tar']
+        return regular_items, batch_tars
+
     def _load_submissions(self):
         print(f"Loading submissions")
+
+        # register any trained zstd dictionaries so compressed documents can be read
+        load_portfolio_dictionaries(self.path)
         
         # Separate regular and batch items
-        regular_items = [f for f in self.path.iterdir() if (f.is_dir() or f.suffix=='.tar') and 'batch' not in f.name]
-        batch_tars = [f for f in self.path.iterdir() if f.is_file() and 'batch' in f.name and f.suffix == '.tar']
+        regular_items, batch_tars = self._list_items()
         
         
         # Load regular submissions (existing logic)
@@ -61,104 +101,407 @@ class Portfolio:
                     desc="Loading regular submissions"
                 ))
         
-        # Load batch submissions with parallel processing + progress
+        # Load batch submissions from the on-disk index, rescanning only changed tars
         batch_submissions = []
         if batch_tars:
-            with tqdm(desc="Loading batch submissions", unit="submissions") as pbar:
-                with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
-                    # Submit all batch tar jobs
-                    futures = [
-                        executor.submit(self._load_batch_submissions_worker, batch_tar, pbar) 
-                        for batch_tar in batch_tars
-                    ]
-                    
-                    # Collect results as they complete
-                    for future in as_completed(futures):
-                        batch_submissions.extend(future.result())
+            batch_submissions = self._load_batch_submissions(batch_tars)
         
+        # batch submissions were already filtered by the index
+        regular_submissions = [s for s in regular_submissions if s is not None and self._select_submission(s)]
+
         # Combine and filter None values  
         self.submissions = [s for s in (regular_submissions + batch_submissions) if s is not None]
         print(f"Successfully loaded {len(self.submissions)} submissions")
 
         self.submissions_loaded = True
 
-    def _load_batch_submissions_worker(self, batch_tar_path, pbar):
-        """Worker function to load submissions from one batch tar with progress updates"""
-        # Open tar handle and store it
-        tar_handle = tarfile.open(batch_tar_path, 'r')
-        self.batch_tar_handles[batch_tar_path] = tar_handle
-        self.batch_tar_locks[batch_tar_path] = Lock()
-        
-        # Find all accession directories
-        accession_prefixes = set()
-        for member in tar_handle.getmembers():
-            if '/' in member.name and member.name.endswith('metadata.json'):
-                accession_prefix = member.name.split('/')[0]
-                accession_prefixes.add(accession_prefix)
-        
-        # Create submissions for each accession
-        submissions = []
-        for accession_prefix in accession_prefixes:
+    def _load_batch_submissions(self, batch_tars):
+        """Load batch submissions from the portfolio index, indexing any new or modified tars first."""
+        with PortfolioIndex(self.path) as index:
+            self._refresh_index(index, batch_tars)
+            return list(tqdm(self._iter_batch_submissions(index), desc="Loading batch submissions", unit="submissions"))
+
+    def _refresh_index(self, index, batch_tars):
+        """Index new or modified batch tars, drop deleted ones, and open readers for all of them."""
+        # every reader of batch tars goes through here, so register the portfolio's trained zstd
+        # dictionaries for documents compressed with them
+        load_portfolio_dictionaries(self.path)
+
+        stale_tars = index.stale_tars(batch_tars)
+        if stale_tars:
+            with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+                list(tqdm(
+                    executor.map(index.scan_tar, stale_tars),
+                    total=len(stale_tars),
+                    desc="Indexing batch tars"
+                ))
+        index.prune(batch_tars)
+
+        for batch_tar_path in batch_tars:
+            self._open_batch_tar(batch_tar_path)
+
+    def _iter_batch_submissions(self, index):
+        """Lazily build Submissions from index rows, tar by tar."""
+        for tar_name, accession, metadata, members in index.iter_submissions(selections=self._selections):
+            batch_tar_path = self.path / tar_name
             try:
                 submission = Submission(
                     batch_tar_path=batch_tar_path,
-                    accession=accession_prefix,
-                    portfolio_ref=self
+                    accession=accession,
+                    portfolio_ref=self,
+                    metadata=metadata,
+                    members=members
                 )
-                submissions.append(submission)
+                self._narrow_documents(submission)
+                yield submission
             except Exception as e:
                 print(f"Path: {batch_tar_path}. Exception: {e}")
-                pass
-                #print(f"Path: {batch_tar_path}. Exception: {e}")
-            pbar.update(1)  # Update progress for each successful submission
-        
-        return submissions
+
+    def iter_submissions(self):
+        """
+        Yield submissions one at a time without materializing the portfolio in memory.
+
+        Batch submissions are read from the portfolio index tar by tar and nothing is kept on
+        self.submissions. Iterating the portfolio directly does the same.
+        """
+        if self.submissions_loaded:
+            yield from self.submissions
+            return
+
+        regular_items, batch_tars = self._list_items()
+        for folder in regular_items:
+            try:
+                submission = Submission(folder)
+            except Exception as e:
+                print(f"Path: {folder}. Exception: {e}")
+                continue
+            if self._select_submission(submission):
+                yield submission
+
+        if batch_tars:
+            with PortfolioIndex(self.path) as index:
+                self._refresh_index(index, batch_tars)
+                yield from self._iter_batch_submissions(index)
+
+    def select(self, submission_type=None, filing_date=None, cik=None, ticker=None, document_type=None,
+               contains_xbrl=None, **kwargs):
+        """
+        Return a lazy sub-portfolio of submissions matching the given metadata filters.
+
+        Filters are evaluated against the portfolio index, so only matching submissions are
+        loaded and only their tar members are read by process_submissions/process_documents.
+        document_type also narrows each selected submission to documents of that type.
+        Calling select on a selection intersects the filters.
+        """
+        cik = _process_cik_and_metadata_filters(cik, ticker, **kwargs)
+
+        selection = Portfolio(self.path, mmap_content=self.mmap_content)
+        selection.api_key = self.api_key
+        selection.MAX_WORKERS = self.MAX_WORKERS
+        selection._selections = self._selections + [build_selection(
+            submission_type=submission_type,
+            filing_date=filing_date,
+            cik=cik,
+            document_type=document_type,
+            contains_xbrl=contains_xbrl
+        )]
+        return selection
+
+    def _select_submission(self, submission):
+        """Apply select() filters to a submission loaded outside the index. Returns False if it does not match."""
+        if not all(metadata_matches(submission.metadata.content, selection) for selection in self._selections):
+            return False
+        self._narrow_documents(submission)
+        return True
+
+    def _narrow_documents(self, submission):
+        for selection in self._selections:
+            if selection['document_type'] is not None:
+                submission.metadata.content['documents'] = [
+                    doc for doc in submission.metadata.content['documents']
+                    if doc.get('type') in selection['document_type']
+                ]
+
+    def iter_documents(self, document_type=None, prefetch=None):
+        """
+        Yield documents with at most `prefetch` loaded ahead of the consumer.
+
+        Documents are read by a thread pool in portfolio order (tar by tar), so memory is bounded
+        by the prefetch window rather than the portfolio size. Content is released once the caller
+        drops the document. document_type filters on metadata before any content is read.
+        """
+        if isinstance(document_type, str):
+            document_type = [document_type]
+        if prefetch is None:
+            prefetch = self.MAX_WORKERS * 4
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            try:
+                for submission in self.iter_submissions():
+                    for idx, doc in enumerate(submission.metadata.content['documents']):
+                        if document_type is not None and doc['type'] not in document_type:
+                            continue
+                        pending.append(executor.submit(metrics.timed('portfolio.read')(submission._load_document_by_index), idx))
+
+                        while len(pending) >= prefetch:
+                            document = self._pop_prefetched(pending)
+                            if document is not None:
+                                yield document
+
+                while pending:
+                    document = self._pop_prefetched(pending)
+                    if document is not None:
+                        yield document
+            finally:
+                # consumer stopped early, drop whatever has not started loading
+                for future in pending:
+                    future.cancel()
+
+    def _pop_prefetched(self, pending):
+        future = pending.popleft()
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"Skipped document due to {e}. Possible malformed filing.")
+            return None
+
+    def _open_batch_tar(self, batch_tar_path):
+        """Open a shared, lock-free reader for a batch tar if not already open"""
+        if batch_tar_path not in self.batch_tar_handles:
+            self.batch_tar_handles[batch_tar_path] = BatchTarReader(batch_tar_path)
             
 
-    def decompress(self, max_workers=None):
+    def decompress(self, max_workers=None, output_dir=None, submission_type=None, filing_date=None, cik=None, ticker=None,
+                   document_type=None, contains_xbrl=None, **kwargs):
         """
-        Decompress all batch tar files back to individual submission directories.
+        Decompress batch tar files back to individual submission directories.
+
+        Without filters every submission is written back into the portfolio and the batch tars
+        are removed. With filters (the same as select(), combined with any select() this portfolio
+        came from) only matching submissions are written, to output_dir, and the batch tars are kept.
         """
-        CompressionManager().decompress_portfolio(self, max_workers)
+        selections = list(self._selections)
+        if any(value is not None for value in (submission_type, filing_date, cik, ticker, document_type, contains_xbrl)) or kwargs:
+            cik = _process_cik_and_metadata_filters(cik, ticker, **kwargs)
+            selections.append(build_selection(
+                submission_type=submission_type,
+                filing_date=filing_date,
+                cik=cik,
+                document_type=document_type,
+                contains_xbrl=contains_xbrl
+            ))
+        CompressionManager().decompress_portfolio(self, max_workers, output_dir=output_dir, selections=selections)
 
     def _close_batch_handles(self):
         """Close all open batch tar handles to free resources"""
         for handle in self.batch_tar_handles.values():
             handle.close()
         self.batch_tar_handles.clear()
-        self.batch_tar_locks.clear()
 
     def __del__(self):
         """Cleanup batch tar handles on destruction"""
         self._close_batch_handles()
 
-    def process_submissions(self, callback):
-        """Process all submissions using a thread pool."""
-        if not self.submissions_loaded:
-            self._load_submissions()
-        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
-            results = list(tqdm(
-                executor.map(callback, self.submissions),
-                total=len(self.submissions),
-                desc="Processing submissions"
-            ))
-            return results
+    def process_submissions(self, callback, executor='thread', sink=None):
+        """
+        Process all submissions using a thread pool, or a process pool with executor='process'.
 
-    def process_documents(self, callback):
-        """Process all documents using a thread pool."""
+        In process mode submissions are rebuilt inside the workers from lightweight descriptors,
+        so callback must be picklable (a module level function) and should return picklable results.
+
+        If sink is given (e.g. ParquetSink), each non-None result is written to it as it arrives
+        instead of being collected, and None is returned.
+        """
         if not self.submissions_loaded:
             self._load_submissions()
 
-        documents = [doc for sub in self.submissions for doc in sub]
-        
-        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
-            results = list(tqdm(
-                executor.map(callback, documents),
-                total=len(documents),
-                desc="Processing documents"
-            ))
-            return results
+        if executor == 'thread':
+            with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+                return self._collect_results(
+                    pool.map(metrics.timed('portfolio.callback')(callback), self.submissions),
+                    len(self.submissions), "Processing submissions", sink
+                )
+        elif executor == 'process':
+            descriptors = [sub._get_descriptor() for sub in self.submissions]
+            return self._process_in_pool(_run_submission, callback, descriptors, "Processing submissions", sink)
+        else:
+            raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
+
+    def process_documents(self, callback, executor='thread', sink=None):
+        """
+        Process all documents using a thread pool, or a process pool with executor='process'.
+
+        In process mode only each document's location (batch tar path and member offset, or file path)
+        is sent to the workers, which open their own read handles. callback must be picklable.
+
+        If sink is given, results are written to it as they arrive instead of being collected.
+        """
+        if executor == 'thread':
+            # documents stream in from iter_documents, so only the in-flight window is held in memory
+            with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+                return self._collect_results(
+                    self._map_bounded(pool, metrics.timed('portfolio.callback')(callback), self.iter_documents()),
+                    None, "Processing documents", sink
+                )
+        elif executor == 'process':
+            if not self.submissions_loaded:
+                self._load_submissions()
+            descriptors = [descriptor for sub in self.submissions for descriptor in sub._get_document_descriptors()]
+            # unreadable documents are skipped, as iterating a submission does in thread mode
+            runner = partial(_run_document, skip_unreadable=True)
+            return self._process_in_pool(runner, callback, descriptors, "Processing documents", sink)
+        else:
+            raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
+
+    def _map_bounded(self, pool, fn, items):
+        """Like pool.map, but keeps at most MAX_WORKERS * 4 calls in flight instead of submitting every item upfront."""
+        max_in_flight = self.MAX_WORKERS * 4
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _process_in_pool(self, runner, callback, descriptors, desc, sink=None):
+        """Run callback over descriptors in worker processes, streaming results back in chunks."""
+        with ProcessPoolExecutor(max_workers=self.MAX_WORKERS, initializer=_init_worker, initargs=(self.mmap_content, self.path, metrics.enabled)) as pool:
+            return self._collect_results(
+                pool.map(partial(runner, callback), descriptors, chunksize=_chunksize(len(descriptors), self.MAX_WORKERS)),
+                len(descriptors), desc, sink
+            )
+
+    def _collect_results(self, results, total, desc, sink):
+        results = tqdm(map(_unwrap_result, results), total=total, desc=desc)
+        if sink is None:
+            return [result for result in results if not isinstance(result, _Skipped)]
+
+        for result in results:
+            if result is not None and not isinstance(result, _Skipped):
+                sink.write(result)
+        sink.flush()
     
+    def process_checkpointed(self, callback, job, documents=False, sink=None, store_results=False,
+                             executor='thread', checkpoint_every=1000):
+        """
+        Process submissions (or documents with documents=True) resumably.
+
+        Completed work is recorded in a journal at .jobs/<job>.jsonl inside the portfolio. Rerunning
+        the same job skips everything already journaled, so a crashed job picks up where it left off.
+        Results are not kept in memory: each non-None result is passed to sink.write(result) as it
+        completes, and/or stored in the journal with store_results=True (read back with
+        ProcessingJournal.iter_results). Every checkpoint_every items the sink is checkpointed and
+        only then the journal, so work finished after the last checkpoint may be redone after a
+        crash and sinks should tolerate duplicates. ParquetSink and ArrowSink can only make a shard
+        durable by closing it, so each checkpoint also starts new shards; use a checkpoint_every
+        in line with the sink's batch_size to keep files from getting small.
+
+        Items whose callback raises are logged and recorded in .jobs/<job>.errors.jsonl, which
+        is reset at the start of each run; see checkpoint_failures. They are left out of the
+        journal, so rerunning the job retries them.
+
+        Returns the number of submissions or documents processed successfully in this run.
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
+
+        journal = ProcessingJournal(self.path / '.jobs' / f'{job}.jsonl')
+        errors = self._job_errors(job)
+        errors.discard_before(errors.size())
+        failed = 0
+        max_in_flight = self.MAX_WORKERS * 4
+        processed = 0
+
+        if executor == 'thread':
+            pool = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        else:
+            pool = ProcessPoolExecutor(max_workers=self.MAX_WORKERS, initializer=_init_worker, initargs=(self.mmap_content, self.path, metrics.enabled))
+
+        def submit_pending():
+            for submission in self.iter_submissions():
+                if not documents:
+                    if submission.accession in journal.completed:
+                        continue
+                    if executor == 'thread':
+                        yield submission.accession, pool.submit(callback, submission)
+                    else:
+                        yield submission.accession, pool.submit(_run_submission, callback, submission._get_descriptor())
+                elif executor == 'thread':
+                    for idx, doc in enumerate(submission.metadata.content['documents']):
+                        key = f"{submission.accession}/{doc.get('filename') or doc['sequence'] + '.txt'}"
+                        if key not in journal.completed:
+                            yield key, pool.submit(_load_and_run_document, callback, submission, idx)
+                else:
+                    for descriptor in submission._get_document_descriptors():
+                        key = f"{descriptor['accession']}/{descriptor['filename']}"
+                        if key not in journal.completed:
+                            yield key, pool.submit(_run_document, callback, descriptor)
+
+        def complete(key, future):
+            nonlocal failed
+            try:
+                result = _unwrap_result(future.result())
+            except Exception as e:
+                # left out of the journal so the next run retries it
+                logger.error(f"Failed: {key} due to {e}")
+                errors.record(key, e, job=job, exception=type(e).__name__)
+                failed += 1
+                return False
+            if result is not None and sink is not None:
+                sink.write(result)
+            journal.record(key, result, store_result=store_results)
+            return True
+
+        pending = deque()
+        try:
+            with tqdm(desc=f"Processing {job}", initial=len(journal.completed)) as pbar:
+                for key, future in submit_pending():
+                    pending.append((key, future))
+                    while len(pending) >= max_in_flight:
+                        if complete(*pending.popleft()):
+                            processed += 1
+                            if processed % checkpoint_every == 0:
+                                self._checkpoint(journal, sink)
+                        pbar.update(1)
+
+                while pending:
+                    if complete(*pending.popleft()):
+                        processed += 1
+                        if processed % checkpoint_every == 0:
+                            self._checkpoint(journal, sink)
+                    pbar.update(1)
+        finally:
+            for _, future in pending:
+                future.cancel()
+            pool.shutdown()
+            self._checkpoint(journal, sink)
+            journal.close()
+
+        if failed:
+            logger.warning(f"{job}: {failed} items failed and will be retried on the next run, see {errors.path}")
+        return processed
+
+    def _job_errors(self, job):
+        return ErrorJournal(self.path / '.jobs', filename=f'{job}.errors.jsonl')
+
+    def checkpoint_failures(self, job):
+        """{key: error entry} for items that failed in the last process_checkpointed run of job."""
+        return self._job_errors(job).failed()
+
+    def _checkpoint(self, journal, sink):
+        """Make sink output durable before journaling work as done."""
+        if sink is not None and hasattr(sink, 'checkpoint'):
+            sink.checkpoint()
+        elif sink is not None and hasattr(sink, 'flush'):
+            sink.flush()
+        journal.checkpoint()
+
     def filter_text(self, text_query, cik=None, ticker=None, submission_type=None, filing_date=None, **kwargs):
         """
         Filter text based on query and various parameters.
@@ -203,10 +546,24 @@ class Portfolio:
             # First query, just set the accession numbers
             self.accession_numbers = new_accession_numbers
 
+    def _existing_accessions(self):
+        """AccessionSet of the portfolio's submissions, read from folder names and the batch tar index rather than by loading them."""
+        regular_items, batch_tars = self._list_items()
+        accessions = AccessionSet(item.stem for item in regular_items)
+        if batch_tars:
+            with PortfolioIndex(self.path) as index:
+                self._refresh_index(index, batch_tars)
+                accessions.update(index.accessions())
+        return accessions
+
     def download_submissions(self, cik=None, ticker=None, submission_type=None, filing_date=None, provider=None, document_type=[],
                          requests_per_second=5, skip_existing=True,
                          accession_numbers=None, report_date=None, detected_time=None, contains_xbrl=None, sequence=None,
-                         quiet=False, filename=None, **kwargs):
+                         quiet=False, filename=None, keep_compressed=False, **kwargs):
+        """
+        Download submissions into the portfolio. With the datamule-tar provider,
+        keep_compressed=True stores documents zstd-compressed and decompresses them on access.
+        """
 
         if provider is None:
             config = Config()
@@ -216,7 +573,7 @@ class Portfolio:
 
         skip_accession_numbers = []
         if skip_existing:
-            skip_accession_numbers = [sub.accession for sub in self]
+            skip_accession_numbers = self._existing_accessions()
 
         # map legacy provider
         if provider == 'datamule':
@@ -263,6 +620,7 @@ class Portfolio:
                 api_key=self.api_key,
                 keep_document_types=document_type,
                 quiet=quiet,
+                keep_compressed=keep_compressed,
                 **kwargs
             )
             
@@ -282,6 +640,139 @@ class Portfolio:
 
         self.submissions_loaded = False
         
+    def retry_failed(self):
+        """
+        Re-download the submissions recorded as failed in the portfolio's error journal (errors.jsonl).
+
+        Downloads are re-driven from the recorded urls and filters, without repeating the archive
+        lookup, and submissions that have reached the portfolio since are skipped. Entries from
+        before the retry are dropped once it finishes; whatever still fails is recorded again.
+        """
+        journal = ErrorJournal(self.path)
+        offset = journal.size()
+        existing = self._existing_accessions()
+
+        tar_batches = {}
+        sgml_batches = {}
+        for entry in journal.failed().values():
+            if not entry.get('url') or not entry.get('accession'):
+                continue
+            if entry['accession'] in existing:
+                continue
+            keep_document_types = tuple(entry.get('keep_document_types') or [])
+            if entry.get('source') == 'datamule-tar':
+                tar_batches.setdefault((keep_document_types, bool(entry.get('keep_compressed'))), []).append({
+                    'url': entry['url'],
+                    'accession': entry['accession'],
+                    'wanted_filenames': set(entry['wanted_filenames']) if entry.get('wanted_filenames') else None,
+                })
+            elif entry.get('source') == 'datamule-sgml':
+                sgml_batches.setdefault(keep_document_types, []).append(entry['url'])
+
+        total = sum(len(specs) for specs in tar_batches.values()) + sum(len(urls) for urls in sgml_batches.values())
+        if not total:
+            print("No failed downloads to retry")
+            return
+        tar_downloader = TarDownloader(api_key=self.api_key)
+        if tar_downloader.api_key is None:
+            raise ValueError("No API key found. Please set DATAMULE_API_KEY environment variable or provide api_key in constructor")
+        print(f"Retrying {total} failed downloads")
+
+        for (keep_document_types, keep_compressed), specs in tar_batches.items():
+            asyncio.run(tar_downloader.process_batch(
+                specs, self.path, keep_document_types=list(keep_document_types), keep_compressed=keep_compressed
+            ))
+        if sgml_batches:
+            downloader = Downloader(api_key=self.api_key)
+            for keep_document_types, urls in sgml_batches.items():
+                asyncio.run(downloader.process_batch(urls, self.path, keep_document_types=list(keep_document_types)))
+
+        journal.discard_before(offset)
+        self.submissions_loaded = False
+
+    def sync(self, cik=None, ticker=None, submission_type=None, document_type=[], filename=None, sequence=None,
+             contains_xbrl=None, start_date=None, quiet=False, keep_compressed=False, **kwargs):
+        """
+        Download the filings matching the filters that are new since the last sync with the same filters.
+
+        Each set of filters keeps a filing date watermark in the portfolio's .sync sidecar, and only
+        filings from a few days before it on are looked up (from start_date, or all of them, on the
+        first sync). The portfolio's accessions are kept there too, as a compact set updated from
+        the batch tars written since the last sync, so skipping what the portfolio already holds
+        doesn't load any submissions. New filings are appended to the batch tars via datamule-tar.
+        """
+        state = SyncState(self.path)
+        accessions = self._sync_accessions(state)
+
+        filters = dict(cik=cik, ticker=ticker, submission_type=submission_type, contains_xbrl=contains_xbrl,
+                       document_type=document_type, filename=filename, sequence=sequence, **kwargs)
+        key = state.key(filters)
+        watermark = state.watermarks.get(key)
+        if watermark is not None:
+            start_date = (date.fromisoformat(watermark) - timedelta(days=REFRESH_OVERLAP_DAYS)).isoformat()
+        filing_date = (start_date, date.today().isoformat()) if start_date is not None else None
+
+        document_mode = _has_filter_value(document_type) or _has_filter_value(filename) or _has_filter_value(sequence)
+        lookup_fn = lookup_archive_tar if document_mode else lookup_archive_sgml
+        records = lookup_fn(
+            filing_date=filing_date,
+            filtered_accession_numbers=self.accession_numbers if hasattr(self, 'accession_numbers') else None,
+            skip_accession_numbers=accessions,
+            quiet=quiet,
+            api_key=self.api_key,
+            **filters
+        )
+
+        journal = ErrorJournal(self.path)
+        offset = journal.size()
+        if records:
+            TarDownloader(api_key=self.api_key).download(
+                archive_records=records,
+                output_dir=self.path,
+                keep_document_types=document_type,
+                keep_compressed=keep_compressed
+            )
+            self.submissions_loaded = False
+
+        failed = {format_accession(entry['accession'], 'int') for entry in journal.entries(offset) if entry.get('accession')}
+        filing_dates = {}
+        for accession, filing_date in zip(records.column('accession'), records.column('filing_date')):
+            filing_dates[format_accession(accession, 'int')] = _iso_date(filing_date) if filing_date else None
+
+        accessions.update(accession for accession in filing_dates if accession not in failed)
+        state.record_tars(self._list_items()[1])
+
+        # stop the watermark short of anything that failed, so the next sync picks it up again
+        failed_dates = [filing_dates[accession] for accession in failed if accession in filing_dates]
+        seen_dates = [filing_date for filing_date in filing_dates.values() if filing_date]
+        if failed_dates:
+            watermark = min(failed_dates)
+        elif seen_dates:
+            watermark = max([*seen_dates, watermark] if watermark else seen_dates)
+        if watermark is not None:
+            state.watermarks[key] = watermark
+        state.save()
+
+        if not quiet:
+            print(f"Synced {len(filing_dates) - len(failed & filing_dates.keys())} new submissions"
+                  f"{f', {len(failed)} failed (see retry_failed)' if failed else ''}")
+
+    def _sync_accessions(self, state):
+        """The state's accession set, brought up to date with batch tars and folders added since it was saved."""
+        regular_items, batch_tars = self._list_items()
+        if state.accessions is None:
+            state.accessions = AccessionSet()
+            changed = batch_tars
+        else:
+            changed = state.changed_tars(batch_tars)
+
+        if changed:
+            with PortfolioIndex(self.path) as index:
+                self._refresh_index(index, batch_tars)
+                state.accessions.update(index.accessions([Path(tar).name for tar in changed]))
+        state.accessions.update(item.stem for item in regular_items)
+        return state.accessions
+
     def monitor_submissions(self, data_callback=None, interval_callback=None,
                             polling_interval=1000, quiet=True, start_date=None,
                             validation_interval=600000):
@@ -303,9 +794,7 @@ class Portfolio:
 
         
     def __iter__(self):
-        if not self.submissions_loaded:
-            self._load_submissions()
-        return iter(self.submissions)
+        return self.iter_submissions()
     
     def document_type(self, document_types):
         """Filter documents by type(s)."""
@@ -322,4 +811,4 @@ class Portfolio:
         shutil.rmtree(self.path)
 
         # reinit
-        self.__dict__.update(Portfolio(self.path).__dict__)
+        self.__dict__.update(Portfolio(self.path, mmap_content=self.mmap_content).__dict__)
@@ -2,21 +2,45 @@ import json
 import io
 import gzip
 import zstandard as zstd
+import os
 import tarfile
 import shutil
+from pathlib import Path
+from collections import deque
+from itertools import islice
+from queue import Queue
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
 from secsgml2.utils import calculate_documents_locations_in_tar
+from .portfolio_index import PortfolioIndex, member_data_offset
+from ..utils.compression import decompress_document, open_decompressed, split_compression_suffix
+from ..utils.sharding import ShardBalancer
+from ..utils.zstd_dictionaries import DictionaryStore, DICTIONARY_DIRNAME, DEFAULT_DICTIONARY_SIZE, train_dictionaries, load_portfolio_dictionaries
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+# compressed members larger than this are decompressed as a stream rather than in one buffer
+STREAM_THRESHOLD = 16 * 1024 * 1024
 
 # probably can delete much of this TODO
 
 
 class CompressionManager:
     
-    def compress_portfolio(self, portfolio, compression=None, compression_level=None, threshold=1048576, max_batch_size=1024*1024*1024, max_workers=None):
+    def compress_portfolio(self, portfolio, compression=None, compression_level=None, threshold=1048576, max_batch_size=1024*1024*1024, max_workers=None,
+                           train_dictionaries=False, dictionary_size=DEFAULT_DICTIONARY_SIZE, dictionary_samples=1000,
+                           num_shards=4, queue_size=64):
         """
         Compress all individual submissions into batch tar files.
+
+        Submissions are read and compressed by a pool of max_workers threads and handed, in
+        submission order, to num_shards writer threads through bounded queues. Each submission's
+        shard is chosen by ShardBalancer from its accession and the shard loads so far, so the
+        same portfolio compressed with the same num_shards gives the same
+        batch_{shard:03d}_{sequence:03d}.tar files. Sequences continue after any batch
+        tars already in the portfolio. A shard is written to a .tmp file and fsynced before it is
+        renamed into place and indexed, and only then are the originals it holds deleted, so an
+        interrupted run never loses a submission.
         
         Args:
             portfolio: Portfolio instance
@@ -24,10 +48,18 @@ class CompressionManager:
             compression_level: Compression level, if None uses defaults (gzip=6, zstd=3)
             threshold: Size threshold for compressing individual documents (default: 1MB)
             max_batch_size: Maximum size per batch tar file (default: 1GB)
-            max_workers: Number of threads for parallel document processing (default: portfolio.MAX_WORKERS)
+            max_workers: Number of threads reading and compressing submissions (default: portfolio.MAX_WORKERS)
+            train_dictionaries: With zstd, train a dictionary per document type from up to
+                dictionary_samples documents of that type and store it in the portfolio's
+                .zstd_dictionaries directory. Documents of a type with a dictionary are compressed
+                with it regardless of threshold.
+            dictionary_size: Size in bytes of each trained dictionary
+            num_shards: Number of batch tars written in parallel (default: 4)
+            queue_size: Maximum number of compressed submissions waiting for each writer (default: 64)
         """
         if max_workers is None:
             max_workers = portfolio.MAX_WORKERS
+        max_workers = max(1, max_workers)
 
         portfolio._close_batch_handles()
             
@@ -36,6 +68,13 @@ class CompressionManager:
         
         # Only compress non-batch submissions
         submissions = [s for s in portfolio.submissions if s.batch_tar_path is None]
+
+        # left over from an interrupted run that stored them but didn't get to delete the originals
+        batched = {s.accession for s in portfolio.submissions if s.batch_tar_path is not None}
+        already_batched = [s for s in submissions if s.accession in batched]
+        if already_batched:
+            print(f"Skipping {len(already_batched)} submissions already stored in batch tars")
+            submissions = [s for s in submissions if s.accession not in batched]
         
         if not submissions:
             print("No submissions to compress")
@@ -46,69 +85,56 @@ class CompressionManager:
         # Set default compression level if not specified
         if compression_level is None:
             compression_level = 6 if compression == 'gzip' else 3
-        
-        # Group submissions into batches
-        current_batch = 0
-        current_size = 0
-        sequence = 1
-        current_tar = None
+
+        dictionaries = None
+        if compression == 'zstd':
+            dictionaries = DictionaryStore(portfolio.path / DICTIONARY_DIRNAME)
+            if train_dictionaries:
+                self._train_dictionaries(dictionaries, submissions, dictionary_size, dictionary_samples, compression_level)
+
+        def prepare(submission):
+            documents = []
+            compression_list = []
+            for doc in submission:
+                dictionary = dictionaries.for_type(doc.type) if dictionaries is not None else None
+                content, compression_type = self._process_document(doc, compression, threshold, compression_level, dictionary)
+                documents.append(content)
+                compression_list.append(compression_type)
+            return submission, documents, compression_list
+
+        balancer = ShardBalancer(num_shards)
+        index = PortfolioIndex(portfolio.path)
+        pbar_lock = Lock()
         
         with tqdm(total=len(submissions), desc="Compressing submissions") as pbar:
-            for submission in submissions:
-                # Parallel document processing
+            writers = [
+                _ShardWriter(self, portfolio.path, shard, max_batch_size, index, queue_size, pbar, pbar_lock)
+                for shard in range(num_shards)
+            ]
+            try:
                 with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    doc_futures = [
-                        executor.submit(self._process_document, doc, compression, threshold, compression_level)
-                        for doc in submission
-                    ]
-                    
-                    # Collect results maintaining order
-                    documents = []
-                    compression_list = []
-                    for future in doc_futures:
-                        content, compression_type = future.result()
-                        documents.append(content)
-                        compression_list.append(compression_type)
-                
-                # Calculate submission size
-                submission_size = len(submission.metadata.content) + sum(len(doc) for doc in documents)
-                
-                # Check if we need a new batch tar
-                if current_size > 0 and current_size + submission_size > max_batch_size:
-                    if current_tar:
-                        current_tar.close()
-                    sequence += 1
-                    current_size = 0
-                    current_tar = None
-                
-                # Create tar if needed
-                if current_tar is None:
-                    batch_path = portfolio.path / f'batch_{current_batch:03d}_{sequence:03d}.tar'
-                    current_tar = tarfile.open(batch_path, 'w')
-                
-                # Write submission to tar
-                self._write_submission_to_tar(
-                    current_tar, 
-                    submission, 
-                    documents, 
-                    compression_list,
-                    submission.accession
-                )
-                
-                current_size += submission_size
-                
-                # Remove original submission directory/tar
-                if submission.path:
-                    if submission.path.is_dir():
-                        shutil.rmtree(submission.path)
-                    elif submission.path.suffix == '.tar':
-                        submission.path.unlink()
-                
-                pbar.update(1)
-        
-        # Close final tar
-        if current_tar:
-            current_tar.close()
+                    # bounded read-ahead; results are consumed in submission order so shard assignment is reproducible
+                    pending = deque()
+                    submission_iter = iter(submissions)
+                    for submission in islice(submission_iter, max_workers * 2):
+                        pending.append(executor.submit(prepare, submission))
+
+                    while pending:
+                        submission, documents, compression_list = pending.popleft().result()
+                        for next_submission in islice(submission_iter, 1):
+                            pending.append(executor.submit(prepare, next_submission))
+
+                        submission_size = len(json.dumps(submission.metadata.content)) + sum(len(doc) for doc in documents)
+                        shard = balancer.assign(submission.accession, submission_size)
+                        writers[shard].put((submission, documents, compression_list, submission_size))
+            finally:
+                for writer in writers:
+                    writer.close()
+                index.close()
+
+        errors = [writer.error for writer in writers if writer.error is not None]
+        if errors:
+            raise errors[0]
         
         # Reload submissions to reflect new batch structure
         portfolio.submissions_loaded = False
@@ -116,171 +142,164 @@ class CompressionManager:
         
         print("Compression complete.")
 
-    def decompress_portfolio(self, portfolio, max_workers=None):
+    def decompress_portfolio(self, portfolio, max_workers=None, output_dir=None, selections=None):
         """
-        Decompress all batch tar files back to individual submission directories.
-        
+        Write submissions stored in batch tars out as individual submission directories.
+
+        Members are read straight from the tars at their indexed offsets and decompressed and
+        written by a pool of threads spanning all tars, with large buffered writes.
+
         Args:
             portfolio: Portfolio instance
-            max_workers: Number of threads for parallel file processing (default: portfolio.MAX_WORKERS)
+            max_workers: Number of threads extracting submissions (default: portfolio.MAX_WORKERS)
+            output_dir: Directory to write submissions to. Defaults to the portfolio itself, in which
+                case the batch tars are deleted once everything was extracted.
+            selections: build_selection() dicts that must all match; only matching submissions (and,
+                with document_type, only documents of those types) are extracted. The batch tars
+                are kept, so output_dir is required.
         """
-        # Find all batch tar files
-        batch_tars = [f for f in portfolio.path.iterdir() if f.is_file() and 'batch' in f.name and f.suffix == '.tar']
-        
+        selections = selections or []
+        in_place = output_dir is None or Path(output_dir).resolve() == portfolio.path.resolve()
+        if selections and in_place:
+            raise ValueError("Selective decompression keeps the batch tars, so it needs a separate output_dir")
+        output_path = portfolio.path if output_dir is None else Path(output_dir)
+
+        batch_tars = portfolio._list_items()[1]
         if not batch_tars:
             print("No batch tar files found to decompress")
             return
 
         if max_workers is None:
-            max_workers = min(portfolio.MAX_WORKERS, 4)
+            max_workers = portfolio.MAX_WORKERS
         max_workers = max(1, max_workers)
-        tar_workers = min(max_workers, len(batch_tars))
-        
-        print(f"Decompressing {len(batch_tars)} batch tar files with {tar_workers} workers...")
-        
-        # FIRST: Close all batch tar handles to free the files
-        portfolio._close_batch_handles()
-        
+
+        print(f"Decompressing {len(batch_tars)} batch tar files with {max_workers} workers...")
+
+        # register dictionaries before any zstd member is read
+        load_portfolio_dictionaries(portfolio.path)
+        output_path.mkdir(parents=True, exist_ok=True)
+
         total_extracted = 0
-        completed_tars = []
-        pbar_lock = Lock()
-        
-        with tqdm(desc="Extracting files", unit="files") as pbar:
-            with ThreadPoolExecutor(max_workers=tar_workers) as executor:
-                futures = [
-                    executor.submit(
-                        self._decompress_batch_tar,
-                        batch_tar,
-                        portfolio.path,
-                        max_workers,
-                        pbar,
-                        pbar_lock
+        with PortfolioIndex(portfolio.path) as index:
+            portfolio._refresh_index(index, batch_tars)
+            rows = index.iter_submissions(selections=selections)
+
+            with tqdm(desc="Extracting submissions", unit="submissions") as pbar:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    # bounded read-ahead so huge portfolios don't queue every row up front
+                    pending = deque(
+                        executor.submit(self._extract_submission, portfolio, row, output_path, selections)
+                        for row in islice(rows, max_workers * 4)
                     )
-                    for batch_tar in batch_tars
-                ]
-
-                for future in as_completed(futures):
-                    batch_tar, extracted_count = future.result()
-                    completed_tars.append(batch_tar)
-                    total_extracted += extracted_count
-                    
-        
-        # NOW delete the batch tar files after everything is extracted
-        for batch_tar in completed_tars:
-            batch_tar.unlink()
+                    while pending:
+                        pending.popleft().result()
+                        total_extracted += 1
+                        pbar.update(1)
+                        for row in islice(rows, 1):
+                            pending.append(executor.submit(self._extract_submission, portfolio, row, output_path, selections))
+
+            portfolio._close_batch_handles()
+            if in_place:
+                # everything is on disk as plain files now
+                for batch_tar in batch_tars:
+                    batch_tar.unlink()
+                index.prune([])
 
-        
         # Leave submissions lazy; the next iterator/processor call will load the new directory structure.
         portfolio.submissions = []
         portfolio.submissions_loaded = False
         
         print(f"Decompression complete. Extracted {total_extracted} submissions.")
 
-    def _decompress_batch_tar(self, batch_tar, output_path, max_workers, pbar, pbar_lock):
-        """Extract one batch tar and post-process extracted files."""
-        with tarfile.open(batch_tar, 'r') as tar:
-            accession_files = {}
-            compressed_paths = []
-            for member in tar.getmembers():
-                if '/' not in member.name or not member.isfile():
-                    continue
-                self._validate_tar_member(member)
-                accession_dir = member.name.split('/')[0]
-                accession_files.setdefault(accession_dir, []).append(member)
-                if member.name.endswith(('.gz', '.zst')):
-                    compressed_paths.append(output_path / member.name)
-
-            with pbar_lock:
-                pbar.total = (pbar.total or 0) + sum(len(members) for members in accession_files.values())
-                pbar.refresh()
-
-            for members in accession_files.values():
-                for member in members:
-                    tar.extract(member, output_path)
-                    with pbar_lock:
-                        pbar.update(1)
+    def _extract_submission(self, portfolio, row, output_path, selections):
+        """Write one indexed submission to output_path/accession, decompressing its documents."""
+        tar_name, accession, metadata, members = row
+        reader = portfolio.batch_tar_handles[portfolio.path / tar_name]
+        self._validate_member_name(accession)
 
-        metadata_paths = [
-            output_path / accession_dir / 'metadata.json'
-            for accession_dir in accession_files
-        ]
+        documents = metadata.get('documents', [])
+        for selection in selections:
+            if selection['document_type'] is not None:
+                documents = [doc for doc in documents if doc.get('type') in selection['document_type']]
 
-        postprocess_workers = min(max_workers, 4)
-        with ThreadPoolExecutor(max_workers=postprocess_workers) as executor:
-            futures = [
-                executor.submit(self._decompress_extracted_file, path)
-                for path in compressed_paths
-            ]
-            futures.extend(
-                executor.submit(self._postprocess_metadata_file, path)
-                for path in metadata_paths
-            )
-            for future in as_completed(futures):
-                future.result()
+        submission_path = output_path / accession
+        submission_path.mkdir(parents=True, exist_ok=True)
 
-        return batch_tar, len(accession_files)
+        for doc in documents:
+            # tar offsets are meaningless outside the batch tar
+            doc.pop('secsgml_start_byte', None)
+            doc.pop('secsgml_end_byte', None)
+
+            stored_name = doc.get('filename', doc['sequence'] + '.txt')
+            self._validate_member_name(stored_name)
+            filename, compression = split_compression_suffix(stored_name)
+            if 'filename' in doc:
+                doc['filename'] = filename
+
+            location = members.get(stored_name)
+            if location is None:
+                location = reader.locate(f'{accession}/{stored_name}')
+
+            with reader.view(*location) as view, open(submission_path / filename, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                if compression and location[1] <= STREAM_THRESHOLD:
+                    f.write(decompress_document(view, compression))
+                elif compression:
+                    with open_decompressed(view, compression) as stream:
+                        shutil.copyfileobj(stream, f, WRITE_BUFFER_SIZE)
+                else:
+                    f.write(view)
+
+        metadata['documents'] = documents
+        with (submission_path / 'metadata.json').open('w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2)
 
-    def _process_document(self, doc, compression, threshold, compression_level):
+    def _train_dictionaries(self, store, submissions, dictionary_size, max_samples, compression_level):
+        """Train dictionaries for document types that don't have one yet, from the first max_samples documents of each."""
+        samples_by_type = {}
+        for submission in tqdm(submissions, desc="Sampling documents for zstd dictionaries"):
+            for doc in submission:
+                if store.for_type(doc.type) is not None:
+                    continue
+                samples = samples_by_type.setdefault(doc.type, [])
+                if len(samples) >= max_samples:
+                    continue
+                content = doc.content
+                samples.append(content.encode('utf-8') if isinstance(content, str) else bytes(content))
+
+        dictionaries = train_dictionaries(samples_by_type, dict_size=dictionary_size, level=compression_level)
+        if dictionaries:
+            store.save(dictionaries)
+        print(f"Trained zstd dictionaries for {len(dictionaries)} document types")
+
+    def _process_document(self, doc, compression, threshold, compression_level, dictionary=None):
         """Process a single document: load content and apply compression if needed."""
         content = doc.content
         if isinstance(content, str):
             content = content.encode('utf-8')
         
-        # Apply document-level compression if threshold met AND compression is specified
-        if compression and len(content) >= threshold:
+        # Apply document-level compression if threshold met (or a dictionary for the type exists) AND compression is specified
+        compression_type = ''
+        if compression and (len(content) >= threshold or dictionary is not None):
             if compression == 'gzip':
-                content = gzip.compress(content, compresslevel=compression_level)
+                compressed = gzip.compress(content, compresslevel=compression_level)
                 compression_type = 'gzip'
             elif compression == 'zstd':
-                content = zstd.ZstdCompressor(level=compression_level).compress(content)
+                compressed = zstd.ZstdCompressor(level=compression_level, dict_data=dictionary).compress(content)
                 compression_type = 'zstd'
+
+            # keep tiny documents that don't shrink as they are
+            if compression_type and len(compressed) < len(content):
+                content = compressed
             else:
                 compression_type = ''
-        else:
-            compression_type = ''
         
         return content, compression_type
 
-    def _validate_tar_member(self, member):
-        """Reject tar members that would extract outside the portfolio directory."""
-        parts = member.name.replace('\\', '/').split('/')
-        if member.name.startswith(('/', '\\')) or '..' in parts:
-            raise ValueError(f"Unsafe tar member path: {member.name}")
-
-    def _decompress_extracted_file(self, path):
-        """Decompress an already extracted legacy-compressed document."""
-        if path.suffix == '.gz':
-            content = gzip.decompress(path.read_bytes())
-        elif path.suffix == '.zst':
-            content = zstd.ZstdDecompressor().decompress(path.read_bytes())
-        else:
-            return
-
-        output_path = path.with_suffix('')
-        output_path.write_bytes(content)
-        path.unlink()
-
-    def _postprocess_metadata_file(self, metadata_path):
-        """Remove tar-specific offsets and align filenames after decompression."""
-        if not metadata_path.exists():
-            return
-
-        with metadata_path.open('r', encoding='utf-8') as f:
-            metadata = json.load(f)
-
-        for doc in metadata.get('documents', []):
-            doc.pop('secsgml_start_byte', None)
-            doc.pop('secsgml_end_byte', None)
-
-            filename = doc.get('filename', '')
-            if filename.endswith('.gz'):
-                doc['filename'] = filename[:-3]
-            elif filename.endswith('.zst'):
-                doc['filename'] = filename[:-4]
-
-        with metadata_path.open('w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2)
-                
+    def _validate_member_name(self, name):
+        """Reject member names that would extract outside the submission directory."""
+        parts = name.replace('\\', '/').split('/')
+        if name.startswith(('/', '\\')) or '..' in parts:
+            raise ValueError(f"Unsafe tar member path: {name}")
 
     def _write_submission_to_tar(self, tar_handle, submission, documents, compression_list, accession_prefix):
         """Write a submission to a tar file with optional document compression."""
@@ -303,11 +322,13 @@ class CompressionManager:
         
         # NOW calculate document positions with the correct filenames
         metadata = calculate_documents_locations_in_tar(metadata)
-        
+        metadata_json = json.dumps(metadata).encode('utf-8')
+        members = {}
         
         tarinfo = tarfile.TarInfo(name=f'{accession_prefix}/metadata.json')
-        tarinfo.size = len(metadata)
-        tar_handle.addfile(tarinfo, io.BytesIO(metadata))
+        tarinfo.size = len(metadata_json)
+        tar_handle.addfile(tarinfo, io.BytesIO(metadata_json))
+        members['metadata.json'] = (member_data_offset(tar_handle, tarinfo.size), tarinfo.size)
         
         # Write documents
         for i, content in enumerate(documents):
@@ -317,3 +338,144 @@ class CompressionManager:
             tarinfo = tarfile.TarInfo(name=f'{accession_prefix}/{filename}')
             tarinfo.size = len(content)
             tar_handle.addfile(tarinfo, io.BytesIO(content))
+            members[filename] = (member_data_offset(tar_handle, tarinfo.size), tarinfo.size)
+
+        # Portfolio index entry for this submission
+        return {'accession': accession_prefix, 'metadata': metadata, 'members': members}
+
+
+class _ShardWriter:
+    """
+    Writes the submissions of one shard into batch tars on its own thread.
+
+    Each tar is built as a .tmp file and, once full or at the end, fsynced, renamed into place
+    and indexed. The original submissions are deleted only after that.
+    """
+
+    def __init__(self, manager, portfolio_path, shard, max_batch_size, index, queue_size, pbar, pbar_lock):
+        self.manager = manager
+        self.portfolio_path = portfolio_path
+        self.shard = shard
+        self.max_batch_size = max_batch_size
+        self.index = index
+        self.pbar = pbar
+        self.pbar_lock = pbar_lock
+        self.error = None
+        self.sequence = self._last_sequence()
+
+        self.tar = None
+        self.file = None
+        self.size = 0
+        self.index_entries = []
+        self.written = []
+
+        self.queue = Queue(maxsize=queue_size)
+        self.thread = Thread(target=self._run, name=f"shard-writer-{shard}", daemon=True)
+        self.thread.start()
+
+    def _batch_path(self, sequence):
+        return self.portfolio_path / f'batch_{self.shard:03d}_{sequence:03d}.tar'
+
+    def _last_sequence(self):
+        sequence = 0
+        while self._batch_path(sequence + 1).exists():
+            sequence += 1
+        return sequence
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            # after a failure keep draining so the producer never blocks on a full queue
+            if self.error is not None:
+                continue
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.error = e
+
+        try:
+            if self.error is None:
+                self._finish_tar()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._discard_tar()
+
+    def _write(self, submission, documents, compression_list, submission_size):
+        if self.tar is not None and self.size > 0 and self.size + submission_size > self.max_batch_size:
+            self._finish_tar()
+
+        if self.tar is None:
+            self.sequence += 1
+            self.file = open(self._tmp_path(), 'wb')
+            self.tar = tarfile.open(fileobj=self.file, mode='w')
+
+        self.index_entries.append(self.manager._write_submission_to_tar(
+            self.tar, submission, documents, compression_list, submission.accession
+        ))
+        self.written.append(submission)
+        self.size += submission_size
+
+        with self.pbar_lock:
+            self.pbar.update(1)
+
+    def _tmp_path(self):
+        path = self._batch_path(self.sequence)
+        return path.with_name(path.name + '.tmp')
+
+    def _finish_tar(self):
+        if self.tar is None:
+            return
+        self.tar.close()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.tar = self.file = None
+
+        batch_path = self._batch_path(self.sequence)
+        os.replace(self._tmp_path(), batch_path)
+        _fsync_directory(self.portfolio_path)
+        self.index.replace_tar(batch_path, self.index_entries)
+
+        # the submissions are durable in the batch tar now, so the originals can go
+        for submission in self.written:
+            if submission.path:
+                if submission.path.is_dir():
+                    shutil.rmtree(submission.path)
+                elif submission.path.suffix == '.tar':
+                    submission.path.unlink()
+
+        self.size = 0
+        self.index_entries = []
+        self.written = []
+
+    def _discard_tar(self):
+        """Remove a partially written tar after a failure; its originals are untouched."""
+        if self.tar is None:
+            return
+        self.file.close()
+        self.tar = self.file = None
+        self._tmp_path().unlink(missing_ok=True)
+
+
+def _fsync_directory(path):
+    # makes the rename durable; directories can't be opened for fsync on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,391 @@
+import json
+import os
+import sqlite3
+import tarfile
+from pathlib import Path
+from threading import Lock
+from ..utils.compression import split_compression_suffix
+
+INDEX_FILENAME = 'portfolio_index.db'
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tars (
+    name TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    tar_name TEXT,
+    accession TEXT,
+    submission_type TEXT,
+    filing_date TEXT,
+    contains_xbrl INTEGER,
+    metadata TEXT,
+    members TEXT,
+    PRIMARY KEY (tar_name, accession)
+);
+CREATE TABLE IF NOT EXISTS submission_ciks (
+    tar_name TEXT,
+    accession TEXT,
+    cik INTEGER
+);
+CREATE TABLE IF NOT EXISTS documents (
+    tar_name TEXT,
+    accession TEXT,
+    document_type TEXT,
+    filename TEXT
+);
+CREATE INDEX IF NOT EXISTS submission_ciks_tar ON submission_ciks (tar_name, accession);
+CREATE INDEX IF NOT EXISTS documents_tar ON documents (tar_name, accession);
+CREATE INDEX IF NOT EXISTS submissions_type ON submissions (submission_type);
+CREATE INDEX IF NOT EXISTS submissions_filing_date ON submissions (filing_date);
+"""
+
+
+def _padded_size(size):
+    return size + (512 - (size % 512)) % 512
+
+
+def member_data_offset(tar, size):
+    """Absolute offset of the data of the member just written by tar.addfile."""
+    return tar.offset - _padded_size(size)
+
+
+def _tar_stat(tar_path):
+    try:
+        stat = os.stat(tar_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _extract_ciks(value):
+    """Collect every cik in the submission header (filer, subject-company, reporting-owner, ...)."""
+    ciks = set()
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == 'documents':
+                continue
+            if key == 'cik' and isinstance(item, str):
+                try:
+                    ciks.add(int(item))
+                except ValueError:
+                    pass
+            else:
+                ciks |= _extract_ciks(item)
+    elif isinstance(value, list):
+        for item in value:
+            ciks |= _extract_ciks(item)
+    return ciks
+
+
+def _contains_xbrl(metadata):
+    return any(
+        doc.get('type') in ('EX-100.INS', 'EX-101.INS') or
+        split_compression_suffix(doc.get('filename') or '')[0].endswith('_htm.xml')
+        for doc in metadata.get('documents', [])
+    )
+
+
+def _format_filing_date(fd):
+    return f"{fd[:4]}-{fd[4:6]}-{fd[6:8]}" if fd else None
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def build_selection(submission_type=None, filing_date=None, cik=None, document_type=None, contains_xbrl=None):
+    """
+    Normalize Portfolio.select() arguments.
+
+    filing_date may be a single 'YYYY-MM-DD' date, a list of dates, or a (start, end) tuple
+    (inclusive). Every other filter accepts a single value or a list.
+    """
+    if isinstance(filing_date, tuple):
+        if len(filing_date) != 2:
+            raise ValueError("filing_date range must be a 2-item tuple.")
+        filing_date = (str(filing_date[0]), str(filing_date[1]))
+    elif filing_date is not None:
+        filing_date = [str(date) for date in _as_list(filing_date)]
+
+    ciks = _as_list(cik)
+    return {
+        'submission_type': _as_list(submission_type),
+        'filing_date': filing_date,
+        'cik': [int(item) for item in ciks] if ciks is not None else None,
+        'document_type': _as_list(document_type),
+        'contains_xbrl': contains_xbrl,
+    }
+
+
+def metadata_matches(metadata, selection):
+    """Evaluate a selection against submission metadata, for submissions not stored in batch tars."""
+    if selection['submission_type'] is not None and metadata.get('type') not in selection['submission_type']:
+        return False
+
+    filing_date = selection['filing_date']
+    if filing_date is not None:
+        fd = _format_filing_date(metadata.get('filing-date'))
+        if fd is None:
+            return False
+        if isinstance(filing_date, tuple):
+            if not filing_date[0] <= fd <= filing_date[1]:
+                return False
+        elif fd not in filing_date:
+            return False
+
+    if selection['cik'] is not None and not _extract_ciks(metadata) & set(selection['cik']):
+        return False
+
+    if selection['document_type'] is not None and not any(
+        doc.get('type') in selection['document_type'] for doc in metadata.get('documents', [])
+    ):
+        return False
+
+    if selection['contains_xbrl'] is not None and _contains_xbrl(metadata) != bool(selection['contains_xbrl']):
+        return False
+
+    return True
+
+
+def _selection_clause(selection):
+    clauses = []
+    params = []
+
+    def placeholders(values):
+        return ', '.join('?' * len(values))
+
+    if selection['submission_type'] is not None:
+        clauses.append(f"s.submission_type IN ({placeholders(selection['submission_type'])})")
+        params.extend(selection['submission_type'])
+
+    filing_date = selection['filing_date']
+    if isinstance(filing_date, tuple):
+        clauses.append("s.filing_date BETWEEN ? AND ?")
+        params.extend(filing_date)
+    elif filing_date is not None:
+        clauses.append(f"s.filing_date IN ({placeholders(filing_date)})")
+        params.extend(filing_date)
+
+    if selection['cik'] is not None:
+        clauses.append(
+            "EXISTS (SELECT 1 FROM submission_ciks c WHERE c.tar_name = s.tar_name AND c.accession = s.accession "
+            f"AND c.cik IN ({placeholders(selection['cik'])}))"
+        )
+        params.extend(selection['cik'])
+
+    if selection['document_type'] is not None:
+        clauses.append(
+            "EXISTS (SELECT 1 FROM documents d WHERE d.tar_name = s.tar_name AND d.accession = s.accession "
+            f"AND d.document_type IN ({placeholders(selection['document_type'])}))"
+        )
+        params.extend(selection['document_type'])
+
+    if selection['contains_xbrl'] is not None:
+        clauses.append("s.contains_xbrl = ?")
+        params.append(int(bool(selection['contains_xbrl'])))
+
+    return clauses, params
+
+
+class PortfolioIndex:
+    """
+    SQLite sidecar that records, for every submission stored in a portfolio's batch tars,
+    the tar it lives in, the absolute offset and size of each member, and its metadata.
+
+    Tars are keyed by file name relative to the portfolio directory together with their
+    size and mtime, so a tar only needs to be rescanned when it changed on disk.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.db_path = self.path / INDEX_FILENAME
+        self._lock = Lock()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=60, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != INDEX_VERSION:
+                conn.executescript(
+                    'DROP TABLE IF EXISTS tars; DROP TABLE IF EXISTS submissions; '
+                    'DROP TABLE IF EXISTS submission_ciks; DROP TABLE IF EXISTS documents;'
+                )
+                conn.execute(f'PRAGMA user_version={INDEX_VERSION}')
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stale_tars(self, batch_tars):
+        """Return the batch tars that are missing from the index or changed since they were indexed."""
+        with self._lock:
+            indexed = {name: (size, mtime_ns) for name, size, mtime_ns in
+                       self.conn.execute('SELECT name, size, mtime_ns FROM tars')}
+        return [tar for tar in batch_tars if indexed.get(Path(tar).name) != _tar_stat(tar)]
+
+    def prune(self, batch_tars):
+        """Drop index rows for tars that no longer exist in the portfolio."""
+        keep = {Path(tar).name for tar in batch_tars}
+        with self._lock:
+            names = [row[0] for row in self.conn.execute('SELECT name FROM tars')]
+            for name in names:
+                if name not in keep:
+                    self._delete_tar(name)
+            self.conn.commit()
+
+    def scan_tar(self, batch_tar_path):
+        """Read member locations and metadata from a batch tar and replace its index entries."""
+        stat = _tar_stat(batch_tar_path)
+        entries = {}
+        with tarfile.open(batch_tar_path, 'r') as tar:
+            for member in tar:
+                if not member.isfile() or '/' not in member.name:
+                    continue
+                accession, name = member.name.split('/', 1)
+                entry = entries.setdefault(accession, {'accession': accession, 'metadata': None, 'members': {}})
+                entry['members'][name] = (member.offset_data, member.size)
+                if name == 'metadata.json':
+                    entry['metadata'] = json.loads(tar.extractfile(member).read().decode('utf-8'))
+
+        entries = [entry for entry in entries.values() if entry['metadata'] is not None]
+        self.replace_tar(batch_tar_path, entries, stat=stat)
+        return len(entries)
+
+    def replace_tar(self, batch_tar_path, entries, stat=None):
+        """Replace all entries for a batch tar, e.g. after it was (re)written from scratch."""
+        name = Path(batch_tar_path).name
+        if stat is None:
+            stat = _tar_stat(batch_tar_path)
+        with self._lock:
+            self._delete_tar(name)
+            self._insert_entries(name, entries)
+            self._set_stat(name, stat)
+            self.conn.commit()
+
+    def append_tar(self, batch_tar_path, entries, previous_stat):
+        """
+        Record submissions appended to a batch tar by a writer.
+
+        previous_stat is the (size, mtime_ns) of the tar before the writer opened it, or None
+        if the writer created it. If the index did not match that state the appended entries
+        are dropped and the tar is left stale so the next load rescans it.
+        """
+        name = Path(batch_tar_path).name
+        with self._lock:
+            row = self.conn.execute('SELECT size, mtime_ns FROM tars WHERE name = ?', (name,)).fetchone()
+            if previous_stat is None:
+                self._delete_tar(name)
+            elif row is None or tuple(row) != tuple(previous_stat):
+                return
+            self._insert_entries(name, entries)
+            self._set_stat(name, _tar_stat(batch_tar_path))
+            self.conn.commit()
+
+    def iter_submissions(self, batch_size=10000, selections=None):
+        """
+        Yield (tar_name, accession, metadata, members) for every indexed submission, tar by tar.
+
+        selections is a list of build_selection() dicts that must all match; they are evaluated
+        in SQLite so non-matching submissions are never read from the tars.
+        """
+        clauses = []
+        params = []
+        for selection in selections or []:
+            selection_clauses, selection_params = _selection_clause(selection)
+            clauses.extend(selection_clauses)
+            params.extend(selection_params)
+
+        query = 'SELECT s.tar_name, s.accession, s.metadata, s.members FROM submissions s'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY s.tar_name, s.rowid'
+
+        cursor = self.conn.cursor()
+        with self._lock:
+            cursor.execute(query, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for tar_name, accession, metadata, members in rows:
+                members = {name: tuple(location) for name, location in json.loads(members).items()}
+                yield tar_name, accession, json.loads(metadata), members
+        cursor.close()
+
+    def accessions(self, tar_names=None):
+        """Accessions of every indexed submission, or only those in the named tars."""
+        query = 'SELECT DISTINCT accession FROM submissions'
+        params = []
+        if tar_names is not None:
+            query += f" WHERE tar_name IN ({','.join('?' * len(tar_names))})"
+            params = list(tar_names)
+        with self._lock:
+            return [row[0] for row in self.conn.execute(query, params)]
+
+    def _delete_tar(self, name):
+        self.conn.execute('DELETE FROM tars WHERE name = ?', (name,))
+        self.conn.execute('DELETE FROM submissions WHERE tar_name = ?', (name,))
+        self.conn.execute('DELETE FROM submission_ciks WHERE tar_name = ?', (name,))
+        self.conn.execute('DELETE FROM documents WHERE tar_name = ?', (name,))
+
+    def _set_stat(self, name, stat):
+        if stat is None:
+            return
+        self.conn.execute(
+            'INSERT OR REPLACE INTO tars (name, size, mtime_ns) VALUES (?, ?, ?)',
+            (name, stat[0], stat[1])
+        )
+
+    def _insert_entries(self, name, entries):
+        submission_rows = []
+        cik_rows = []
+        document_rows = []
+        for entry in entries:
+            accession = entry['accession']
+            metadata = entry['metadata']
+            # an accession re-appended to the same tar supersedes its earlier copy
+            self.conn.execute('DELETE FROM submission_ciks WHERE tar_name = ? AND accession = ?', (name, accession))
+            self.conn.execute('DELETE FROM documents WHERE tar_name = ? AND accession = ?', (name, accession))
+            submission_rows.append((
+                name,
+                accession,
+                metadata.get('type'),
+                _format_filing_date(metadata.get('filing-date')),
+                int(_contains_xbrl(metadata)),
+                json.dumps(metadata),
+                json.dumps(entry['members']),
+            ))
+            cik_rows.extend((name, accession, cik) for cik in _extract_ciks(metadata))
+            document_rows.extend(
+                (name, accession, doc.get('type'), doc.get('filename'))
+                for doc in metadata.get('documents', [])
+            )
+
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?)', submission_rows
+        )
+        self.conn.executemany('INSERT INTO submission_ciks VALUES (?, ?, ?)', cik_rows)
+        self.conn.executemany('INSERT INTO documents VALUES (?, ?, ?, ?)', document_rows)
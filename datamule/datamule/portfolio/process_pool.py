@@ -0,0 +1,158 @@
+from pathlib import Path
+from ..document.document import Document
+from ..submission.submission import Submission
+from .batch_tar_reader import BatchTarReader
+from ..utils.compression import split_compression_suffix
+from ..utils.zstd_dictionaries import load_portfolio_dictionaries
+from ..utils.instrumentation import metrics
+
+# Work is shipped to worker processes as small picklable descriptors (paths, offsets, metadata)
+# rather than Submission/Document objects, and each worker opens its own tar readers.
+
+
+class _WorkerReaders(dict):
+    """Per-process {batch_tar_path: BatchTarReader} cache, opened on first use."""
+
+    def __missing__(self, batch_tar_path):
+        reader = BatchTarReader(batch_tar_path)
+        self[batch_tar_path] = reader
+        return reader
+
+
+class _WorkerPortfolio:
+    """Stands in for Portfolio as the portfolio_ref of submissions rebuilt inside a worker."""
+
+    def __init__(self, mmap_content=False):
+        self.batch_tar_handles = _WorkerReaders()
+        self.mmap_content = mmap_content
+
+
+_worker_portfolio = None
+
+
+def _init_worker(mmap_content, portfolio_path=None, metrics_enabled=False):
+    global _worker_portfolio
+    _worker_portfolio = _WorkerPortfolio(mmap_content=mmap_content)
+    # a forked worker inherits the parent's values, which the parent already has
+    metrics.reset()
+    if metrics_enabled:
+        metrics.enable()
+    else:
+        metrics.disable()
+    # zstd dictionaries are looked up by id when decompressing, so each worker needs them registered
+    if portfolio_path is not None:
+        load_portfolio_dictionaries(portfolio_path)
+
+
+def _get_worker_portfolio():
+    global _worker_portfolio
+    if _worker_portfolio is None:
+        _worker_portfolio = _WorkerPortfolio()
+    return _worker_portfolio
+
+
+def load_submission(descriptor):
+    """Rebuild a Submission from Submission._get_descriptor() output."""
+    if descriptor['batch_tar_path'] is not None:
+        return Submission(
+            batch_tar_path=Path(descriptor['batch_tar_path']),
+            accession=descriptor['accession'],
+            portfolio_ref=_get_worker_portfolio(),
+            metadata=descriptor['metadata'],
+            members=descriptor['members']
+        )
+    return Submission(Path(descriptor['path']))
+
+
+def load_document(descriptor):
+    """Rebuild a Document from Submission._get_document_descriptors() output."""
+    kind = descriptor['kind']
+    if kind == 'batch_tar':
+        worker_portfolio = _get_worker_portfolio()
+        reader = worker_portfolio.batch_tar_handles[Path(descriptor['batch_tar_path'])]
+        if worker_portfolio.mmap_content:
+            content = reader.view(descriptor['offset'], descriptor['size'])
+        else:
+            content = reader.read(descriptor['offset'], descriptor['size'])
+        path = f"{descriptor['batch_tar_path']}::{descriptor['accession']}/{descriptor['filename']}"
+    elif kind == 'file':
+        path = Path(descriptor['path'])
+        if not path.exists():
+            raise FileNotFoundError(f"Document file not found: {path}")
+        with path.open('rb') as f:
+            content = f.read()
+    else:
+        # legacy per-submission tars are reopened and read through Submission
+        submission = Submission(Path(descriptor['path']))
+        return submission._load_document_by_index(descriptor['index'])
+
+    filename, compression = split_compression_suffix(descriptor['filename'])
+    return Document(
+        type=descriptor['type'],
+        content=content,
+        filename=filename,
+        filing_date=descriptor['filing_date'],
+        accession=descriptor['accession'],
+        path=path,
+        compression=compression
+    )
+
+
+class _WithMetrics:
+    """A worker's result together with the metrics it recorded producing it."""
+
+    __slots__ = ('result', 'metrics')
+
+    def __init__(self, result, metrics):
+        self.result = result
+        self.metrics = metrics
+
+
+def _with_metrics(result):
+    if not metrics.enabled:
+        return result
+    return _WithMetrics(result, metrics.drain())
+
+
+def _unwrap_result(result):
+    """A worker's result, merging any metrics sent with it into this process's registry."""
+    if isinstance(result, _WithMetrics):
+        metrics.merge(result.metrics)
+        return result.result
+    return result
+
+
+def _run_submission(callback, descriptor):
+    with metrics.timer('portfolio.read'):
+        submission = load_submission(descriptor)
+    with metrics.timer('portfolio.callback'):
+        result = callback(submission)
+    return _with_metrics(result)
+
+
+class _Skipped:
+    """Returned in place of a result for a document that could not be loaded."""
+
+
+def _run_document(callback, descriptor, skip_unreadable=False):
+    with metrics.timer('portfolio.read'):
+        try:
+            document = load_document(descriptor)
+        except Exception as e:
+            if not skip_unreadable:
+                raise
+            # as Submission.__iter__ does in thread mode
+            print(f"Skipped: {descriptor.get('index', descriptor['filename'])} due to {e}. Possible malformed filing.", flush=True)
+            return _with_metrics(_Skipped())
+    with metrics.timer('portfolio.callback'):
+        result = callback(document)
+    return _with_metrics(result)
+
+
+def _load_and_run_document(callback, submission, idx):
+    return callback(submission._load_document_by_index(idx))
+
+
+def _chunksize(total, max_workers):
+    # a few chunks per worker keeps every core busy while amortizing IPC per item
+    return max(1, min(256, total // (max_workers * 4)))
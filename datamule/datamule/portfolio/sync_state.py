@@ -0,0 +1,49 @@
+import json
+import os
+from pathlib import Path
+from ..utils.accession_set import AccessionSet
+from .portfolio_index import _tar_stat
+
+SYNC_DIRNAME = '.sync'
+
+
+class SyncState:
+    """
+    Portfolio.sync's sidecar (.sync in the portfolio): the accessions the portfolio holds,
+    the batch tars those were last reconciled against, and a filing date watermark per
+    set of sync filters.
+    """
+
+    def __init__(self, portfolio_path):
+        self.path = Path(portfolio_path) / SYNC_DIRNAME
+        self.accessions_path = self.path / 'accessions.bin'
+        self.state_path = self.path / 'state.json'
+
+        self.accessions = AccessionSet.load(self.accessions_path) if self.accessions_path.exists() else None
+        state = {}
+        if self.state_path.exists():
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        self.tars = {name: tuple(stat) for name, stat in state.get('tars', {}).items()}
+        self.watermarks = state.get('watermarks', {})
+
+    @staticmethod
+    def key(filters):
+        """Watermark key for a set of filters; filters left as None don't count."""
+        return json.dumps({name: value for name, value in filters.items() if value not in (None, [])}, sort_keys=True, default=str)
+
+    def changed_tars(self, batch_tars):
+        """Batch tars written or modified since the state was last saved."""
+        return [tar for tar in batch_tars if self.tars.get(Path(tar).name) != _tar_stat(tar)]
+
+    def record_tars(self, batch_tars):
+        self.tars = {Path(tar).name: _tar_stat(tar) for tar in batch_tars}
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        if self.accessions is not None:
+            self.accessions.save(self.accessions_path)
+        tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'tars': self.tars, 'watermarks': self.watermarks}, f)
+        os.replace(tmp_path, self.state_path)
@@ -8,7 +8,9 @@ from ..utils import headers, PreciseRateLimiter
 from .eftsquery import EFTSQuery
 import aiohttp
 from zoneinfo import ZoneInfo 
+from ...utils.instrumentation import metrics
 
+@metrics.timed('monitor.rss_poll')
 async def poll_rss(limiter, session):
     base_url = 'https://www.sec.gov/cgi-bin/browse-edgar?count=100&action=getcurrent&output=rss'
     
@@ -94,6 +96,7 @@ class Monitor():
             self.session = aiohttp.ClientSession(headers=headers)
             self.session_created_at = current_time
     
+    @metrics.timed('monitor.efts_query')
     async def _async_run_efts_query(self, **kwargs):
         """Async helper method to run EFTS query without creating a new event loop"""
         # Make sure to set quiet parameter if provided in kwargs
@@ -165,12 +168,14 @@ class Monitor():
                     try:
                         results = await poll_rss(self.ratelimiters['sec.gov'], self.session)
                         new_results = self._filter_new_accessions(results)
+                        metrics.count('monitor.new_submissions', len(new_results))
                         if new_results:
                             if not quiet:
                                 print(f"Found {len(new_results)} new submissions via RSS")
                             if data_callback:
                                 data_callback(new_results)
                     except Exception as e:
+                        metrics.count('monitor.poll_errors')
                         if not quiet:
                             print(f"RSS polling error: {e}, will recreate session on next poll")
                         # Force session recreation on next poll
@@ -193,6 +198,7 @@ class Monitor():
                     ))
                     
                     new_hits = self._filter_new_accessions(hits)
+                    metrics.count('monitor.new_submissions', len(new_hits))
                     if new_hits:
                         if not quiet:
                             print(f"Found {len(new_hits)} new submissions via EFTS validation")
@@ -0,0 +1,85 @@
+import json
+
+# Helpers that turn documents and submissions into {dataset: rows} for ResultSink.write,
+# e.g. portfolio.process_documents(table_records, sink=ParquetSink('tables'))
+
+
+def _document_columns(document):
+    return {'accession': document.accession, 'filename': document.filename, 'document_type': document.type}
+
+
+def _cell(value):
+    # nested values from html tables are kept as JSON text so every column has a scalar type
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def table_records(document):
+    """Rows for every table in a document, grouped into one dataset per table name."""
+    tables = document.tables
+    if not tables:
+        return {}
+
+    columns = _document_columns(document)
+    records = {}
+    for table in tables.tables:
+        if not table.data:
+            continue
+        if isinstance(table.data[0], dict):
+            rows = [{**columns, **{key: _cell(value) for key, value in row.items()}} for row in table.data]
+        else:
+            # html tables are lists of cells, stored long form so differently shaped tables share a schema
+            rows = [
+                {**columns, 'table': table.name, 'row': row_idx, 'column': col_idx, 'value': _cell(value)}
+                for row_idx, row in enumerate(table.data)
+                for col_idx, value in enumerate(row)
+            ]
+        records.setdefault(table.name, []).extend(rows)
+    return records
+
+
+def text_records(document):
+    """One row holding the document's plain text."""
+    text = document.text
+    if text is None:
+        return {}
+    return {'text': [{**_document_columns(document), 'filing_date': str(document.filing_date), 'text': str(text)}]}
+
+
+def tag_records(document):
+    """One row per CUSIP, ISIN and FIGI found in the document text."""
+    text = document.text
+    if text is None:
+        return {}
+
+    columns = _document_columns(document)
+    rows = []
+    for tag_type in ('cusips', 'isins', 'figis'):
+        for match, start, end in getattr(text.tags, tag_type):
+            rows.append({**columns, 'tag_type': tag_type[:-1], 'value': match, 'start': start, 'end': end})
+    return {'tags': rows}
+
+
+def xbrl_records(submission):
+    """One row per XBRL fact in a submission."""
+    xbrl = submission.xbrl
+    if not xbrl:
+        return {}
+
+    rows = []
+    for fact in xbrl:
+        attributes = fact.get('_attributes', {})
+        context = fact.get('_context') or {}
+        rows.append({
+            'accession': submission.accession,
+            'name': attributes.get('name'),
+            'value': _cell(fact.get('_val')),
+            'unit': attributes.get('unitref'),
+            'decimals': attributes.get('decimals'),
+            'scale': attributes.get('scale'),
+            'context': context.get('_contextref'),
+            'period_start_date': context.get('period_instant') or context.get('period_startdate'),
+            'period_end_date': context.get('period_enddate'),
+        })
+    return {'xbrl': rows}
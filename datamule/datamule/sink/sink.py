@@ -0,0 +1,271 @@
+import csv
+import os
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from threading import Lock
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required for Parquet and Arrow sinks. Install it with: pip install pyarrow")
+    return pyarrow
+
+
+def _dataset_dirname(dataset):
+    # table names come from document titles, so keep them filesystem safe
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', str(dataset)).strip('._')
+    return name or 'results'
+
+
+class _SchemaChanged(Exception):
+    """Raised by a writer that cannot accept a batch, so the sink rolls over to a new shard."""
+
+
+class ResultSink(ABC):
+    """
+    Buffered, sharded writer for processing results.
+
+    write() accepts a list of row dicts (written to the default dataset), or a dict of
+    {dataset: rows} such as the output of table_records(). Rows are buffered per dataset and
+    written in batches of batch_size to a writer kept open for the dataset, under
+    output_dir/{dataset}/part-{shard:05d}.{extension}. A new shard is started after
+    max_rows_per_file rows, or when a batch does not fit the open shard's columns.
+
+    Shard numbering continues after any parts already on disk, so a resumed job appends
+    new shards rather than overwriting earlier ones.
+    """
+
+    extension = None
+
+    def __init__(self, output_dir, batch_size=10000, max_rows_per_file=1000000, default_dataset='results'):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.max_rows_per_file = max_rows_per_file
+        self.default_dataset = default_dataset
+        self._buffers = {}
+        self._writers = {}
+        self._rows_in_shard = {}
+        self._next_shard = {}
+        self._lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, records, dataset=None):
+        """Buffer rows for writing. records is a list of row dicts or a {dataset: rows} dict."""
+        if isinstance(records, dict):
+            grouped = records.items()
+        else:
+            grouped = [(dataset or self.default_dataset, records)]
+
+        with self._lock:
+            for name, rows in grouped:
+                if not rows:
+                    continue
+                buffer = self._buffers.setdefault(_dataset_dirname(name), [])
+                buffer.extend(rows)
+                if len(buffer) >= self.batch_size:
+                    self._flush_dataset(_dataset_dirname(name))
+
+    def flush(self):
+        """Write all buffered rows to their shards."""
+        with self._lock:
+            for name in list(self._buffers):
+                self._flush_dataset(name)
+
+    def checkpoint(self):
+        """
+        Flush buffered rows and make every open shard durable, so everything written so far is
+        complete on disk. Formats that need a footer to be readable (Parquet, Arrow) close their
+        shards to do so, and later writes start new ones; CSV shards stay open.
+        """
+        with self._lock:
+            for name in list(self._buffers):
+                self._flush_dataset(name)
+            for name in list(self._writers):
+                if not self._sync_writer(self._writers[name]):
+                    self._close_shard(name)
+
+    def close(self):
+        """Flush buffered rows and close every open shard. Later writes start new shards."""
+        with self._lock:
+            for name in list(self._buffers):
+                self._flush_dataset(name)
+            for name in list(self._writers):
+                self._close_shard(name)
+
+    def _flush_dataset(self, name):
+        rows = self._buffers.pop(name, None)
+        while rows:
+            if name in self._writers and self._rows_in_shard[name] >= self.max_rows_per_file:
+                self._close_shard(name)
+
+            capacity = self.max_rows_per_file - self._rows_in_shard.get(name, 0)
+            batch, rows = rows[:capacity], rows[capacity:]
+
+            if name in self._writers:
+                try:
+                    self._write_batch(self._writers[name], batch)
+                except _SchemaChanged:
+                    self._close_shard(name)
+
+            if name not in self._writers:
+                self._writers[name] = self._open_shard(self._shard_path(name), batch)
+                self._rows_in_shard[name] = 0
+                self._write_batch(self._writers[name], batch)
+
+            self._rows_in_shard[name] += len(batch)
+
+    def _shard_path(self, name):
+        dataset_dir = self.output_dir / name
+        dataset_dir.mkdir(exist_ok=True)
+        if name not in self._next_shard:
+            existing = [
+                int(path.stem.split('-')[1]) for path in dataset_dir.glob(f'part-*.{self.extension}')
+                if path.stem.split('-')[1].isdigit()
+            ]
+            self._next_shard[name] = max(existing) + 1 if existing else 0
+        shard = self._next_shard[name]
+        self._next_shard[name] += 1
+        return dataset_dir / f'part-{shard:05d}.{self.extension}'
+
+    def _close_shard(self, name):
+        writer = self._writers.pop(name)
+        self._rows_in_shard.pop(name, None)
+        self._close_writer(writer)
+
+    @abstractmethod
+    def _open_shard(self, path, rows):
+        """Open a writer for a new shard at path; rows is the first batch it will receive."""
+
+    @abstractmethod
+    def _write_batch(self, writer, rows):
+        """Write rows to writer, raising _SchemaChanged if they don't fit its columns."""
+
+    @abstractmethod
+    def _close_writer(self, writer):
+        """Finish and close writer."""
+
+    def _sync_writer(self, writer):
+        """Make writer's output durable without closing it; returns False if it must be closed instead."""
+        return False
+
+
+class CSVSink(ResultSink):
+    """Write results as CSV shards. Columns are taken from the first batch written to each shard."""
+
+    extension = 'csv'
+
+    def _open_shard(self, path, rows):
+        fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+        f = open(path, 'w', newline='', encoding='utf-8')
+        writer = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        return f, writer
+
+    def _write_batch(self, writer, rows):
+        f, dict_writer = writer
+        fieldnames = set(dict_writer.fieldnames)
+        if any(key not in fieldnames for row in rows for key in row):
+            raise _SchemaChanged()
+        dict_writer.writerows(rows)
+
+    def _sync_writer(self, writer):
+        f, _ = writer
+        f.flush()
+        os.fsync(f.fileno())
+        return True
+
+    def _close_writer(self, writer):
+        f, _ = writer
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+
+class _ArrowSink(ResultSink):
+    """Shared schema handling for the pyarrow based sinks."""
+
+    def __init__(self, output_dir, **kwargs):
+        self.pa = _import_pyarrow()
+        super().__init__(output_dir, **kwargs)
+
+    def _infer_schema(self, rows):
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        fields = []
+        for column in columns:
+            try:
+                column_type = self.pa.array([row.get(column) for row in rows]).type
+            except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+                # mixed value types within a column are stored as strings
+                column_type = self.pa.string()
+            # columns that are entirely null in the first batch would otherwise be typed null
+            # and reject every later value, so store them as strings too
+            if self.pa.types.is_null(column_type):
+                column_type = self.pa.string()
+            fields.append(self.pa.field(column, column_type))
+        return self.pa.schema(fields)
+
+    def _table_for_schema(self, rows, schema):
+        names = set(schema.names)
+        if any(key not in names for row in rows for key in row):
+            raise _SchemaChanged()
+
+        string_columns = [field.name for field in schema if self.pa.types.is_string(field.type)]
+        if string_columns:
+            rows = [
+                {**row, **{name: str(row[name]) for name in string_columns if row.get(name) is not None and not isinstance(row[name], str)}}
+                for row in rows
+            ]
+        try:
+            return self.pa.Table.from_pylist(rows, schema=schema)
+        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+            raise _SchemaChanged()
+
+
+class ParquetSink(_ArrowSink):
+    """Write results as Parquet shards, one row group per batch. Requires pyarrow."""
+
+    extension = 'parquet'
+
+    def __init__(self, output_dir, compression='zstd', **kwargs):
+        self.compression = compression
+        super().__init__(output_dir, **kwargs)
+
+    def _open_shard(self, path, rows):
+        import pyarrow.parquet as pq
+        schema = self._infer_schema(rows)
+        return pq.ParquetWriter(path, schema, compression=self.compression)
+
+    def _write_batch(self, writer, rows):
+        writer.write_table(self._table_for_schema(rows, writer.schema))
+
+    def _close_writer(self, writer):
+        writer.close()
+
+
+class ArrowSink(_ArrowSink):
+    """Write results as Arrow IPC files, one record batch per batch. Requires pyarrow."""
+
+    extension = 'arrow'
+
+    def _open_shard(self, path, rows):
+        schema = self._infer_schema(rows)
+        sink = self.pa.OSFile(str(path), 'wb')
+        return sink, self.pa.ipc.new_file(sink, schema), schema
+
+    def _write_batch(self, writer, rows):
+        _, ipc_writer, schema = writer
+        ipc_writer.write_table(self._table_for_schema(rows, schema))
+
+    def _close_writer(self, writer):
+        sink, ipc_writer, _ = writer
+        ipc_writer.close()
+        sink.close()
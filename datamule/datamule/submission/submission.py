@@ -9,8 +9,9 @@ from secxbrl import parse_inline_xbrl
 from company_fundamentals import construct_fundamentals
 from decimal import Decimal
 from ..utils.format_accession import format_accession
+from ..utils.compression import split_compression_suffix, decompress_zstd
 from .tar_submission import tar_submission
-import zstandard as zstd
+from ..utils.instrumentation import metrics
 
 # probably needs rework later
 class FundamentalsAccessor:
@@ -58,8 +59,10 @@ class FundamentalsAccessor:
         return bool(self._get_all_data())
 
 class Submission:
+    @metrics.timed('submission.load')
     def __init__(self, path=None, sgml_content=None, keep_document_types=None,
-                 batch_tar_path=None, accession=None, portfolio_ref=None,url=None):
+                 batch_tar_path=None, accession=None, portfolio_ref=None,url=None,
+                 metadata=None, members=None):
         
         # get accession number
         # lets just use accesion-prefix, to get around malformed metadata files (1995 has a lot!)
@@ -85,6 +88,7 @@ class Submission:
         self._tar_compression_type = 'zstd'
         self._tar_compression_level = 3
         self._tar_compression_threshold = None
+        self._tar_compression_dictionaries = None
         self._accession_year_2d = None
         self._documents = None
         self._filer_cik = None
@@ -100,6 +104,8 @@ class Submission:
         # Initialize batch tar attributes
         self.batch_tar_path = batch_tar_path
         self.portfolio_ref = portfolio_ref
+        # {member name: (absolute data offset, size)} within the batch tar, from the portfolio index
+        self._members = members
         
         # here should set accession either from url or make it a required argument if sgml content
         if url is not None or sgml_content is not None:
@@ -112,8 +118,7 @@ class Submission:
                     sgml_content=response.read()
                     content_type = response.headers.get('Content-Type', '')
                     if content_type == 'application/zstd':
-                        dctx = zstd.ZstdDecompressor()
-                        sgml_content = dctx.decompressobj().decompress(sgml_content)
+                        sgml_content = decompress_zstd(sgml_content)
                 else:
                     raise ValueError(f"URL: {url}, Error: {response.getcode()}")
 
@@ -148,11 +153,10 @@ class Submission:
             # Batch tar case
             self.path = None
             
-            # Load metadata from batch tar
-            with self.portfolio_ref.batch_tar_locks[batch_tar_path]:
-                tar_handle = self.portfolio_ref.batch_tar_handles[batch_tar_path]
-                metadata_obj = tar_handle.extractfile(f'{self.accession}/metadata.json')
-                metadata = json.loads(metadata_obj.read().decode('utf-8'))
+            # Load metadata from batch tar, unless the portfolio index already provided it
+            if metadata is None:
+                tar_reader = self.portfolio_ref.batch_tar_handles[batch_tar_path]
+                metadata = json.loads(tar_reader.read_member(f'{self.accession}/metadata.json').decode('utf-8'))
 
             # Set metadata path using :: notation
             metadata_path = f"{batch_tar_path}::{self.accession}/metadata.json"
@@ -188,7 +192,7 @@ class Submission:
         # booleans
         self._xbrl_bool = any(
                 doc['type'] in ('EX-100.INS', 'EX-101.INS') or 
-                doc.get('filename', '').endswith('_htm.xml')
+                split_compression_suffix(doc.get('filename') or '')[0].endswith('_htm.xml')
                 for doc in self.metadata.content['documents']
             )
         
@@ -200,6 +204,7 @@ class Submission:
         
 
     # TODO rework for better metadata accessing
+    @metrics.timed('submission.load_document')
     def _load_document_by_index(self, idx):
         """Load a document by its index in the metadata documents list."""
         doc = self.metadata.content['documents'][idx]
@@ -216,15 +221,20 @@ class Submission:
         extension = Path(filename).suffix
         # Handle batch tar case
         if self.batch_tar_path is not None:
-            with self.portfolio_ref.batch_tar_locks[self.batch_tar_path]:
-                tar_handle = self.portfolio_ref.batch_tar_handles[self.batch_tar_path]
-                
+            tar_reader = self.portfolio_ref.batch_tar_handles[self.batch_tar_path]
+            location = self._members.get(filename) if self._members else None
+            if location is None:
                 # Use exact filename from metadata
-                tar_path = f'{self.accession}/{filename}'
-                content = tar_handle.extractfile(tar_path).read()
-    
-                
-                document_path = f"{self.batch_tar_path}::{self.accession}/{filename}"
+                location = tar_reader.locate(f'{self.accession}/{filename}')
+
+            # Positional read on the shared descriptor, no per-tar lock
+            offset, size = location
+            if getattr(self.portfolio_ref, 'mmap_content', False):
+                content = tar_reader.view(offset, size)
+            else:
+                content = tar_reader.read(offset, size)
+
+            document_path = f"{self.batch_tar_path}::{self.accession}/{filename}"
         
         # Handle regular path case
         else:
@@ -251,14 +261,60 @@ class Submission:
                     content = f.read()
                 
 
+        # documents stored as .zst/.gz are decompressed lazily on first access to content
+        document_filename, compression = split_compression_suffix(filename)
         return Document(
             type=doc['type'], 
             content=content, 
-            filename=filename,
+            filename=document_filename,
             filing_date=self.filing_date,
             accession=self.accession,
-            path=document_path
+            path=document_path,
+            compression=compression
         )
+    def _get_descriptor(self):
+        """Picklable description of this submission, used to rebuild it in worker processes."""
+        if self.path is None and self.batch_tar_path is None:
+            raise ValueError("Submissions loaded from sgml_content or url cannot be sent to worker processes")
+        return {
+            'path': str(self.path) if self.path is not None else None,
+            'batch_tar_path': str(self.batch_tar_path) if self.batch_tar_path is not None else None,
+            'accession': self.accession,
+            'metadata': self.metadata.content if self.batch_tar_path is not None else None,
+            'members': self._members,
+        }
+
+    def _get_document_descriptors(self):
+        """Yield picklable descriptions of this submission's documents without loading their content."""
+        if self.path is None and self.batch_tar_path is None:
+            raise ValueError("Submissions loaded from sgml_content or url cannot be sent to worker processes")
+
+        for idx, doc in enumerate(self.metadata.content['documents']):
+            filename = doc.get('filename')
+            if not filename:
+                filename = doc['sequence'] + '.txt'
+
+            descriptor = {
+                'type': doc['type'],
+                'filename': filename,
+                'filing_date': self.filing_date,
+                'accession': self.accession,
+            }
+            if self.batch_tar_path is not None:
+                location = self._members.get(filename) if self._members else None
+                if location is None:
+                    try:
+                        location = self.portfolio_ref.batch_tar_handles[self.batch_tar_path].locate(f'{self.accession}/{filename}')
+                    except Exception as e:
+                        print(f"Skipped: {idx} due to {e}. Possible malformed filing.")
+                        continue
+                descriptor.update(kind='batch_tar', batch_tar_path=str(self.batch_tar_path), offset=location[0], size=location[1])
+            elif self.path.suffix == '.tar':
+                descriptor.update(kind='submission', path=str(self.path), index=idx)
+            else:
+                descriptor.update(kind='file', path=str(self.path / filename))
+            yield descriptor
+
     def __iter__(self):
         """Make Submission iterable by yielding all documents."""
         for idx in range(len(self.metadata.content['documents'])):
@@ -291,12 +347,12 @@ class Submission:
         for idx, doc in enumerate(self.metadata.content['documents']):
             if doc['type'] in ['EX-100.INS','EX-101.INS']:
                 document = self._load_document_by_index(idx)
-                self._xbrl = parse_inline_xbrl(content=document.content,file_type='extracted_inline')
+                self._xbrl = parse_inline_xbrl(content=document._get_content_bytes(),file_type='extracted_inline')
                 return  
             
             if doc.filename.endswith('_htm.xml'):
                 document = self._load_document_by_index(idx)
-                self._xbrl = parse_inline_xbrl(content=document.content,file_type='extracted_inline')
+                self._xbrl = parse_inline_xbrl(content=document._get_content_bytes(),file_type='extracted_inline')
                 return
 
     @property
@@ -392,10 +448,12 @@ class Submission:
     def tar(self):
         return self._tar_submission().getvalue()
     
-    def set_tar_compression(self,compression_type='zstd',level=3,threshold=None):
+    def set_tar_compression(self,compression_type='zstd',level=3,threshold=None,dictionaries=None):
+        """dictionaries: optional DictionaryStore of per-document-type zstd dictionaries."""
         self._tar_compression_type = compression_type
         self._tar_compression_level = level
         self._tar_compression_threshold = threshold
+        self._tar_compression_dictionaries = dictionaries
     
     def _tar_submission(self):
         if self._tar is not None:
@@ -407,7 +465,8 @@ class Submission:
                 metadata=self.metadata.content,
                 compression_type=self._tar_compression_type,
                 level=self._tar_compression_level,
-                threshold=self._tar_compression_threshold
+                threshold=self._tar_compression_threshold,
+                dictionaries=self._tar_compression_dictionaries
             )
             return self._tar
         
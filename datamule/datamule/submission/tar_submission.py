@@ -5,7 +5,7 @@ import io
 import json
 
 
-def compress_content(content, compression_type, level, threshold):
+def compress_content(content, compression_type, level, threshold, dictionary=None):
     if compression_type == 'zstd':
         # Handle string content
         if isinstance(content, str):
@@ -14,27 +14,32 @@ def compress_content(content, compression_type, level, threshold):
             content_bytes = content
 
         # If content smaller than threshold, return uncompressed
-        if threshold is not None and len(content_bytes) < threshold:
+        # (a trained dictionary makes even small documents worth compressing)
+        if dictionary is None and threshold is not None and len(content_bytes) < threshold:
             return content_bytes
 
         # Compress with specified level
-        compressor = zstd.ZstdCompressor(level=level)
+        compressor = zstd.ZstdCompressor(level=level, dict_data=dictionary)
         return compressor.compress(content_bytes)
 
     # Return uncompressed if not zstd
     return content
 
 
-def compress_content_list(document_tuple_list, compression_type, level, threshold):
+def compress_content_list(document_tuple_list, compression_type, level, threshold, dictionaries=None):
+    """dictionaries is an optional list of zstd dictionaries (or None) aligned with document_tuple_list."""
     if compression_type is None:
         return document_tuple_list
     
     if level is None:
         level = 3
 
+    if dictionaries is None:
+        dictionaries = [None] * len(document_tuple_list)
+
     compressed_list = []
-    for content, accession in document_tuple_list:
-        compressed_content = compress_content(content, compression_type, level, threshold)
+    for (content, accession), dictionary in zip(document_tuple_list, dictionaries):
+        compressed_content = compress_content(content, compression_type, level, threshold, dictionary)
         compressed_list.append((compressed_content, accession))
     
     return compressed_list
@@ -68,14 +73,18 @@ def tar_content_list(metadata, document_tuple_list_compressed):
     return tar_buffer
 
 
-def tar_submission(metadata, documents_obj_list, compression_type=None, level=None, threshold=None):
-    """Takes a list of documents, compresses them (if above threshold), then tars them."""
+def tar_submission(metadata, documents_obj_list, compression_type=None, level=None, threshold=None, dictionaries=None):
+    """
+    Takes a list of documents, compresses them (if above threshold), then tars them.
+    dictionaries is an optional DictionaryStore whose per-type zstd dictionaries are used for compression.
+    """
     document_tuple_list = [(doc.content, doc.accession) for doc in documents_obj_list]
     document_tuple_list_compressed = compress_content_list(
         document_tuple_list,
         compression_type=compression_type, 
         level=level,
-        threshold=threshold
+        threshold=threshold,
+        dictionaries=[dictionaries.for_type(doc.type) for doc in documents_obj_list] if dictionaries is not None else None
     )
 
     return tar_content_list(metadata, document_tuple_list_compressed)
@@ -0,0 +1,51 @@
+import os
+from array import array
+from bisect import bisect_left, insort
+from .format_accession import format_accession
+
+
+class AccessionSet:
+    """
+    Compact set of accession numbers: a sorted array of 64-bit ints, 8 bytes per accession.
+
+    Membership accepts any accession format and costs a binary search, so millions of
+    accessions can be checked against without building a Python set. Saved as the raw array.
+    """
+
+    def __init__(self, accessions=()):
+        self._array = array('Q', sorted({format_accession(accession, 'int') for accession in accessions}))
+
+    @classmethod
+    def load(cls, path):
+        accession_set = cls()
+        with open(path, 'rb') as f:
+            accession_set._array.frombytes(f.read())
+        return accession_set
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            self._array.tofile(f)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, accession):
+        if not isinstance(accession, int):
+            accession = format_accession(accession, 'int')
+        i = bisect_left(self._array, accession)
+        return i < len(self._array) and self._array[i] == accession
+
+    def __len__(self):
+        return len(self._array)
+
+    def __iter__(self):
+        return iter(self._array)
+
+    def update(self, accessions):
+        """Add accessions; a handful are inserted in place, larger batches re-sort once."""
+        new = {format_accession(accession, 'int') for accession in accessions}
+        new = [accession for accession in new if accession not in self]
+        if len(new) > len(self._array) // 100:
+            self._array = array('Q', sorted(self._array.tolist() + new))
+        else:
+            for accession in new:
+                insort(self._array, accession)
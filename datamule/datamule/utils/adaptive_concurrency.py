@@ -0,0 +1,233 @@
+import asyncio
+import random
+import time
+import aiohttp
+from .instrumentation import metrics
+
+# statuses that mean the server is overloaded or rate limiting us
+OVERLOAD_STATUSES = {429, 500, 502, 503, 504}
+
+
+def scaled_timeout(size, base=30, min_rate=256*1024):
+    """Seconds allowed for a transfer of size bytes: base plus the time to move it at min_rate bytes/s."""
+    return base + (size or 0) / min_rate
+
+
+class DownloadStatusError(ValueError):
+    """A download failed with an unexpected HTTP status."""
+
+    def __init__(self, status):
+        self.status = status
+        super().__init__(f"Download failed: Status {status}")
+
+
+def is_overload_error(error):
+    """Whether a failed request points at congestion (timeouts, dropped connections) rather than bad input."""
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+
+def is_retryable(error):
+    """Whether a failed download may succeed if tried again: congestion, rate limiting or server errors."""
+    return is_overload_error(error) or (isinstance(error, DownloadStatusError) and error.status in OVERLOAD_STATUSES)
+
+
+def retry_delay(attempt, base=1.0, cap=30.0):
+    """Seconds to wait before retry number attempt (from 0): exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on the number of requests in flight.
+
+    Like TCP congestion control, the limit starts in slow start (+1 per successful request,
+    roughly doubling per round trip) and switches to additive increase (+1 per limit successful
+    requests) once it first hits congestion. Growth only happens while the limit is actually
+    in use and time-to-first-byte stays within latency_tolerance of the best seen.
+
+    Timeouts, dropped connections and 429/5xx responses halve the limit. Latency inflation
+    trims it by 10%, but only after latency_samples requests in a row finish with latency both
+    above latency_tolerance times the best seen and at least min_latency_increase seconds over
+    it, so jitter on a fast link doesn't shrink the limit. Throughput falling after the limit
+    was raised also trims it by 10%. Requests started before the last cut don't cut again, so
+    one overload counts once.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, latency_tolerance=2.0, window=1.0,
+                 min_latency_increase=0.05, latency_samples=5):
+        self.minimum = minimum
+        self.maximum = maximum or max(initial, minimum) * 10
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.latency_tolerance = latency_tolerance
+        self.min_latency_increase = min_latency_increase
+        self.latency_samples = latency_samples
+        self.window = window
+        self.in_flight = 0
+        self.slow_start = True
+
+        self.base_latency = None
+        self.latency = None
+        self.throughput = 0.0
+
+        self._condition = asyncio.Condition()
+        self._last_decrease = float('-inf')
+        self._inflated_samples = 0
+        self._window_start = None
+        self._window_bytes = 0
+        self._window_limit = self.limit
+        self._previous_throughput = None
+
+    def slot(self):
+        """Async context manager holding one request slot for the duration of a download."""
+        return _Slot(self)
+
+    def status(self):
+        """Progress bar postfix with the effective concurrency and throughput."""
+        return {'concurrency': f"{self.in_flight}/{int(self.limit)}", 'MB/s': f"{self.throughput / 1e6:.1f}"}
+
+    async def _acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def _release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            # wake only as many waiters as there are free slots; downloads queue every request up front
+            self._condition.notify(max(0, int(self.limit) - self.in_flight))
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def _decrease(self, factor, started):
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * factor)
+        self.slow_start = False
+        self._last_decrease = self._now()
+
+    def _record_latency(self, latency):
+        if self.base_latency is None or latency < self.base_latency:
+            self.base_latency = latency
+        else:
+            # let the baseline drift up slowly in case the path itself got slower
+            self.base_latency += (latency - self.base_latency) * 0.01
+        self.latency = latency if self.latency is None else self.latency + (latency - self.latency) * 0.2
+
+    def _latency_inflated(self):
+        if self.latency is None:
+            return False
+        return (self.latency > self.latency_tolerance * self.base_latency
+                and self.latency - self.base_latency >= self.min_latency_increase)
+
+    def _record_bytes(self, nbytes):
+        now = self._now()
+        if self._window_start is None:
+            self._window_start = now
+        self._window_bytes += nbytes
+
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        throughput = self._window_bytes / elapsed
+        self.throughput = throughput
+        if self._previous_throughput is not None and self.limit > self._window_limit:
+            if throughput < self._previous_throughput * 0.8:
+                # more requests made things slower, the link is saturated
+                self._decrease(0.9, self._window_start)
+            elif throughput < self._previous_throughput * 1.05:
+                # more requests didn't help, stop doubling
+                self.slow_start = False
+        self._previous_throughput = throughput
+        self._window_limit = self.limit
+        self._window_start = now
+        self._window_bytes = 0
+
+    def _complete(self, slot):
+        if slot.overloaded:
+            self._decrease(0.5, slot.started)
+            return
+
+        if self._latency_inflated():
+            self._inflated_samples += 1
+            if self._inflated_samples >= self.latency_samples:
+                self._inflated_samples = 0
+                self._decrease(0.9, slot.started)
+            return
+        self._inflated_samples = 0
+
+        # only grow while the limit is what's holding requests back
+        if self.in_flight >= int(self.limit) - 1:
+            self.limit = min(self.maximum, self.limit + (1 if self.slow_start else 1 / self.limit))
+
+
+class _Slot:
+    """One request's slot in an AdaptiveConcurrency, which it reports latency, bytes and failures to."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.started = None
+        self.overloaded = False
+        self._responded = False
+
+    async def __aenter__(self):
+        await self.limiter._acquire()
+        self.started = self.limiter._now()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc is not None and is_overload_error(exc):
+            self.overloaded = True
+        try:
+            self.limiter._complete(self)
+        finally:
+            await self.limiter._release()
+
+    def response(self, status):
+        """Record a response's arrival; the first one gives the request's time to first byte."""
+        if status in OVERLOAD_STATUSES:
+            self.overloaded = True
+        elif not self._responded:
+            latency = self.limiter._now() - self.started
+            self.limiter._record_latency(latency)
+            metrics.record_time('network.first_byte', latency)
+        self._responded = True
+
+    def received(self, nbytes):
+        self.limiter._record_bytes(nbytes)
+
+    def failed(self, error):
+        """Record an error that was handled inside the slot."""
+        if is_overload_error(error):
+            self.overloaded = True
+
+    def deadline(self, size):
+        """Loop time by which a transfer of size bytes must have finished."""
+        return self.limiter._now() + scaled_timeout(size)
+
+
+async def read_chunks(response, chunk_size, slot, size=None):
+    """
+    Yield the body of response in chunks, reporting bytes to slot.
+
+    The whole body must arrive within scaled_timeout of its size (Content-Length, or size when
+    given); past that asyncio.TimeoutError is raised. Without a known size only the session's
+    read timeout applies.
+    """
+    size = size or response.content_length
+    deadline = slot.deadline(size) if size else None
+    loop = asyncio.get_running_loop()
+    # time spent waiting on the network, as opposed to the consumer of the chunks
+    waited = 0.0
+    received = 0
+    started = time.perf_counter()
+    async for chunk in response.content.iter_chunked(chunk_size):
+        waited += time.perf_counter() - started
+        received += len(chunk)
+        slot.received(len(chunk))
+        if deadline is not None and loop.time() > deadline:
+            raise asyncio.TimeoutError(f"Transfer of {size} bytes exceeded {scaled_timeout(size):.0f}s")
+        yield chunk
+        started = time.perf_counter()
+    metrics.record_time('network.read', waited)
+    metrics.observe('network.response_bytes', received)
@@ -1,6 +1,12 @@
 import zstandard as zstd
+import gzip
 import io
-import shutil
+import threading
+from .zstd_dictionaries import frame_dictionary
+from .instrumentation import metrics
+
+# suffixes of documents stored compressed inside batch tars
+COMPRESSION_SUFFIXES = {'.zst': 'zstd', '.gz': 'gzip'}
 
 def create_compressor(level=6):
     return zstd.ZstdCompressor(level=level)
@@ -15,21 +21,56 @@ def compress_content(content, compressor, encoding='utf-8'):
     return compressed
 
 def decompress_content(compressed_data):
-    dctx = zstd.ZstdDecompressor()
-    
     # Handle both single bytes object and list of chunks
     if isinstance(compressed_data, list):
-        input_buffer = io.BytesIO(b''.join(compressed_data))
-    else:
-        input_buffer = io.BytesIO(compressed_data)
-    
-    decompressed_content = io.BytesIO()
-    
-    try:
-        with dctx.stream_reader(input_buffer) as reader:
-            shutil.copyfileobj(reader, decompressed_content)
-        
-        return decompressed_content.getvalue()
-    finally:
-        input_buffer.close()
-        decompressed_content.close()
\ No newline at end of file
+        compressed_data = b''.join(compressed_data)
+    return decompress_zstd(compressed_data)
+
+_thread_state = threading.local()
+
+def _thread_decompressor(dictionary):
+    """This thread's reusable ZstdDecompressor for dictionary (or none), so contexts aren't rebuilt per document."""
+    decompressors = getattr(_thread_state, 'decompressors', None)
+    if decompressors is None:
+        decompressors = _thread_state.decompressors = {}
+    dict_id = dictionary.dict_id() if dictionary is not None else 0
+    dctx = decompressors.get(dict_id)
+    if dctx is None:
+        dctx = decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=dictionary)
+    return dctx
+
+@metrics.timed('zstd.decompress')
+def decompress_zstd(content):
+    """
+    Decompress a zstd frame (bytes or memoryview) to bytes.
+
+    When the frame header records the content size, which it does for everything compressed
+    in one call, the output is allocated once at exactly that size. Otherwise the frame is
+    streamed and chunks are joined once at the end.
+    """
+    dctx = _thread_decompressor(frame_dictionary(content))
+    if zstd.frame_content_size(content) >= 0:
+        return dctx.decompress(content)
+    with dctx.stream_reader(content, read_across_frames=True) as reader:
+        return reader.read()
+
+def split_compression_suffix(filename):
+    """Return (filename without .zst/.gz, compression or None) for a stored document name."""
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)], compression
+    return filename, None
+
+def open_decompressed(content, compression):
+    """Readable binary stream that decompresses content (bytes or memoryview) as it is read."""
+    if compression == 'zstd':
+        return zstd.ZstdDecompressor(dict_data=frame_dictionary(content)).stream_reader(content, read_across_frames=True)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=io.BytesIO(content))
+    raise ValueError(f"Unsupported compression: {compression}")
+
+def decompress_document(content, compression):
+    if compression == 'zstd':
+        return decompress_zstd(content)
+    with open_decompressed(content, compression) as reader:
+        return reader.read()
@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+ERROR_JOURNAL_FILENAME = 'errors.jsonl'
+
+
+class ErrorJournal:
+    """
+    Append-only log of failed downloads, one JSON object per line, in an output directory.
+
+    Recording a failure appends a single line, so it costs the same however many failures came
+    before it. Entries carry what is needed to re-drive the download (url, accession, filters)
+    alongside the error, and later entries for the same file add to earlier ones.
+    """
+
+    def __init__(self, output_dir, filename=ERROR_JOURNAL_FILENAME):
+        self.path = Path(output_dir) / filename
+        self._lock = Lock()
+
+    def record(self, filename, error, **fields):
+        entry = {'filename': filename, 'error': str(error), 'time': time.time()}
+        entry.update(fields)
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                logger.error(f"Failed to log error to {self.path}: {str(e)}")
+
+    def size(self):
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def entries(self, start=0):
+        """Entries from byte offset start on. A line torn by a crash mid-write is skipped."""
+        if not self.path.exists():
+            return []
+        entries = []
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries
+
+    def failed(self):
+        """{filename: merged entry} for every file with a recorded failure."""
+        failed = {}
+        for entry in self.entries():
+            failed.setdefault(entry['filename'], {}).update(entry)
+        return failed
+
+    def discard_before(self, offset):
+        """Drop entries written before byte offset, e.g. once a retry has re-recorded whatever still fails."""
+        with self._lock:
+            if not self.path.exists():
+                return
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                remaining = f.read()
+            if not remaining:
+                self.path.unlink()
+                return
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(remaining)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# histogram bucket upper bounds, in seconds for timers and bytes for sizes
+DURATION_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+SIZE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024**2, 16 * 1024**2, 256 * 1024**2, 1024**3)
+
+
+class Histogram:
+    """Count, sum, min, max and bucket counts of observed values."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+
+    def merge(self, other):
+        """Add another histogram's observations (with the same buckets) to this one."""
+        self.count += other.count
+        self.sum += other.sum
+        for i, bucket_count in enumerate(other.bucket_counts):
+            self.bucket_counts[i] += bucket_count
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (at most max)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.bucket_counts)),
+        }
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _TimedLock:
+    __slots__ = ('metrics', 'lock', 'name')
+
+    def __init__(self, metrics, lock, name):
+        self.metrics = metrics
+        self.lock = lock
+        self.name = name
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.metrics.record_time(self.name, time.perf_counter() - start)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.lock.release()
+        return False
+
+
+class Metrics:
+    """
+    Named timers, counters and histograms for finding where a run spends its time.
+
+    Off by default; turn on with metrics.enable() or the DATAMULE_METRICS environment
+    variable. While off, timer() returns a shared no-op and the other calls return after
+    checking one attribute, so instrumented code costs next to nothing.
+
+    Values are per process. Workers of Portfolio's process pool are enabled along with the
+    parent and hand what they record back with each result (see drain and merge).
+    """
+
+    def __init__(self):
+        self.enabled = bool(os.getenv('DATAMULE_METRICS'))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def timer(self, name):
+        """Context manager recording the time spent inside it under name."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decorator recording each call's duration under name; works on coroutine functions too."""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    with _Timer(self, name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def locked(self, lock, name):
+        """lock as a context manager, recording the time spent waiting to acquire it under name."""
+        if not self.enabled:
+            return lock
+        return _TimedLock(self, lock, name)
+
+    def record_time(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = Histogram(DURATION_BUCKETS)
+            timer.observe(seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=SIZE_BUCKETS):
+        """Add value to the histogram name (bucketed by buckets, sizes in bytes by default)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def drain(self):
+        """Take everything recorded so far and start over, in the form merge() accepts."""
+        with self._lock:
+            taken = (self.counters, self.timers, self.histograms)
+            self.counters, self.timers, self.histograms = {}, {}, {}
+        return taken
+
+    def merge(self, taken):
+        """Add values drained from another registry, e.g. a worker process's."""
+        counters, timers, histograms = taken
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for target, source in ((self.timers, timers), (self.histograms, histograms)):
+                for name, histogram in source.items():
+                    if name in target:
+                        target[name].merge(histogram)
+                    else:
+                        target[name] = histogram
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'elapsed_seconds': time.time() - self.started,
+                'counters': dict(self.counters),
+                'timers': {name: timer.as_dict() for name, timer in self.timers.items()},
+                'histograms': {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def to_json(self, path=None):
+        """Snapshot as a JSON string, also written to path if given."""
+        text = json.dumps(self.snapshot(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, prefix='datamule_'):
+        """Snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = _prometheus_name(prefix + name) + '_total'
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for suffix, histograms in (('_seconds', snapshot['timers']), ('', snapshot['histograms'])):
+            for name, histogram in sorted(histograms.items()):
+                metric = _prometheus_name(prefix + name) + suffix
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, bucket_count in histogram['buckets'].items():
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [f"{metric}_sum {histogram['sum']}", f"{metric}_count {histogram['count']}"]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Plain text table: timers by total time, then histograms and counters."""
+        snapshot = self.snapshot()
+        lines = [f"Metrics over {snapshot['elapsed_seconds']:.1f}s"]
+
+        timers = sorted(snapshot['timers'].items(), key=lambda item: item[1]['sum'], reverse=True)
+        if timers:
+            width = max(len(name) for name, _ in timers)
+            lines.append(f"{'timer':<{width}}  {'count':>8}  {'total s':>9}  {'mean ms':>9}  {'p50 ms':>9}  {'p95 ms':>9}  {'max ms':>9}")
+            for name, timer in timers:
+                lines.append(
+                    f"{name:<{width}}  {timer['count']:>8}  {timer['sum']:>9.3f}  {timer['mean'] * 1e3:>9.2f}  "
+                    f"{timer['p50'] * 1e3:>9.2f}  {timer['p95'] * 1e3:>9.2f}  {timer['max'] * 1e3:>9.2f}"
+                )
+
+        histograms = sorted(snapshot['histograms'].items())
+        if histograms:
+            width = max(len(name) for name, _ in histograms)
+            lines.append(f"{'histogram':<{width}}  {'count':>8}  {'sum':>12}  {'mean':>12}  {'p50':>12}  {'p95':>12}  {'max':>12}")
+            for name, histogram in histograms:
+                lines.append(
+                    f"{name:<{width}}  {histogram['count']:>8}  {histogram['sum']:>12.0f}  {histogram['mean']:>12.0f}  "
+                    f"{histogram['p50']:>12.0f}  {histogram['p95']:>12.0f}  {histogram['max']:>12.0f}"
+                )
+
+        counters = sorted(snapshot['counters'].items())
+        if counters:
+            width = max(len(name) for name, _ in counters)
+            lines.append(f"{'counter':<{width}}  {'value':>12}")
+            lines += [f"{name:<{width}}  {value:>12}" for name, value in counters]
+        return '\n'.join(lines)
+
+
+def _prometheus_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+# process-wide instance the package records into
+metrics = Metrics()
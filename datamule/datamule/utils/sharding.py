@@ -0,0 +1,62 @@
+import glob
+import hashlib
+import os
+from threading import Lock
+
+
+def shard_order(key, num_shards):
+    """
+    Shards in preference order for key, using rendezvous hashing.
+
+    The order depends only on key and num_shards (unlike hash(), which is salted per process),
+    so the first entry is the key's home shard in every run and on every machine.
+    """
+    key = str(key).encode('utf-8')
+
+    def weight(shard):
+        digest = hashlib.blake2b(key + b'/' + str(shard).encode(), digest_size=8).digest()
+        return -int.from_bytes(digest, 'big'), shard
+
+    return sorted(range(num_shards), key=weight)
+
+
+def batch_shard_sizes(directory, num_shards):
+    """Bytes already on disk per shard, summed over each shard's batch_{shard:03d}_*.tar files."""
+    return [
+        sum(os.path.getsize(path) for path in glob.glob(os.path.join(glob.escape(str(directory)), f'batch_{shard:03d}_*.tar')))
+        for shard in range(num_shards)
+    ]
+
+
+class ShardBalancer:
+    """
+    Assigns keys to shards with bounded loads.
+
+    Each key goes to the first shard in its shard_order whose load in bytes is within
+    (1 + slack) of the mean plus headroom bytes. Normally that is the home shard, and a key
+    can be found by checking its shard_order in turn. When a few very large submissions land
+    on the same shard, later keys spill to their next choice instead of growing that shard
+    without bound.
+
+    Placement is only reproducible for the same num_shards and when nothing spills: which key
+    spills depends on the loads seen so far, and so on assignment order. Pass loads (e.g. from
+    batch_shard_sizes) to balance against what earlier runs already wrote.
+    """
+
+    def __init__(self, num_shards, slack=0.25, headroom=64*1024*1024, loads=None):
+        self.num_shards = num_shards
+        self.slack = slack
+        self.headroom = headroom
+        self.loads = list(loads) if loads is not None else [0] * num_shards
+        self._total = sum(self.loads)
+        self._lock = Lock()
+
+    def assign(self, key, size):
+        with self._lock:
+            limit = (1 + self.slack) * self._total / self.num_shards + self.headroom
+            order = shard_order(key, self.num_shards)
+            # the least loaded shard is always at or below the mean, so this always finds one
+            shard = next(shard for shard in order if self.loads[shard] <= limit)
+            self.loads[shard] += size
+            self._total += size
+            return shard
@@ -0,0 +1,112 @@
+import json
+import os
+from pathlib import Path
+from threading import Lock
+import zstandard as zstd
+
+DICTIONARY_DIRNAME = '.zstd_dictionaries'
+DEFAULT_DICTIONARY_SIZE = 112640  # zstd's default, 110KB
+
+# every loaded dictionary, by the id zstd writes into each frame compressed with it,
+# so decompression can find the right dictionary from the frame alone
+_dictionaries_by_id = {}
+_registry_lock = Lock()
+
+
+def register_dictionary(dictionary):
+    with _registry_lock:
+        _dictionaries_by_id[dictionary.dict_id()] = dictionary
+
+
+def get_dictionary(dict_id):
+    return _dictionaries_by_id.get(dict_id)
+
+
+def frame_dictionary(content):
+    """Dictionary a zstd frame was compressed with, None if it used none. Raises if it is not loaded."""
+    dict_id = zstd.get_frame_parameters(content).dict_id
+    if not dict_id:
+        return None
+    dictionary = get_dictionary(dict_id)
+    if dictionary is None:
+        raise ValueError(f"Content was compressed with zstd dictionary {dict_id}, which is not loaded")
+    return dictionary
+
+
+def train_dictionaries(samples_by_type, dict_size=DEFAULT_DICTIONARY_SIZE, level=3, min_samples=10):
+    """Train one zstd dictionary per document type from {type: [sample bytes]}. Types with too few samples are skipped."""
+    dictionaries = {}
+    for doc_type, samples in samples_by_type.items():
+        if len(samples) < min_samples:
+            continue
+        try:
+            dictionaries[doc_type] = zstd.train_dictionary(dict_size, samples, level=level)
+        except zstd.ZstdError:
+            # not enough distinct content to train on
+            continue
+    return dictionaries
+
+
+class DictionaryStore:
+    """
+    Per-document-type zstd dictionaries kept in a directory next to the batch tars.
+
+    Each dictionary is saved as {dict_id}.zdict, with manifest.json mapping document types to
+    the dictionary currently used for new compression. Older dictionaries are never deleted,
+    since documents already compressed with them still need them to decompress.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.by_type = {}
+        self._load()
+
+    def _manifest_path(self):
+        return self.path / 'manifest.json'
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        for dictionary_path in self.path.glob('*.zdict'):
+            register_dictionary(zstd.ZstdCompressionDict(dictionary_path.read_bytes()))
+
+        manifest_path = self._manifest_path()
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+            for doc_type, dict_id in manifest.items():
+                dictionary = get_dictionary(dict_id)
+                if dictionary is not None:
+                    self.by_type[doc_type] = dictionary
+
+    def for_type(self, doc_type):
+        return self.by_type.get(doc_type)
+
+    def save(self, dictionaries):
+        """Add {type: ZstdCompressionDict}, replacing the current dictionary for those types."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        for doc_type, dictionary in dictionaries.items():
+            dictionary_path = self.path / f"{dictionary.dict_id()}.zdict"
+            if not dictionary_path.exists():
+                _write_atomic(dictionary_path, dictionary.as_bytes())
+            register_dictionary(dictionary)
+            self.by_type[doc_type] = dictionary
+
+        manifest = {doc_type: dictionary.dict_id() for doc_type, dictionary in self.by_type.items()}
+        _write_atomic(self._manifest_path(), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+
+def _write_atomic(path, data):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_portfolio_dictionaries(portfolio_path):
+    """Load and register the dictionaries stored with a portfolio, if it has any."""
+    dictionary_path = Path(portfolio_path) / DICTIONARY_DIRNAME
+    if dictionary_path.exists():
+        return DictionaryStore(dictionary_path)
+    return None
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+import tarfile
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+
+# the download tests run against the benchmark's synthetic archive server
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'benchmarks'))
+from download_benchmark import BenchmarkServer, FILING_DATE, build_fixtures  # noqa: E402
+
+from datamule.datamule.tar_downloader import TarDownloader  # noqa: E402
+
+SUBMISSIONS = 6
+DOCUMENTS = 8
+
+
+class ArchiveServer(BenchmarkServer):
+    """
+    BenchmarkServer that can misbehave for chosen submissions.
+
+    failures maps an accession to the number of 503s to answer before serving it (None for
+    always), and ignore_range makes every GET answer with the whole file.
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.error_rate = 0.0
+        self.failures = {}
+        self.ignore_range = False
+        self.requested = Counter()
+
+    async def _get(self, request):
+        accession = os.path.basename(request.match_info['path']).split('.')[0]
+        self.requested[accession] += 1
+        if accession in self.failures:
+            remaining = self.failures[accession]
+            if remaining is None or remaining > 0:
+                if remaining is not None:
+                    self.failures[accession] = remaining - 1
+                return web.Response(status=503)
+        if self.ignore_range:
+            path = os.path.join(self.root, request.match_info['path'])
+            if os.path.isfile(path):
+                self.stats['requests'] += 1
+                with open(path, 'rb') as f:
+                    return web.Response(body=f.read())
+        return await super()._get(request)
+
+
+@pytest.fixture(scope='session')
+def archive(tmp_path_factory):
+    root = tmp_path_factory.mktemp('archive')
+    accessions = build_fixtures(str(root), SUBMISSIONS, DOCUMENTS, document_size=20000)
+    server = ArchiveServer(str(root))
+    base_url = server.start()
+    return server, base_url, accessions
+
+
+@pytest.fixture
+def archive_server(archive):
+    server, _, _ = archive
+    server.reset()
+    yield archive
+    server.reset()
+
+
+def tar_specs(base_url, accessions):
+    return [
+        {'url': f"{base_url}tar/{FILING_DATE}/{accession}.tar", 'accession': accession, 'wanted_filenames': None}
+        for accession in accessions
+    ]
+
+
+def download_tars(base_url, accessions, output_dir, keep_document_types=(), **settings):
+    """Run TarDownloader.process_batch against the archive server; returns the downloader."""
+    downloader = TarDownloader(api_key='test')
+    downloader.RETRY_BACKOFF = 0.01
+    for name, value in settings.items():
+        setattr(downloader, name, value)
+    asyncio.run(downloader.process_batch(
+        tar_specs(base_url, accessions), str(output_dir), keep_document_types=list(keep_document_types)
+    ))
+    return downloader
+
+
+def batch_members(directory):
+    """{member name: content} across every batch tar in directory."""
+    members = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.tar'):
+            with tarfile.open(os.path.join(directory, name)) as tar:
+                for member in tar:
+                    members[member.name] = tar.extractfile(member).read()
+    return members
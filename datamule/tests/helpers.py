@@ -0,0 +1,31 @@
+import json
+
+from datamule.datamule.tar_downloader import TarDownloader
+
+
+def submission_metadata(accession, submission_type='10-K'):
+    return {
+        'accession-number': accession,
+        'type': submission_type,
+        'filing-date': '20240102',
+        'filer': {'company-data': {'cik': '320193'}},
+        'documents': [
+            {'type': submission_type, 'sequence': '1', 'filename': 'main.htm'},
+            {'type': 'EX-21', 'sequence': '2', 'filename': 'ex21.htm'},
+        ],
+    }
+
+
+def write_batch(directory, accessions, num_tar_files=1, max_batch_size=1024*1024*1024, submission_type='10-K'):
+    """Write two-document submissions into batch tars under directory, as a download would."""
+    manager = TarDownloader.TarManager(str(directory), num_tar_files, max_batch_size)
+    try:
+        for accession in accessions:
+            documents = [
+                {'name': 'main.htm', 'content': f'<html>{accession}</html>'.encode()},
+                {'name': 'ex21.htm', 'content': b'subsidiaries'},
+            ]
+            metadata = json.dumps(submission_metadata(accession, submission_type)).encode()
+            assert manager.write_submission(accession, metadata, documents)
+    finally:
+        manager.close_all()
@@ -0,0 +1,98 @@
+import asyncio
+
+from datamule.utils.adaptive_concurrency import AdaptiveConcurrency
+
+from .conftest import DOCUMENTS, batch_members, download_tars
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _request(limiter, status=200, latency=None):
+    async with limiter.slot() as slot:
+        if latency is not None:
+            # report the time to first byte directly instead of sleeping for it
+            limiter._record_latency(latency)
+            slot._responded = True
+        slot.response(status)
+
+
+def test_overload_halves_the_limit_once():
+    async def scenario():
+        limiter = AdaptiveConcurrency(40)
+        slots = [limiter.slot() for _ in range(3)]
+        for slot in slots:
+            await slot.__aenter__()
+        # three requests that were all in flight when the server pushed back count as one overload
+        for slot in slots:
+            slot.response(503)
+            await slot.__aexit__(None, None, None)
+        return limiter
+
+    limiter = run(scenario())
+    assert limiter.limit == 20
+    assert not limiter.slow_start
+
+
+def test_limit_never_drops_below_minimum():
+    async def scenario():
+        limiter = AdaptiveConcurrency(8, minimum=4)
+        for _ in range(5):
+            await _request(limiter, status=429)
+        return limiter
+
+    assert run(scenario()).limit == 4
+
+
+def test_slow_start_grows_only_while_the_limit_is_used():
+    async def scenario():
+        limiter = AdaptiveConcurrency(2)
+        await _request(limiter)
+        grown = limiter.limit
+
+        limiter = AdaptiveConcurrency(10)
+        await _request(limiter)
+        return grown, limiter.limit
+
+    grown, idle = run(scenario())
+    assert grown == 3
+    # one request in flight out of ten is not what holds downloads back
+    assert idle == 10
+
+
+def test_latency_jitter_on_a_fast_link_does_not_cut():
+    async def scenario():
+        limiter = AdaptiveConcurrency(10)
+        await _request(limiter, latency=0.001)
+        for _ in range(50):
+            # ten times the baseline, but only 9ms slower
+            await _request(limiter, latency=0.010)
+        return limiter
+
+    assert run(scenario()).limit >= 10
+
+
+def test_sustained_latency_inflation_trims_the_limit():
+    async def scenario():
+        limiter = AdaptiveConcurrency(10, latency_samples=5)
+        await _request(limiter, latency=0.05)
+        limits = []
+        for _ in range(5):
+            await _request(limiter, latency=1.0)
+            limits.append(limiter.limit)
+        return limits
+
+    limits = run(scenario())
+    assert limits[:4] == [limits[0]] * 4
+    assert limits[4] == limits[0] * 0.9
+
+
+def test_download_completes_through_injected_overload(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    server.failures = {accession: 2 for accession in accessions}
+    download_tars(base_url, accessions, tmp_path, MIN_CONCURRENT_DOWNLOADS=1)
+
+    assert all(server.requested[accession] == 3 for accession in accessions)
+    assert len(batch_members(tmp_path)) == len(accessions) * (DOCUMENTS + 1)
+    assert not (tmp_path / 'errors.jsonl').exists()
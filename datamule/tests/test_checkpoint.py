@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from datamule import Portfolio
+from datamule.portfolio.checkpoint import ProcessingJournal
+
+from .helpers import write_batch
+
+ACCESSIONS = [f'0000320193240000{i:02d}' for i in range(8)]
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, result):
+        self.rows.append(result)
+
+
+class Crash(BaseException):
+    """Stands in for the process dying mid-job."""
+
+
+@pytest.fixture
+def portfolio(tmp_path):
+    write_batch(tmp_path, ACCESSIONS)
+    return Portfolio(tmp_path)
+
+
+def _accession(submission):
+    return submission.accession
+
+
+def _content_size(document):
+    return len(document.content)
+
+
+def test_resume_after_crash(portfolio):
+    seen = []
+
+    def crash_after_three(submission):
+        if len(seen) == 3:
+            raise Crash()
+        seen.append(submission.accession)
+        return submission.accession
+
+    with pytest.raises(Crash):
+        portfolio.process_checkpointed(crash_after_three, 'job', checkpoint_every=1)
+
+    journal = ProcessingJournal(portfolio.path / '.jobs' / 'job.jsonl')
+    done = set(journal.completed)
+    journal.close()
+    assert done and done <= set(seen)
+
+    sink = ListSink()
+    processed = portfolio.process_checkpointed(_accession, 'job', sink=sink)
+
+    assert processed == len(ACCESSIONS) - len(done)
+    assert sorted(sink.rows + list(done)) == ACCESSIONS
+    # nothing left to do
+    assert portfolio.process_checkpointed(_accession, 'job') == 0
+
+
+def test_truncated_last_line_is_ignored(portfolio):
+    assert portfolio.process_checkpointed(_content_size, 'docs', documents=True, store_results=True) == 2 * len(ACCESSIONS)
+
+    path = portfolio.path / '.jobs' / 'docs.jsonl'
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "trunc')
+
+    journal = ProcessingJournal(path)
+    assert len(journal.completed) == 2 * len(ACCESSIONS)
+    journal.record('extra', 1, store_result=True)
+    journal.checkpoint()
+    journal.close()
+
+    # the partial line was terminated, so the new record is on a line of its own
+    last_line = path.read_text(encoding='utf-8').splitlines()[-1]
+    assert json.loads(last_line)['key'] == 'extra'
+
+    journal = ProcessingJournal(path)
+    assert 'extra' in journal.completed
+    assert len(list(journal.iter_results())) == 2 * len(ACCESSIONS) + 1
+    journal.close()
+
+
+def test_failures_are_recorded_and_retried(portfolio):
+    failing = set(ACCESSIONS[:2])
+
+    def flaky(submission):
+        if submission.accession in failing:
+            raise ValueError('boom')
+        return submission.accession
+
+    assert portfolio.process_checkpointed(flaky, 'job') == len(ACCESSIONS) - 2
+    failures = portfolio.checkpoint_failures('job')
+    assert sorted(failures) == sorted(failing)
+    assert all(entry['exception'] == 'ValueError' for entry in failures.values())
+
+    failing.clear()
+    assert portfolio.process_checkpointed(flaky, 'job') == 2
+    assert portfolio.checkpoint_failures('job') == {}
+
+
+def test_process_executor_matches_threads(portfolio):
+    threaded = portfolio.process_checkpointed(_content_size, 'threads', documents=True, store_results=True)
+    processes = portfolio.process_checkpointed(_content_size, 'processes', documents=True, store_results=True, executor='process')
+    assert threaded == processes == 2 * len(ACCESSIONS)
+
+    results = {}
+    for job in ('threads', 'processes'):
+        journal = ProcessingJournal(portfolio.path / '.jobs' / f'{job}.jsonl')
+        results[job] = dict(journal.iter_results())
+        journal.close()
+    assert results['threads'] == results['processes']
@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+
+import pytest
+
+from datamule.datamule import archive_lookup
+from datamule.datamule.lookup_cache import LookupCache, shift_date
+
+FIRST_DAY = date(2023, 1, 1)
+ROWS = [(f'{i:018d}', (FIRST_DAY + timedelta(days=i)).isoformat()) for i in range(60)]
+
+
+def day(n):
+    return (FIRST_DAY + timedelta(days=n)).isoformat()
+
+
+class FakeLookupApi:
+    """Stands in for _request_page, serving ROWS filtered by filing date."""
+
+    def __init__(self):
+        self.calls = []
+        self.dated = True
+
+    def __call__(self, endpoint, params, key, session):
+        start, end = params['filingDate_START'], params['filingDate_END']
+        self.calls.append((start, end))
+        rows = [row for row in ROWS if start <= row[1] <= end]
+        data = {'accession': [row[0] for row in rows]}
+        if self.dated:
+            data['filingDate'] = [row[1] for row in rows]
+        return {'success': True, 'data': data, 'metadata': {'pagination': {'hasMore': False}}}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = FakeLookupApi()
+    monkeypatch.setattr(archive_lookup, '_request_page', api)
+    return api
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    cache = LookupCache(3600, str(tmp_path))
+    monkeypatch.setattr(archive_lookup, 'get_lookup_cache', lambda: cache)
+    return cache
+
+
+def lookup(api, start, end, **filters):
+    """(accessions, date ranges fetched, rows served from the cache) for a lookup of days start..end."""
+    calls = len(api.calls)
+    records, summary = archive_lookup.lookup_archive_sgml(
+        api_key='test', filing_date=(day(start), day(end)), quiet=True, include_metadata=True, **filters
+    )
+    assert sorted(records.column('accession')) == [row[0] for row in ROWS[start:end + 1]]
+    return sorted(records.column('accession')), api.calls[calls:], summary.get('cached_rows', 0)
+
+
+def test_range_lookups_share_a_cache_key(cache):
+    a = cache.key('sgml-lookup', {'cik': '1', 'filingDate_START': day(0), 'filingDate_END': day(5)},
+                  exclude=('filingDate_START', 'filingDate_END'))
+    b = cache.key('sgml-lookup', {'cik': '1', 'filingDate_START': day(3), 'filingDate_END': day(9)},
+                  exclude=('filingDate_START', 'filingDate_END'))
+    c = cache.key('sgml-lookup', {'cik': '2', 'filingDate_START': day(0), 'filingDate_END': day(5)},
+                  exclude=('filingDate_START', 'filingDate_END'))
+    assert a == b != c
+
+
+def test_repeat_and_narrower_lookups_are_served_from_cache(api, cache):
+    _, fetched, cached = lookup(api, 10, 40)
+    assert fetched == [(day(10), day(40))]
+    assert cached == 0
+
+    _, fetched, cached = lookup(api, 10, 40)
+    assert fetched == []
+    assert cached == 31
+
+    _, fetched, cached = lookup(api, 20, 30)
+    assert fetched == []
+    assert cached == 11
+
+
+def test_sliding_window_fetches_only_new_dates(api, cache):
+    lookup(api, 10, 40)
+
+    _, fetched, cached = lookup(api, 12, 45)
+    assert fetched == [(day(41), day(45))]
+    assert cached == 29
+
+    _, fetched, _ = lookup(api, 5, 30)
+    assert fetched == [(day(5), day(9))]
+
+    # the entry now covers days 5..45
+    _, fetched, _ = lookup(api, 0, 50)
+    assert fetched == [(day(0), day(4)), (day(46), day(50))]
+
+
+def test_disjoint_range_is_fetched_in_full(api, cache):
+    lookup(api, 0, 10)
+    _, fetched, cached = lookup(api, 30, 40)
+    assert fetched == [(day(30), day(40))]
+    assert cached == 0
+
+
+def test_filters_are_cached_separately(api, cache):
+    lookup(api, 0, 10, submission_type='10-K')
+    _, fetched, _ = lookup(api, 0, 10, submission_type='8-K')
+    assert fetched == [(day(0), day(10))]
+
+
+def test_stale_entry_refetches_from_its_watermark(api, cache):
+    lookup(api, 0, 20)
+    cache.ttl = 0
+
+    # the range ended long ago, so only its last day may still have been missing filings
+    _, fetched, cached = lookup(api, 0, 20)
+    assert fetched == [(day(20), day(20))]
+    assert cached == 20
+
+
+def test_undated_results_are_only_reused_for_the_same_range(api, cache):
+    api.dated = False
+
+    def lookup_undated(start, end):
+        return archive_lookup.lookup_archive_sgml(api_key='test', filing_date=(day(start), day(end)), quiet=True)
+
+    lookup_undated(10, 20)
+    calls = len(api.calls)
+    lookup_undated(10, 20)
+    assert len(api.calls) == calls
+
+    records = lookup_undated(11, 20)
+    assert api.calls[calls:] == [(day(11), day(20))]
+    assert sorted(records.column('accession')) == [row[0] for row in ROWS[11:21]]
+
+
+def test_covered_dates(cache):
+    entry = {'start': '20230110', 'end': '20230120', 'watermark': '20230120', 'fetched_at': 0}
+    cache.ttl = float('inf')
+
+    assert archive_lookup._covered_dates(cache, entry, '20230101', '20230131') == ('20230110', '20230120')
+    # touching ranges are extended rather than stored separately
+    assert archive_lookup._covered_dates(cache, entry, '20230121', '20230125') == ('20230110', '20230120')
+    assert archive_lookup._covered_dates(cache, entry, '20230122', '20230125') is None
+    assert archive_lookup._covered_dates(cache, None, '20230101', '20230131') is None
+
+    cache.ttl = 0
+    assert archive_lookup._covered_dates(cache, entry, '20230101', '20230131') == ('20230110', shift_date('20230120', -1))
@@ -0,0 +1,62 @@
+import asyncio
+import os
+
+import pytest
+
+from datamule.datamule import archive_lookup
+from datamule.datamule.tar_downloader import TarDownloader
+
+from .conftest import DOCUMENTS, batch_members, tar_specs
+
+
+class PagedLookupApi:
+    """Serves one accession per page; total can change between pages, as when filings arrive mid-lookup."""
+
+    def __init__(self, total, grow_to=None):
+        self.total = total
+        self.grow_to = grow_to
+        self.pages = []
+
+    def __call__(self, endpoint, params, key, session):
+        page = params['page']
+        self.pages.append(page)
+        if self.grow_to is not None and page == 2:
+            self.total = self.grow_to
+        return {
+            'data': {'accession': [f'{page:018d}'], 'filingDate': ['2024-01-02']},
+            'metadata': {'pagination': {'totalPages': self.total, 'hasMore': page < self.total}},
+        }
+
+
+@pytest.mark.parametrize('total, grow_to, expected', [
+    (4, None, 4),
+    # the lookup grew after the first page announced its total
+    (2, 3, 3),
+])
+def test_pages_are_followed_while_has_more(monkeypatch, total, grow_to, expected):
+    api = PagedLookupApi(total, grow_to)
+    monkeypatch.setattr(archive_lookup, '_request_page', api)
+
+    payloads = list(archive_lookup._iter_payloads('sgml-lookup', {}, 'test', 1, False, 1))
+
+    assert [payload['data']['accession'][0] for payload in payloads] == [f'{page:018d}' for page in range(1, expected + 1)]
+    assert sorted(api.pages) == list(range(1, expected + 1))
+
+
+def test_streamed_specs_are_downloaded(archive_server, tmp_path):
+    _, base_url, accessions = archive_server
+    specs = tar_specs(base_url, accessions)
+    pages = iter([specs[:2], specs[2:4], specs[4:]])
+
+    downloader = TarDownloader(api_key='test')
+    asyncio.run(downloader.process_batch(pages, str(tmp_path)))
+
+    assert len(batch_members(tmp_path)) == len(accessions) * (DOCUMENTS + 1)
+
+
+def test_empty_streamed_lookup_leaves_no_tars(tmp_path):
+    downloader = TarDownloader(api_key='test')
+    downloader.MAX_TAR_WORKERS = 4
+    asyncio.run(downloader.process_batch(iter([]), str(tmp_path)))
+
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tar')]
@@ -0,0 +1,29 @@
+from datamule.document.parse_cache import ParseCache
+
+KEY = 'ab' * 32
+
+
+def test_int_keys_round_trip_without_touching_digit_strings(tmp_path):
+    cache = ParseCache(tmp_path)
+    data = {'2023': 'year', 1: {'title': 'Item 1', 2: [{'3': 'string key', 4: 'int key'}]}, 'after': 0, -1: 'negative'}
+    cache.put(KEY, data, [('2023', 'year'), ('1', {5: 'x'})])
+
+    entry = cache.get(KEY)
+    assert entry['data'] == data
+    # section order is kept
+    assert list(entry['data']) == list(data)
+    assert entry['data_tuples'] == [('2023', 'year'), ('1', {5: 'x'})]
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ParseCache(tmp_path)
+    cache.put(KEY, {'a': 1})
+    cache._entry_path(KEY).write_bytes(b'not zstd')
+    assert cache.get(KEY) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ParseCache(tmp_path, max_size=1)
+    cache.put(KEY, {'a': 'x' * 1000})
+    assert cache.get(KEY) is None
+    assert cache._scan_size() <= 1
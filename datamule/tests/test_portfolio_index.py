@@ -0,0 +1,80 @@
+import os
+
+from datamule import Portfolio
+from datamule.portfolio.portfolio_index import PortfolioIndex, INDEX_FILENAME
+
+from .helpers import write_batch
+
+
+def _accessions(path):
+    return sorted(submission.accession for submission in Portfolio(path))
+
+
+def _indexed(path):
+    with PortfolioIndex(path) as index:
+        return sorted(index.accessions())
+
+
+def test_writer_indexes_submissions(tmp_path):
+    accessions = [f'0000320193240000{i:02d}' for i in range(6)]
+    write_batch(tmp_path, accessions, num_tar_files=2, max_batch_size=2048)
+
+    assert _indexed(tmp_path) == accessions
+    assert _accessions(tmp_path) == accessions
+
+    submission = next(iter(Portfolio(tmp_path)))
+    assert [doc.content for doc in submission] == [f'<html>{submission.accession}</html>'.encode(), b'subsidiaries']
+
+
+def test_appended_tar_is_reindexed(tmp_path):
+    write_batch(tmp_path, ['000032019324000001'])
+    assert _accessions(tmp_path) == ['000032019324000001']
+
+    # a later download appends to the same shard
+    write_batch(tmp_path, ['000032019324000002'])
+    assert _accessions(tmp_path) == ['000032019324000001', '000032019324000002']
+
+
+def test_tar_changed_outside_the_writer_is_rescanned(tmp_path):
+    write_batch(tmp_path, ['000032019324000001'])
+    assert _accessions(tmp_path) == ['000032019324000001']
+
+    tar_path = tmp_path / 'batch_000_001.tar'
+    os.remove(tar_path)
+    # write a different submission under the same tar name, bypassing the index
+    os.rename(tmp_path / INDEX_FILENAME, tmp_path / 'index.bak')
+    write_batch(tmp_path, ['000032019324000009'])
+    os.replace(tmp_path / 'index.bak', tmp_path / INDEX_FILENAME)
+
+    assert _accessions(tmp_path) == ['000032019324000009']
+
+
+def test_deleted_tar_is_pruned(tmp_path):
+    write_batch(tmp_path, [f'0000320193240000{i:02d}' for i in range(4)], num_tar_files=2)
+    tars = sorted(name for name in os.listdir(tmp_path) if name.endswith('.tar'))
+    assert len(tars) == 2
+
+    with PortfolioIndex(tmp_path) as index:
+        expected = sorted(index.accessions(tar_names=[tars[1]]))
+
+    os.remove(tmp_path / tars[0])
+
+    assert _accessions(tmp_path) == expected
+    assert _indexed(tmp_path) == expected
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    accessions = [f'0000320193240000{i:02d}' for i in range(3)]
+    write_batch(tmp_path, accessions)
+    os.remove(tmp_path / INDEX_FILENAME)
+
+    assert _accessions(tmp_path) == accessions
+    assert _indexed(tmp_path) == accessions
+
+
+def test_select_filters_in_the_index(tmp_path):
+    write_batch(tmp_path, ['000032019324000000', '000032019324000002'])
+    write_batch(tmp_path, ['000032019324000001'], submission_type='8-K')
+
+    selection = Portfolio(tmp_path).select(submission_type='8-K')
+    assert [submission.accession for submission in selection] == ['000032019324000001']
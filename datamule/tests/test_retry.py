@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from datamule import Portfolio
+from datamule.datamule.downloader import Downloader
+from datamule.utils.error_journal import ErrorJournal
+
+from .conftest import DOCUMENTS, FILING_DATE, batch_members, download_tars
+
+
+def test_transient_errors_are_retried(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    server.failures = {accessions[0]: 2}
+    download_tars(base_url, accessions, tmp_path)
+
+    assert server.requested[accessions[0]] == 3
+    assert len(batch_members(tmp_path)) == len(accessions) * (DOCUMENTS + 1)
+    assert ErrorJournal(tmp_path).failed() == {}
+
+
+def test_persistent_failures_are_journaled(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    server.failures = {accessions[0]: None}
+    missing = '000032019324999999'
+    downloader = download_tars(base_url, accessions + [missing], tmp_path, MAX_RETRIES=2)
+
+    failed = ErrorJournal(tmp_path).failed()
+    assert sorted(failed) == sorted(f'{accession}.tar' for accession in (accessions[0], missing))
+
+    down = failed[f'{accessions[0]}.tar']
+    assert down['attempts'] == downloader.MAX_RETRIES + 1 == server.requested[accessions[0]]
+    assert down['source'] == 'datamule-tar'
+    assert down['url'].endswith(f'{FILING_DATE}/{accessions[0]}.tar')
+    assert '503' in down['error']
+    # a 404 won't succeed on a retry
+    assert failed[f'{missing}.tar']['attempts'] == 1 == server.requested[missing]
+
+    downloaded = {name.split('/')[0] for name in batch_members(tmp_path)}
+    assert downloaded == set(accessions[1:])
+
+
+def test_retry_failed_redownloads_and_clears_the_journal(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    server.failures = {accessions[0]: None}
+    download_tars(base_url, accessions, tmp_path, keep_document_types=['10-K'], MAX_RETRIES=0)
+    assert list(ErrorJournal(tmp_path).failed()) == [f'{accessions[0]}.tar']
+
+    server.reset()
+    portfolio = Portfolio(tmp_path)
+    portfolio.api_key = 'test'
+    portfolio.retry_failed()
+
+    assert ErrorJournal(tmp_path).failed() == {}
+    submissions = {submission.accession: submission for submission in Portfolio(tmp_path)}
+    assert sorted(submissions) == sorted(accessions)
+    # the retry kept the original document type filter
+    assert [doc.type for doc in submissions[accessions[0]]] == ['10-K']
+    # only the failed submission was requested again
+    assert set(server.requested) == {accessions[0]}
+
+
+def test_retry_failed_keeps_what_still_fails(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    server.failures = {accessions[0]: None}
+    download_tars(base_url, accessions[:2], tmp_path, MAX_RETRIES=0)
+
+    portfolio = Portfolio(tmp_path)
+    portfolio.api_key = 'test'
+    portfolio.retry_failed()
+
+    failed = ErrorJournal(tmp_path).failed()
+    assert list(failed) == [f'{accessions[0]}.tar']
+    assert len(ErrorJournal(tmp_path).entries()) == 1
+
+
+def test_retry_failed_needs_an_api_key(archive_server, tmp_path, monkeypatch):
+    server, base_url, accessions = archive_server
+    server.failures = {accessions[0]: None}
+    download_tars(base_url, accessions[:1], tmp_path, MAX_RETRIES=0)
+    monkeypatch.delenv('DATAMULE_API_KEY', raising=False)
+
+    with pytest.raises(ValueError):
+        Portfolio(tmp_path).retry_failed()
+
+
+def test_sgml_failures_are_journaled_once_with_their_cause(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    server.failures = {accessions[0]: None}
+    downloader = Downloader(api_key='test')
+    downloader.RETRY_BACKOFF = 0.01
+    downloader.MAX_RETRIES = 1
+    urls = [f"{base_url}sgml/{FILING_DATE}/{accession}.sgml.zst" for accession in accessions[:2]]
+    asyncio.run(downloader.process_batch(urls, str(tmp_path)))
+
+    entries = ErrorJournal(tmp_path).entries()
+    assert len(entries) == 1
+    assert entries[0]['source'] == 'datamule-sgml'
+    assert entries[0]['accession'] == accessions[0]
+    assert '503' in entries[0]['error']
+    assert server.requested[accessions[0]] == 2
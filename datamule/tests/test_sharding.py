@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+
+from datamule.datamule.tar_downloader import TarDownloader
+from datamule.utils.sharding import ShardBalancer, batch_shard_sizes, shard_order
+
+from .helpers import write_batch
+
+ACCESSIONS = [f'0000320193240000{i:02d}' for i in range(40)]
+
+
+def test_shard_order_is_a_permutation():
+    for accession in ACCESSIONS:
+        assert sorted(shard_order(accession, 8)) == list(range(8))
+
+
+def test_shard_order_does_not_depend_on_hash_seed():
+    code = (
+        "from datamule.utils.sharding import shard_order; "
+        f"print([shard_order(key, 8) for key in {ACCESSIONS!r}])"
+    )
+    outputs = {
+        subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+            env={**os.environ, 'PYTHONHASHSEED': str(seed)}
+        ).stdout
+        for seed in (1, 2, 3)
+    }
+    assert len(outputs) == 1
+    assert outputs.pop().strip() == str([shard_order(key, 8) for key in ACCESSIONS])
+
+
+def test_balanced_keys_go_to_their_home_shard():
+    balancer = ShardBalancer(4, headroom=0, slack=10)
+    for accession in ACCESSIONS:
+        assert balancer.assign(accession, 100) == shard_order(accession, 4)[0]
+
+
+def test_same_assignments_in_every_run():
+    sizes = [10, 5000, 10, 10, 20000, 10] * 20
+    runs = []
+    for _ in range(2):
+        balancer = ShardBalancer(4, headroom=0)
+        runs.append([balancer.assign(f'acc{i}', size) for i, size in enumerate(sizes)])
+    assert runs[0] == runs[1]
+
+
+def test_large_keys_spill_instead_of_growing_one_shard():
+    balancer = ShardBalancer(8, headroom=0)
+    for i in range(2000):
+        balancer.assign(f'acc{i}', 5000 if i % 20 == 0 else 10)
+    mean = sum(balancer.loads) / 8
+    assert max(balancer.loads) <= 1.25 * mean + 5000
+
+
+def test_batch_shard_sizes_counts_existing_tars(tmp_path):
+    write_batch(tmp_path, ACCESSIONS[:10], num_tar_files=2)
+    loads = batch_shard_sizes(tmp_path, 2)
+    assert sum(loads) == sum(
+        os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path) if name.endswith('.tar')
+    )
+
+
+def test_keys_fill_the_lighter_shard_first():
+    balancer = ShardBalancer(2, headroom=0, loads=[10000, 0])
+    assignments = [balancer.assign(accession, 100) for accession in ACCESSIONS[:40]]
+    # shard 0 is far above the mean, so nothing goes there until shard 1 catches up
+    assert assignments[:20] == [1] * 20
+    assert balancer.loads[1] <= 10000 * 1.25
+
+
+def test_writer_continues_the_last_sequence(tmp_path):
+    write_batch(tmp_path, ACCESSIONS[:10], num_tar_files=2, max_batch_size=2048)
+    tars = sorted(name for name in os.listdir(tmp_path) if name.endswith('.tar'))
+    last = {}
+    for name in tars:
+        _, shard, sequence = name[:-4].split('_')
+        last[int(shard)] = max(last.get(int(shard), 0), int(sequence))
+
+    manager = TarDownloader.TarManager(str(tmp_path), 2, max_batch_size=2048)
+    try:
+        assert manager.tar_sequences == last
+        assert manager.tar_sizes == {
+            shard: os.path.getsize(tmp_path / f'batch_{shard:03d}_{sequence:03d}.tar') for shard, sequence in last.items()
+        }
+    finally:
+        manager.close_all()
+
+    # rolling over after a resume picks the next free sequence instead of overwriting
+    write_batch(tmp_path, ACCESSIONS[10:20], num_tar_files=2, max_batch_size=2048)
+    after = sorted(name for name in os.listdir(tmp_path) if name.endswith('.tar'))
+    assert set(tars) < set(after)
@@ -0,0 +1,99 @@
+import csv
+
+import pytest
+
+from datamule import CSVSink, ParquetSink, ArrowSink
+
+
+def _csv_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def _parts(directory, extension):
+    return sorted(path.name for path in directory.glob(f'part-*.{extension}'))
+
+
+def test_batches_and_max_rows_per_file(tmp_path):
+    with CSVSink(tmp_path, batch_size=3, max_rows_per_file=5) as sink:
+        for i in range(12):
+            sink.write([{'n': i}])
+
+    parts = _parts(tmp_path / 'results', 'csv')
+    assert parts == ['part-00000.csv', 'part-00001.csv', 'part-00002.csv']
+    rows = [row for part in parts for row in _csv_rows(tmp_path / 'results' / part)]
+    assert [int(row['n']) for row in rows] == list(range(12))
+
+
+def test_csv_rolls_over_on_new_columns(tmp_path):
+    with CSVSink(tmp_path, batch_size=1) as sink:
+        sink.write([{'a': 1}])
+        sink.write([{'a': 2}])
+        sink.write([{'a': 3, 'b': 'new'}])
+
+    assert _parts(tmp_path / 'results', 'csv') == ['part-00000.csv', 'part-00001.csv']
+    assert _csv_rows(tmp_path / 'results' / 'part-00000.csv') == [{'a': '1'}, {'a': '2'}]
+    assert _csv_rows(tmp_path / 'results' / 'part-00001.csv') == [{'a': '3', 'b': 'new'}]
+
+
+def test_datasets_are_written_separately(tmp_path):
+    with CSVSink(tmp_path) as sink:
+        sink.write({'income statement': [{'x': 1}], 'balance/sheet': [{'y': 2}]})
+
+    assert _parts(tmp_path / 'income_statement', 'csv') == ['part-00000.csv']
+    assert _parts(tmp_path / 'balance_sheet', 'csv') == ['part-00000.csv']
+
+
+def test_numbering_continues_on_resume(tmp_path):
+    with CSVSink(tmp_path) as sink:
+        sink.write([{'run': 1}])
+    with CSVSink(tmp_path) as sink:
+        sink.write([{'run': 2}])
+
+    assert _parts(tmp_path / 'results', 'csv') == ['part-00000.csv', 'part-00001.csv']
+    assert _csv_rows(tmp_path / 'results' / 'part-00000.csv') == [{'run': '1'}]
+
+
+def test_checkpoint_keeps_csv_shard_open(tmp_path):
+    sink = CSVSink(tmp_path)
+    sink.write([{'a': 1}])
+    sink.checkpoint()
+    assert _csv_rows(tmp_path / 'results' / 'part-00000.csv') == [{'a': '1'}]
+
+    sink.write([{'a': 2}])
+    sink.close()
+    assert _parts(tmp_path / 'results', 'csv') == ['part-00000.csv']
+    assert len(_csv_rows(tmp_path / 'results' / 'part-00000.csv')) == 2
+
+
+def test_parquet_rolls_over_on_type_change(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    with ParquetSink(tmp_path, batch_size=1) as sink:
+        sink.write([{'value': 1}])
+        sink.write([{'value': 'not a number'}])
+        sink.write([{'value': None, 'extra': 2.5}])
+
+    parts = _parts(tmp_path / 'results', 'parquet')
+    assert parts == ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet']
+    tables = [pq.read_table(tmp_path / 'results' / part) for part in parts]
+    assert [table.to_pylist() for table in tables] == [
+        [{'value': 1}],
+        [{'value': 'not a number'}],
+        [{'value': None, 'extra': 2.5}],
+    ]
+
+
+def test_arrow_checkpoint_starts_a_new_shard(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+
+    sink = ArrowSink(tmp_path)
+    sink.write([{'a': 1}])
+    sink.checkpoint()
+    sink.write([{'a': 2}])
+    sink.close()
+
+    parts = _parts(tmp_path / 'results', 'arrow')
+    assert parts == ['part-00000.arrow', 'part-00001.arrow']
+    rows = [row for part in parts for row in pa.ipc.open_file(str(tmp_path / 'results' / part)).read_all().to_pylist()]
+    assert rows == [{'a': 1}, {'a': 2}]
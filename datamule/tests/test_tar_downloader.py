@@ -0,0 +1,131 @@
+import asyncio
+import io
+import json
+import os
+import tarfile
+
+import zstandard as zstd
+
+from datamule.datamule.tar_downloader import TarDownloader, _StreamingSubmissionExtractor
+
+from .conftest import DOCUMENTS, batch_members, download_tars, tar_specs
+
+KEEP = ['10-K', 'EX-99']
+
+
+def _documents(members):
+    return {name: content for name, content in members.items() if not name.endswith('metadata.json')}
+
+
+def test_full_download(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    download_tars(base_url, accessions, tmp_path)
+
+    members = batch_members(tmp_path)
+    assert len(members) == len(accessions) * (DOCUMENTS + 1)
+    metadata = json.loads(members[f'{accessions[0]}/metadata.json'])
+    assert [doc['filename'] for doc in metadata['documents']] == [f'doc{i}.htm' for i in range(DOCUMENTS)]
+    assert members[f'{accessions[0]}/doc0.htm'].startswith(b'<html>')
+    assert server.stats['range_requests'] == 0
+
+
+def test_filtered_download_uses_merged_ranges(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    download_tars(base_url, accessions, tmp_path / 'full')
+    server.reset()
+    download_tars(base_url, accessions, tmp_path / 'ranged', keep_document_types=KEEP, PROBE_SIZE=2048)
+
+    full = batch_members(tmp_path / 'full')
+    ranged = batch_members(tmp_path / 'ranged')
+    assert set(_documents(ranged)) == {f'{accession}/{name}' for accession in accessions for name in ('doc0.htm', 'doc6.htm')}
+    for name, content in _documents(ranged).items():
+        assert content == full[name]
+
+    metadata = json.loads(ranged[f'{accessions[0]}/metadata.json'])
+    assert [doc['type'] for doc in metadata['documents']] == KEEP
+    # a probe plus at most one request per wanted document beyond it
+    assert len(accessions) < server.stats['range_requests'] <= len(accessions) * (1 + len(KEEP))
+    assert server.stats['bytes_served'] < sum(len(content) for content in full.values())
+
+
+def test_filtered_download_falls_back_when_range_is_ignored(archive_server, tmp_path):
+    server, base_url, accessions = archive_server
+    download_tars(base_url, accessions, tmp_path / 'ranged', keep_document_types=KEEP, PROBE_SIZE=2048)
+    server.reset()
+    server.ignore_range = True
+    download_tars(base_url, accessions, tmp_path / 'fallback', keep_document_types=KEEP, PROBE_SIZE=2048)
+
+    assert server.stats['range_requests'] == 0
+    assert batch_members(tmp_path / 'fallback') == batch_members(tmp_path / 'ranged')
+    assert not (tmp_path / 'fallback' / 'errors.jsonl').exists()
+
+
+def test_merge_ranges():
+    downloader = TarDownloader(api_key='test')
+    downloader.RANGE_MERGE_THRESHOLD = 1024
+    docs = [
+        {'name': 'c', 'start': 10240, 'end': 12000},
+        {'name': 'a', 'start': 1024, 'end': 2000},
+        {'name': 'b', 'start': 2560, 'end': 4000},
+    ]
+    ranges = downloader._merge_ranges(docs)
+
+    # a and b are 48 bytes apart once b's header is included, c is far enough away to get its own request
+    assert [(start, end, [doc['name'] for doc in group]) for start, end, group in ranges] == [
+        (512, 4000, ['a', 'b']),
+        (9728, 12000, ['c']),
+    ]
+
+
+def test_streamed_extraction_is_independent_of_chunking_and_spooling(archive_server, tmp_path):
+    _, base_url, accessions = archive_server
+    download_tars(base_url, accessions, tmp_path / 'default')
+    # tiny chunks split tar headers across feeds, and a tiny spool sends every submission to disk
+    download_tars(base_url, accessions, tmp_path / 'small', CHUNK_SIZE=777, SPOOL_SIZE=1024)
+
+    assert batch_members(tmp_path / 'small') == batch_members(tmp_path / 'default')
+
+
+def test_keep_compressed(archive_server, tmp_path):
+    _, base_url, accessions = archive_server
+    download_tars(base_url, accessions[:1], tmp_path / 'plain')
+    downloader = TarDownloader(api_key='test')
+    downloader.RETRY_BACKOFF = 0.01
+    asyncio.run(downloader.process_batch(
+        tar_specs(base_url, accessions[:1]), str(tmp_path / 'compressed'), keep_compressed=True
+    ))
+
+    plain = batch_members(tmp_path / 'plain')
+    compressed = batch_members(tmp_path / 'compressed')
+    metadata = json.loads(compressed[f'{accessions[0]}/metadata.json'])
+    assert all(doc['filename'].endswith('.zst') for doc in metadata['documents'])
+    for name, content in _documents(plain).items():
+        assert zstd.ZstdDecompressor().decompress(compressed[f'{name}.zst']) == content
+
+
+def test_streaming_extractor_spools_documents_into_one_file():
+    documents = {f'doc{i}.htm': os.urandom(3000 * (i + 1)) for i in range(3)}
+    metadata = {'documents': [{'type': '10-K', 'filename': name} for name in documents]}
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+        members = [('metadata.json', json.dumps(metadata).encode())]
+        members += [(f'{name}.zst', zstd.ZstdCompressor().compress(content)) for name, content in documents.items()]
+        for name, content in members:
+            info = tarfile.TarInfo(f'000032019324000001/{name}')
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    raw = buffer.getvalue()
+
+    extractor = _StreamingSubmissionExtractor(None, None, spool_size=1024)
+    try:
+        for offset in range(0, len(raw), 777):
+            extractor.feed(raw[offset:offset + 777])
+        _, extracted = extractor.finish(None)
+
+        assert [doc['name'] for doc in extracted] == list(documents)
+        assert len({id(doc['content']._spool) for doc in extracted}) == 1
+        for doc in extracted:
+            assert doc['size'] == len(documents[doc['name']])
+            assert doc['content'].read(100) + doc['content'].read() == documents[doc['name']]
+    finally:
+        extractor.close()